@@ -1,9 +1,17 @@
 from flask import Flask, request, jsonify
+from app.admission import init_admission
+from app.cli import init_app as init_cli
+from app.compression import init_compression
 from app.config import Config
 from app.extensions import db
-from app.models import Bank, BankSecret, generate_secret_code, get_current_timestamp
+from app.metrics import init_metrics
+from app.profiler import init_profiler
+from app.models import Bank, BankSecret, SECRETS_PER_BANK, generate_secret_code, get_current_timestamp
 from app.routes import init_app as init_routes
+from app.schema import ensure_schema
 from app.scheduler import start_secret_regeneration_scheduler
+from app.secret_derivation import derivation_key
+from app.storage import init_storage
 import logging
 
 # Configure root logger to output INFO-level messages with timestamp, severity, process ID, thread name, and message
@@ -22,11 +30,17 @@ def create_app():
 
     This function:
     - Initializes the Flask app with settings from Config.
-    - Sets up the SQLAlchemy database extension.
-    - Registers API routes.
-    - Creates database tables if they do not exist.
-    - Populates initial bank data if the banks table is empty.
-    - Starts a background scheduler to regenerate bank secrets periodically.
+    - Sets up the SQLAlchemy database extension with the configured storage profile.
+    - Registers API routes and CLI commands.
+    - Compresses large responses for clients accepting gzip.
+    - Records request and database metrics and installs admission control.
+    - Installs the on-demand request profiler.
+    - Creates database tables if they do not exist and adds columns introduced later,
+      unless the database already records the current schema version.
+    - Populates initial bank data if the schema was just created or upgraded and the
+      banks table is empty (unless SEED_ON_STARTUP is off; see `flask seed-banks`).
+    - Starts (or, with SCHEDULER_START_DELAY, schedules the start of) a background
+      scheduler to regenerate bank secrets periodically.
 
     Returns:
         app (Flask): The configured Flask application.
@@ -34,17 +48,34 @@ def create_app():
     app = Flask(__name__)
     # Load configuration from Config object
     app.config.from_object(Config)
+    # Refuse to start with derived bank secrets but no key of our own
+    if app.config["SECRET_ROTATION_MODE"] == "derived":
+        derivation_key(app.config)
 
-    # Initialize database extension (e.g., SQLAlchemy)
-    db.init_app(app)
+    # Initialize the database extension with the storage profile's engine options and pragmas
+    init_storage(app)
 
-    # Register API routes with the application
+    # Register API routes and CLI commands with the application
     init_routes(app)
+    init_cli(app)
+
+    # gzip large JSON responses
+    init_compression(app)
+
+    # Time every request, including those rejected by admission control
+    init_metrics(app)
+
+    # Reject excess requests before their views run
+    init_admission(app)
+
+    # Profile requests on demand (header, admin endpoint or slow-request capture)
+    init_profiler(app)
 
     # Create database tables and pre-populate data within the application context
     with app.app_context():
-        db.create_all()  # Create all tables defined by SQLAlchemy models
-        prepopulate_banks(app)  # Insert default banks and their secrets
+        # Create and upgrade tables unless the stored schema version is current
+        if ensure_schema() and app.config["SEED_ON_STARTUP"]:
+            prepopulate_banks(app)  # Insert default banks and their secrets
         start_secret_regeneration_scheduler(app)  # Launch scheduler for secret rotation
 
     return app
@@ -80,7 +111,7 @@ def prepopulate_banks(app):
                 db.session.flush()  # Ensure bank.bank_code is populated before creating secrets
 
                 # Generate six secret codes per bank
-                for _ in range(6):
+                for _ in range(SECRETS_PER_BANK):
                     secret_code = generate_secret_code()  # Create a random secret code
                     timestamp = get_current_timestamp()   # Get current timestamp for record
                     secret = BankSecret(
@@ -0,0 +1,248 @@
+"""
+Admission control module for the application.
+
+A single misbehaving terminal that loops on /api/verify_transaction or /api/all_secrets
+can occupy every worker thread and raise latency for all other clients. Every request
+therefore passes through an AdmissionController before its view runs, i.e. before any
+database work happens:
+
+- Token buckets per client (across all routes) and per client and route limit the
+  request rate of each client. A client whose bucket is empty receives 429 with a
+  Retry-After header telling it when the next token is available.
+- A global limit on the requests executing at once in this process sheds excess load
+  with 503 and Retry-After instead of letting requests queue behind busy threads.
+
+Admission control is off unless ADMISSION_ENABLED is set. Clients are identified by
+their remote address, or by a header set by a trusted proxy (ADMISSION_CLIENT_HEADER).
+Behind a proxy or NAT the remote address is shared by many clients, which would then
+share one bucket, so the header should be configured in such deployments.
+
+Routes are identified by their URL rule (e.g. "/api/profiles/<name>"), not by the
+requested path, so a client cannot obtain fresh buckets by varying a path parameter;
+requests matching no route share one bucket per client. Bucket tables are bounded LRU
+maps, so a flood of distinct client addresses cannot grow memory without bound; an
+evicted client simply starts again with a full bucket.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, jsonify, request
+
+
+class Rejection:
+    """
+    Outcome of a rejected admission: HTTP status, error message and seconds to wait.
+    """
+    __slots__ = ("status_code", "error", "retry_after")
+
+    def __init__(self, status_code, error, retry_after):
+        self.status_code = status_code
+        self.error = error
+        self.retry_after = retry_after
+
+    def retry_after_header(self):
+        # Retry-After only carries whole seconds
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBuckets:
+    """
+    Token buckets with the same rate and burst size, keyed by client or (client, route).
+
+    Not thread-safe on its own; AdmissionController serializes access.
+
+    Args:
+        rate (float): Tokens added per second; 0 disables the buckets.
+        burst (int): Bucket capacity, i.e. the requests a client may send at once.
+        maxsize (int): Maximum number of tracked keys (least recently used are evicted).
+    """
+
+    def __init__(self, rate, burst, maxsize):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    def available(self, key, now):
+        """
+        Refill the bucket of ``key`` and return its [tokens, updated_at] entry.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def wait_time(self, bucket):
+        """
+        Return the seconds until ``bucket`` holds a whole token again.
+        """
+        return (1.0 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def parse_route_limits(value):
+    """
+    Parse per-route overrides of the form "/api/rule=rate:burst,/api/other=rate:burst".
+
+    Returns a dict mapping the URL rule to a (rate, burst) tuple.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        path, _, limit = item.partition("=")
+        rate, _, burst = limit.partition(":")
+        rate = float(rate)
+        limits[path.strip()] = (rate, int(burst) if burst else max(1, int(rate)))
+    return limits
+
+
+class AdmissionController:
+    """
+    Decides whether a request may run, before any of its work is done.
+
+    Args:
+        client_rate (float): Requests per second per client across all routes (0 disables).
+        client_burst (int): Burst size of the per-client bucket.
+        route_rate (float): Requests per second per client and route (0 disables).
+        route_burst (int): Burst size of the per-route buckets.
+        route_limits (dict): URL rule -> (rate, burst) overriding route_rate/route_burst.
+        max_in_flight (int): Requests allowed to execute at once (0 disables the limit).
+        max_clients (int): Maximum number of clients tracked per bucket table.
+    """
+
+    def __init__(self, client_rate, client_burst, route_rate, route_burst, route_limits,
+                 max_in_flight, max_clients):
+        self.max_in_flight = max_in_flight
+        self.client_buckets = TokenBuckets(client_rate, client_burst, max_clients)
+        self.route_buckets = {
+            path: TokenBuckets(rate, burst, max_clients) for path, (rate, burst) in route_limits.items()
+        }
+        self.default_route_buckets = TokenBuckets(route_rate, route_burst, max_clients)
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def admit(self, client, route):
+        """
+        Admit a request of ``client`` to ``route`` (the URL rule of the request, or
+        None if no route matched).
+
+        Returns None if the request may run; the caller must then call release() once
+        it has finished. Otherwise returns a Rejection and nothing needs to be released.
+        """
+        route_buckets = self.route_buckets.get(route, self.default_route_buckets)
+        now = time.monotonic()
+        with self._lock:
+            # Both buckets must hold a token; neither is charged if one of them is empty
+            client_bucket = route_bucket = None
+            wait = 0.0
+            if self.client_buckets.rate > 0:
+                client_bucket = self.client_buckets.available(client, now)
+                if client_bucket[0] < 1.0:
+                    wait = self.client_buckets.wait_time(client_bucket)
+            if route_buckets.rate > 0:
+                route_bucket = route_buckets.available((client, route), now)
+                if route_bucket[0] < 1.0:
+                    wait = max(wait, route_buckets.wait_time(route_bucket))
+            if wait > 0:
+                self.rate_limited += 1
+                return Rejection(429, "Too many requests", wait)
+
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.shed += 1
+                return Rejection(503, "Server is busy", 1)
+
+            if client_bucket is not None:
+                client_bucket[0] -= 1.0
+            if route_bucket is not None:
+                route_bucket[0] -= 1.0
+            self.in_flight += 1
+            return None
+
+    def release(self):
+        """
+        Mark an admitted request as finished.
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """
+    Return the process-wide controller, creating it from the ADMISSION_* settings.
+    """
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                config = current_app.config
+                _controller = AdmissionController(
+                    config["ADMISSION_CLIENT_RATE"],
+                    config["ADMISSION_CLIENT_BURST"],
+                    config["ADMISSION_ROUTE_RATE"],
+                    config["ADMISSION_ROUTE_BURST"],
+                    parse_route_limits(config["ADMISSION_ROUTE_LIMITS"]),
+                    config["ADMISSION_MAX_IN_FLIGHT"],
+                    config["ADMISSION_MAX_CLIENTS"]
+                )
+    return _controller
+
+
+def client_identity(remote_addr, header_value):
+    """
+    Return the client key: the first address in the configured header, if present,
+    otherwise the remote address.
+    """
+    if header_value:
+        return header_value.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+def rejection_response(rejection):
+    return jsonify({"error": rejection.error}), rejection.status_code, {
+        "Retry-After": rejection.retry_after_header()
+    }
+
+
+def init_admission(app):
+    """
+    Install admission control for every request of ``app`` (unless ADMISSION_ENABLED is off).
+    """
+    if not app.config["ADMISSION_ENABLED"]:
+        return
+    client_header = app.config["ADMISSION_CLIENT_HEADER"]
+    if not client_header:
+        logging.warning(f"[{os.getpid()}] Admission control identifies clients by remote address; "
+                        "set ADMISSION_CLIENT_HEADER when running behind a proxy.")
+
+    @app.before_request
+    def admit_request():
+        client = client_identity(
+            request.remote_addr, request.headers.get(client_header) if client_header else None
+        )
+        route = request.url_rule.rule if request.url_rule is not None else None
+        rejection = get_admission_controller().admit(client, route)
+        if rejection is not None:
+            return rejection_response(rejection)
+        g.admitted = True
+
+    @app.teardown_request
+    def release_request(exc=None):
+        if g.pop("admitted", False):
+            get_admission_controller().release()
@@ -0,0 +1,451 @@
+"""
+ASGI entry point for the optional async serving mode.
+
+In the default (WSGI) deployment every request holds a worker thread while it waits on
+the database, so the number of concurrently served terminals is capped by the thread
+pool. This module serves the hot endpoints as coroutines on SQLAlchemy's async engine
+(aiosqlite for SQLite), so a waiting request only costs a suspended task:
+
+- POST /api/verify_transaction
+- POST /api/add_balance
+- POST /api/deduct_balance
+- GET  /api/all_secrets
+
+They reuse the sync implementation (app.balance, app.risk_cache, app.secrets_cache and
+verify_transaction()) and return the same status codes and JSON bodies. With
+GROUP_COMMIT_ENABLED, credits are queued on the process's group committer
+(app.group_commit) exactly like the Flask view does, and awaited without blocking. Every other
+request, any request whose body is not valid JSON and any request carrying an
+Idempotency-Key header is handed to the regular Flask application, which runs on its
+own thread per request. Requests served here pass through the same admission control
+(app.admission) as the Flask views, their latency is recorded in app.metrics, and
+they support the same ``fields`` projection (app.serializers) and gzip compression
+(app.compression).
+
+Install the extras from requirements-async.txt and run, for example:
+
+    uvicorn app.asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from werkzeug.http import parse_etags, quote_etag
+
+from app import create_app
+from app.admission import client_identity, get_admission_controller
+from app.balance import credit_balance, debit_balance, parse_amount, parse_positive_amount
+from app.compression import accepts_gzip, gzip_body
+from app.group_commit import CREDIT_PENDING_ERROR, get_group_committer
+from app.metrics import CACHE_HITS, discard_request_metrics, finish_request_metrics, start_request_metrics
+from app.models import User
+from app.risk_cache import RISK_COLUMNS, RiskState, get_risk_cache, invalidate_risk_state
+from app.routes.auth_routes import verify_transaction
+from app.secrets_cache import fresh_secrets_snapshot, get_secrets_snapshot
+from app.serializers import parse_fields, project
+from app.storage import create_async_engines
+
+
+class JSONBodyError(Exception):
+    """
+    Raised when a request body is not JSON; the request is then served by Flask.
+    """
+
+
+class AsyncAPI:
+    """
+    ASGI application serving the hot endpoints asynchronously and delegating all
+    other requests to the Flask application.
+
+    Args:
+        flask_app (Flask): Application created by create_app().
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        with flask_app.app_context():
+            engine, read_engine = create_async_engines(flask_app)
+            self.risk_cache = get_risk_cache()
+            self.admission = get_admission_controller() if flask_app.config["ADMISSION_ENABLED"] else None
+            self.committer = get_group_committer() if flask_app.config["GROUP_COMMIT_ENABLED"] else None
+        self.client_header = flask_app.config["ADMISSION_CLIENT_HEADER"].lower().encode("latin-1")
+        self.engines = (engine, read_engine)
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        self.read_sessions = async_sessionmaker(read_engine, expire_on_commit=False)
+        self.secrets_check_interval = flask_app.config["SECRETS_VERSION_CHECK_INTERVAL"]
+        self.metrics_enabled = flask_app.config["METRICS_ENABLED"]
+        self.compression = (
+            (flask_app.config["COMPRESSION_LEVEL"], flask_app.config["COMPRESSION_MIN_SIZE"])
+            if flask_app.config["COMPRESSION_ENABLED"] else None
+        )
+        self.routes = {
+            ("POST", "/api/verify_transaction"): self.verify_transaction,
+            ("POST", "/api/add_balance"): self.add_balance,
+            ("POST", "/api/deduct_balance"): self.deduct_balance,
+            ("GET", "/api/all_secrets"): self.all_secrets,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        handler = self.routes.get((scope.get("method"), scope.get("path")))
+        if scope["type"] != "http" or handler is None or request_header(scope, b"idempotency-key") is not None:
+            # Idempotency keys are handled by the Flask views (see app.idempotency)
+            return await self.delegate(scope, receive, send)
+
+        token = start_request_metrics() if self.metrics_enabled else None
+        status = await self.serve(handler, scope, receive, send)
+        if token is not None:
+            if status is not None:
+                finish_request_metrics(token, scope["path"], scope["method"], status)
+            else:
+                # Served by Flask, which records the request itself
+                discard_request_metrics(token)
+
+    async def serve(self, handler, scope, receive, send):
+        """
+        Serve a request with ``handler``. Returns the response status, or None if the
+        request was handed to Flask.
+        """
+        if self.admission is not None:
+            rejection = self.admit(scope)
+            if rejection is not None:
+                headers = [(b"retry-after", rejection.retry_after_header().encode("latin-1"))]
+                content = self.dumps({"error": rejection.error})
+                await send_response(send, rejection.status_code, content, headers)
+                return rejection.status_code
+
+        try:
+            body = await read_body(receive)
+            try:
+                status, payload, headers = await handler(scope, body)
+            except JSONBodyError:
+                status = None
+        finally:
+            if self.admission is not None:
+                self.admission.release()
+        if status is None:
+            # Let Flask produce its usual 400/415 responses for malformed requests
+            await self.delegate(scope, replay(body), send)
+            return None
+
+        if isinstance(payload, bytes):
+            content = payload
+        else:
+            content = self.dumps(payload) if payload is not None else b""
+        if self.compression is not None and status not in (204, 304):
+            content, headers = self.compress(scope, content, headers)
+        await send_response(send, status, content, headers)
+        return status
+
+    def compress(self, scope, content, headers):
+        """
+        gzip a response body the way app.compression does for Flask responses.
+        """
+        level, min_size = self.compression
+        headers = list(headers or [])
+        headers.append((b"vary", b"Accept-Encoding"))
+        if len(content) < min_size or not accepts_gzip(request_header(scope, b"accept-encoding")):
+            return content, headers
+        # The compressed bytes differ from the tagged entity: make strong ETags weak
+        headers = [
+            (key, b"W/" + value) if key == b"etag" and not value.startswith(b"W/") else (key, value)
+            for key, value in headers
+        ]
+        headers.append((b"content-encoding", b"gzip"))
+        return gzip_body(content, level), headers
+
+    def admit(self, scope):
+        """
+        Run admission control for a request served by this application (see app.admission).
+
+        The routes served here have no path parameters, so the path is the URL rule.
+        """
+        client = scope.get("client")
+        header = request_header(scope, self.client_header) if self.client_header else None
+        return self.admission.admit(client_identity(client[0] if client else None, header), scope["path"])
+
+    async def delegate(self, scope, receive, send):
+        """
+        Serve a request with the Flask application on a dedicated thread.
+        """
+        # Without a context of its own, asgiref would run all WSGI calls on one thread
+        async with ThreadSensitiveContext():
+            await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for engine in set(self.engines):
+                    await engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def dumps(self, payload):
+        """
+        Serialize like Flask's jsonify in production: compact, key-sorted, newline-terminated.
+        """
+        return (self.flask_app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+
+    async def verify_transaction(self, scope, body):
+        """
+        Async counterpart of POST /api/verify_transaction (see auth_routes).
+        """
+        data = parse_json(scope, body)
+
+        # Check that JSON data was sent
+        if not data:
+            return 401, {"error": "No data provided"}, None
+
+        # Extract required fields from the payload
+        matriculationNumber = data.get("matriculationNumber")
+        amount = data.get("amount")
+        if not matriculationNumber or amount is None:
+            return 402, {"error": "matriculationNumber and amount must be provided"}, None
+        try:
+            amount = parse_amount(amount)
+        except ValueError as e:
+            return 400, {"error": str(e)}, None
+
+        # Look up the user's risk state, loading it on the read engine on a cache miss
+        risk_state, generation = self.risk_cache.get(matriculationNumber)
+        if risk_state is None:
+            async with self.read_sessions() as session:
+                row = (await session.execute(
+                    select(*RISK_COLUMNS).where(User.matriculationNumber == matriculationNumber)
+                )).first()
+            risk_state = RiskState(*row) if row is not None else None
+            self.risk_cache.put(matriculationNumber, risk_state, generation)
+        if not risk_state:
+            return 404, {"error": "User not found"}, None
+
+        is_authorized, message = verify_transaction(risk_state, amount)
+        if is_authorized:
+            return 200, {"status": "success", "message": message}, None
+        else:
+            return 400, {"status": "failure", "message": message}, None
+
+    async def add_balance(self, scope, body):
+        """
+        Async counterpart of POST /api/add_balance (see bank_routes).
+        """
+        data = parse_json(scope, body)
+
+        # Validate required input fields
+        if not data or "matriculationNumber" not in data or "amount" not in data:
+            return 400, {"error": "matriculationNumber and amount are required"}, None
+        try:
+            amount = parse_positive_amount(data["amount"])
+            fields = parse_fields(query_param(scope, "fields"))
+        except ValueError as e:
+            return 400, {"error": str(e)}, None
+
+        matriculationNumber = data["matriculationNumber"]
+
+        if self.committer is not None:
+            return await self.group_credit(matriculationNumber, amount, fields)
+
+        async with self.sessions() as session:
+            try:
+                # The ORM work, including lazy loads in as_dict(), runs via run_sync
+                result = await session.run_sync(_credit, matriculationNumber, amount, fields)
+                if result is None:
+                    await session.rollback()
+                    return 404, {"error": "User not found"}, None
+                await session.commit()
+            except Exception as e:
+                # Roll back on error and return details
+                await session.rollback()
+                return 500, {"error": "Error updating balance", "details": str(e)}, None
+        invalidate_risk_state(matriculationNumber)
+
+        new_balance, user_data = result
+        return 200, {
+            "message": "Balance updated successfully",
+            "new_balance": new_balance,
+            "user": user_data
+        }, None
+
+    async def group_credit(self, matriculation_number, amount, fields):
+        """
+        Queue a credit on the group committer and await its commit (see app.group_commit).
+        """
+        try:
+            # Shielded: a timed out wait must not cancel the credit, which may still commit
+            result = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(self.committer.submit(matriculation_number, amount))),
+                self.committer.timeout
+            )
+        except TimeoutError:
+            # The credit may still be committed (see bank_routes.add_balance)
+            return 409, {"error": CREDIT_PENDING_ERROR}, [(b"retry-after", b"1")]
+        except Exception as e:
+            return 500, {"error": "Error updating balance", "details": str(e)}, None
+        if result is None:
+            return 404, {"error": "User not found"}, None
+
+        new_balance, user_data = result
+        return 200, {
+            "message": "Balance updated successfully",
+            "new_balance": new_balance,
+            "user": project(user_data, fields)
+        }, None
+
+    async def deduct_balance(self, scope, body):
+        """
+        Async counterpart of POST /api/deduct_balance (see bank_routes).
+        """
+        data = parse_json(scope, body)
+
+        # Validate required input fields
+        if not data or "matriculationNumber" not in data or "amount" not in data:
+            return 400, {"error": "matriculationNumber and amount are required"}, None
+        try:
+            amount = parse_positive_amount(data["amount"])
+            fields = parse_fields(query_param(scope, "fields"))
+        except ValueError as e:
+            return 400, {"error": str(e)}, None
+
+        matriculationNumber = data["matriculationNumber"]
+
+        async with self.sessions() as session:
+            try:
+                user_data, current_balance = await session.run_sync(_debit, matriculationNumber, amount, fields)
+                if user_data is None:
+                    await session.rollback()
+                    if current_balance is None:
+                        return 404, {"error": "User not found"}, None
+                    # The user exists but does not have enough balance to cover the deduction
+                    return 400, {"error": "Insufficient balance", "current_balance": current_balance}, None
+                await session.commit()
+            except Exception as e:
+                # Roll back on error and return details
+                await session.rollback()
+                return 500, {"error": "Error updating balance", "details": str(e)}, None
+        invalidate_risk_state(matriculationNumber)
+
+        return 200, {
+            "message": "Amount deducted successfully",
+            "new_balance": current_balance,
+            "user": user_data
+        }, None
+
+    async def all_secrets(self, scope, body):
+        """
+        Async counterpart of GET /api/all_secrets (see bank_routes), including ETag handling.
+        """
+        snapshot = fresh_secrets_snapshot(self.secrets_check_interval)
+        if snapshot is None:
+            # At most once per check interval: compare versions / rebuild on a worker thread
+            snapshot = await asyncio.to_thread(self._check_secrets_snapshot)
+        else:
+            CACHE_HITS.inc("secrets_snapshot")
+
+        headers = [
+            (b"etag", quote_etag(snapshot.etag).encode("latin-1")),
+            # Clients may cache the body but must revalidate it on every poll
+            (b"cache-control", b"no-cache"),
+        ]
+        if_none_match = request_header(scope, b"if-none-match")
+        if if_none_match and parse_etags(if_none_match).contains_weak(snapshot.etag):
+            return 304, None, headers
+        return 200, snapshot.body, headers
+
+    def _check_secrets_snapshot(self):
+        with self.flask_app.app_context():
+            return get_secrets_snapshot()
+
+
+def _credit(session, matriculation_number, amount, fields=None):
+    user = credit_balance(matriculation_number, amount, session=session)
+    if not user:
+        return None
+    # Serialize before committing so the response reflects exactly this update
+    return user.balance, user.as_dict(fields=fields)
+
+
+def _debit(session, matriculation_number, amount, fields=None):
+    user, current_balance = debit_balance(matriculation_number, amount, session=session)
+    if not user:
+        return None, current_balance
+    return user.as_dict(fields=fields), current_balance
+
+
+def request_header(scope, name):
+    """
+    Return the value of a request header as a string, or None.
+    """
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def query_param(scope, name):
+    """
+    Return the first value of a query string parameter, or None.
+    """
+    values = parse_qs(scope.get("query_string", b"").decode("utf-8", "replace")).get(name)
+    return values[0] if values else None
+
+
+def parse_json(scope, body):
+    """
+    Decode a JSON request body.
+
+    Raises:
+        JSONBodyError: if the content type is not JSON or the body cannot be parsed.
+    """
+    content_type = request_header(scope, b"content-type") or ""
+    if content_type.split(";")[0].strip() != "application/json" and not content_type.endswith("+json"):
+        raise JSONBodyError()
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise JSONBodyError() from None
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def replay(body):
+    """
+    Return a ``receive`` callable that yields an already consumed request body once more.
+    """
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Only reached after the body was read; wait until the server reports a disconnect
+        await asyncio.Event().wait()
+
+    return receive
+
+
+async def send_response(send, status, content, headers=None):
+    response_headers = list(headers or [])
+    if content or status != 304:
+        response_headers.append((b"content-type", b"application/json"))
+        response_headers.append((b"content-length", str(len(content)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": content})
+
+
+app = AsyncAPI(create_app())
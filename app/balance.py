@@ -0,0 +1,258 @@
+"""
+Balance module for the application.
+
+This module contains the write paths that change a user's account balance. Single
+changes are expressed as one conditional UPDATE statement so that concurrent workers
+never overwrite each other's results and no prior SELECT is needed. Batches of
+operations are applied with set-based statements inside one transaction.
+
+Every applied change is also appended to the ledger (see app.ledger) in the same
+transaction.
+"""
+
+import math
+from sqlalchemy import bindparam, func, select, update
+from app.models import User
+from app.extensions import db
+from app.ledger import record_entries
+
+# Maximum number of bound parameters used in a single IN (...) lookup
+LOOKUP_CHUNK_SIZE = 500
+# Attempts of set_balance() before giving up on a balance that keeps changing
+SET_BALANCE_ATTEMPTS = 5
+
+
+class BalanceConflict(Exception):
+    """
+    Raised by set_balance() when concurrent changes kept replacing the balance.
+    """
+
+
+def parse_amount(value):
+    """
+    Convert the ``amount`` of a request to a float.
+
+    Raises:
+        ValueError: if the value is not a finite number.
+    """
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("amount must be a number") from None
+    if not math.isfinite(amount):
+        raise ValueError("amount must be a number")
+    return amount
+
+
+def parse_positive_amount(value):
+    """
+    Convert the ``amount`` of a credit or debit to a float.
+
+    Raises:
+        ValueError: if the value is not a finite number greater than zero.
+    """
+    amount = parse_amount(value)
+    if amount <= 0:
+        raise ValueError("amount must be greater than zero")
+    return amount
+
+
+def credit_balance(matriculation_number, amount, session=None):
+    """
+    Atomically add an amount to a user's balance.
+
+    Issues ``UPDATE users SET balance = balance + :amount`` and returns the updated
+    User (hydrated from the RETURNING clause), or None if no such user exists. A
+    "credit" ledger entry is recorded for the change.
+    Runs on ``session`` (default: db.session); the caller is responsible for committing it.
+    """
+    session = session or db.session
+    stmt = (
+        update(User)
+        .where(User.matriculationNumber == matriculation_number)
+        .values(balance=func.coalesce(User.balance, 0.0) + amount)
+        .returning(User)
+        .execution_options(synchronize_session=False)
+    )
+    user = session.execute(stmt).scalar_one_or_none()
+    if user is not None:
+        record_entries([(matriculation_number, amount, "credit")], session)
+    return user
+
+
+def debit_balance(matriculation_number, amount, session=None):
+    """
+    Atomically subtract an amount from a user's balance if funds are sufficient.
+
+    Issues ``UPDATE users SET balance = balance - :amount WHERE balance >= :amount``
+    and returns a tuple (user, current_balance):
+      - (User, new_balance) if the deduction was applied
+      - (None, current_balance) if the balance was insufficient
+      - (None, None) if no such user exists
+
+    An applied deduction is recorded as a "debit" ledger entry.
+    Runs on ``session`` (default: db.session); the caller is responsible for committing it.
+    """
+    session = session or db.session
+    stmt = (
+        update(User)
+        .where(
+            User.matriculationNumber == matriculation_number,
+            func.coalesce(User.balance, 0.0) >= amount
+        )
+        .values(balance=func.coalesce(User.balance, 0.0) - amount)
+        .returning(User)
+        .execution_options(synchronize_session=False)
+    )
+    user = session.execute(stmt).scalar_one_or_none()
+    if user is not None:
+        record_entries([(matriculation_number, -amount, "debit")], session)
+        return user, user.balance
+
+    # Only on failure: find out whether the user is missing or just short on funds
+    row = session.execute(
+        select(User.balance).where(User.matriculationNumber == matriculation_number)
+    ).first()
+    if row is None:
+        return None, None
+    return None, row.balance or 0.0
+
+
+def set_balance(matriculation_number, balance, session=None):
+    """
+    Atomically replace a user's balance with an absolute value.
+
+    Reads the current balance and issues ``UPDATE users SET balance = :balance WHERE
+    balance = :current RETURNING balance``, so a change committed in between (e.g. a
+    concurrent credit) is never overwritten unseen: the statement then matches no row
+    and is retried with the new current balance. The difference between the returned
+    and the replaced balance is recorded as an "adjustment" ledger entry, which keeps
+    the ledger in line with ``User.balance``.
+
+    Returns the new balance, or None if no such user exists. Raises BalanceConflict
+    after SET_BALANCE_ATTEMPTS lost races.
+    Runs on ``session`` (default: db.session); the caller is responsible for committing it.
+    """
+    session = session or db.session
+    current = func.coalesce(User.balance, 0.0)
+    for _ in range(SET_BALANCE_ATTEMPTS):
+        previous = session.execute(
+            select(current).where(User.matriculationNumber == matriculation_number)
+        ).scalar_one_or_none()
+        if previous is None:
+            return None
+        new_balance = session.execute(
+            update(User)
+            .where(User.matriculationNumber == matriculation_number, current == previous)
+            .values(balance=balance)
+            .returning(User.balance)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        if new_balance is not None:
+            if new_balance != previous:
+                record_entries([(matriculation_number, new_balance - previous, "adjustment")], session)
+            return new_balance
+    raise BalanceConflict()
+
+
+def apply_balance_batch(operations):
+    """
+    Apply a list of credit/debit operations in the current transaction.
+
+    Each operation is a dict with ``matriculationNumber``, ``amount`` (positive number)
+    and ``type`` ("credit" or "debit"). Operations are evaluated in order, so a debit
+    can use funds credited earlier in the same batch. The work is set-based:
+
+    1. One SELECT ... FOR UPDATE per chunk of accounts loads the current balances.
+    2. Operations are evaluated in memory against the running balances.
+    3. The net change per account is written with a single executemany UPDATE, and
+       one ledger entry per applied operation with a single executemany INSERT.
+
+    Returns a list with one result dict per operation, containing ``index``,
+    ``matriculationNumber``, ``status`` ("success", "insufficient_funds",
+    "user_not_found" or "invalid") and, where known, ``new_balance``.
+    The caller is responsible for committing the session.
+    """
+    parsed = []
+    for index, op in enumerate(operations):
+        parsed.append((index, op, _parse_operation(op)))
+
+    # 1. Load the balances of every referenced account, locking the rows where supported
+    numbers = sorted({p[1] for _, _, p in parsed if p is not None})
+    balances = {}
+    for start in range(0, len(numbers), LOOKUP_CHUNK_SIZE):
+        rows = db.session.execute(
+            select(User.matriculationNumber, User.balance)
+            .where(User.matriculationNumber.in_(numbers[start:start + LOOKUP_CHUNK_SIZE]))
+            .with_for_update()
+        )
+        balances.update({number: balance or 0.0 for number, balance in rows})
+
+    # 2. Evaluate operations in order against the running balances
+    results = []
+    deltas = {}
+    entries = []
+    for index, op, operation in parsed:
+        if operation is None:
+            results.append({
+                "index": index,
+                "matriculationNumber": op.get("matriculationNumber") if isinstance(op, dict) else None,
+                "status": "invalid"
+            })
+            continue
+
+        kind, number, amount = operation
+        if number not in balances:
+            results.append({"index": index, "matriculationNumber": number, "status": "user_not_found"})
+            continue
+
+        if kind == "debit" and balances[number] < amount:
+            results.append({
+                "index": index,
+                "matriculationNumber": number,
+                "status": "insufficient_funds",
+                "new_balance": balances[number]
+            })
+            continue
+
+        delta = amount if kind == "credit" else -amount
+        balances[number] += delta
+        deltas[number] = deltas.get(number, 0.0) + delta
+        entries.append((number, delta, kind))
+        results.append({
+            "index": index,
+            "matriculationNumber": number,
+            "status": "success",
+            "new_balance": balances[number]
+        })
+
+    # 3. Write the net change per account in one executemany statement
+    if deltas:
+        users = User.__table__
+        db.session.execute(
+            update(users)
+            .where(users.c.matriculationNumber == bindparam("b_number"))
+            .values(balance=func.coalesce(users.c.balance, 0.0) + bindparam("b_delta")),
+            [{"b_number": number, "b_delta": delta} for number, delta in deltas.items()]
+        )
+        record_entries(entries)
+    return results
+
+
+def _parse_operation(op):
+    """
+    Validate a single batch operation and return (type, matriculationNumber, amount),
+    or None if the operation is malformed.
+    """
+    if not isinstance(op, dict):
+        return None
+    kind = op.get("type")
+    number = op.get("matriculationNumber")
+    # Numbers of any other type cannot be compared or hashed together with the strings
+    if kind not in ("credit", "debit") or not isinstance(number, str) or not number:
+        return None
+    try:
+        amount = parse_positive_amount(op.get("amount"))
+    except ValueError:
+        return None
+    return kind, number, amount
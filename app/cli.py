@@ -0,0 +1,70 @@
+"""
+Command line interface of the application.
+
+Commands are registered on the Flask CLI, e.g.:
+
+    flask --app run import-users students.csv
+
+``init-db`` and ``seed-banks`` are meant to run once per deployment (e.g. in a release
+step), so that worker processes can start with SEED_ON_STARTUP=0.
+"""
+
+import json
+import os
+import sys
+import click
+from app.passwords import get_password_hasher
+from app.schema import SCHEMA_VERSION, ensure_schema
+from app.user_import import FORMATS, UserImporter, read_rows
+
+
+def init_app(app):
+    """
+    Register the application's CLI commands.
+    """
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_banks_command)
+    app.cli.add_command(import_users_command)
+
+
+@click.command("init-db")
+def init_db_command():
+    """
+    Create and upgrade the database schema and record the current schema version.
+    """
+    ensure_schema(force=True)
+    click.echo(f"Database schema is at version {SCHEMA_VERSION}.")
+
+
+@click.command("seed-banks")
+def seed_banks_command():
+    """
+    Insert the default banks and their secrets if the banks table is empty.
+    """
+    from flask import current_app
+    from app import prepopulate_banks
+
+    prepopulate_banks(current_app._get_current_object())
+
+
+@click.command("import-users")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "format", type=click.Choice(FORMATS),
+              help="File format (default: from the file extension).")
+@click.option("--chunk-size", type=int, help="Rows per chunk (default: IMPORT_CHUNK_SIZE).")
+@click.option("--prehashed", is_flag=True, help="Store passwords that are werkzeug hashes as they are.")
+def import_users_command(path, format, chunk_size, prehashed):
+    """
+    Register users from a CSV or NDJSON file in chunks (see app.user_import).
+
+    Rejected rows are printed to stderr as NDJSON; the summary is printed to stdout.
+    """
+    from flask import current_app
+
+    if format is None:
+        format = "csv" if os.path.splitext(path)[1].lower() == ".csv" else "ndjson"
+    importer = UserImporter(get_password_hasher(), chunk_size or current_app.config["IMPORT_CHUNK_SIZE"], prehashed)
+    with open(path, "rb") as stream:
+        for rejection in importer.run(read_rows(stream, format)):
+            click.echo(json.dumps(rejection.as_dict()), file=sys.stderr)
+    click.echo(json.dumps(importer.summary()))
@@ -0,0 +1,97 @@
+"""
+Response compression module for the application.
+
+Lists of users, the /api/all_secrets snapshot and /metrics are plain JSON or text and
+compress well. For clients that send ``Accept-Encoding: gzip``:
+
+- JSON and text responses of at least COMPRESSION_MIN_SIZE bytes are gzip-compressed;
+  smaller bodies are sent as they are, as compressing them costs more CPU than the
+  bytes saved are worth
+- streamed NDJSON responses (/api/users?format=ndjson, /api/import_users) are
+  compressed on the fly, flushing after every chunk the view yields, so clients still
+  receive rows while the stream is generated
+
+Strong ETags of compressed responses are made weak, as the bytes sent differ from the
+entity the tag was computed for; If-None-Match uses weak comparison, so revalidation
+keeps working. ``Vary: Accept-Encoding`` tells caches to store both variants.
+"""
+
+import gzip
+import zlib
+from flask import request
+from werkzeug.http import parse_accept_header
+
+# Response types worth compressing
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain", "text/csv")
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Return True if an Accept-Encoding header value allows gzip.
+    """
+    return bool(accept_encoding) and parse_accept_header(accept_encoding)["gzip"] > 0
+
+
+def gzip_body(data, level):
+    # mtime=0 keeps the output deterministic for equal bodies
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def gzip_stream(chunks, level):
+    """
+    Compress an iterable of body chunks, flushing after every chunk.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, level, min_size):
+    """
+    gzip ``response`` in place if it is worth it. Returns the response.
+    """
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "Content-Encoding" in response.headers or response.direct_passthrough):
+        return response
+    response.vary.add("Accept-Encoding")
+
+    if response.is_streamed:
+        response.response = gzip_stream(response.response, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip_body(data, level))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """
+    Compress responses of ``app`` for clients accepting gzip (unless COMPRESSION_ENABLED is off).
+    """
+    if not app.config["COMPRESSION_ENABLED"]:
+        return
+    level = app.config["COMPRESSION_LEVEL"]
+    min_size = app.config["COMPRESSION_MIN_SIZE"]
+
+    @app.after_request
+    def compress(response):
+        if not accepts_gzip(request.headers.get("Accept-Encoding")):
+            return response
+        return compress_response(response, level, min_size)
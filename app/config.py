@@ -6,3 +6,118 @@ class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or  "59c22d42144f43cdd5afde98af1d63306181dc83dc5b26ea4fc03243eff2671b"
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") or "sqlite:///" + os.path.join(basedir,"userdb.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional read replica used by read-only endpoints (defaults to SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_READ_DATABASE_URI = os.environ.get("READ_DATABASE_URL")
+    # Storage profile from app.storage.STORAGE_PROFILES: "legacy", "balanced", "durable" or "throughput"
+    STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE") or "balanced"
+    # Upper bound for the number of operations accepted by /api/batch_balance
+    BATCH_BALANCE_MAX_OPERATIONS = int(os.environ.get("BATCH_BALANCE_MAX_OPERATIONS") or 10000)
+    # Upper bound for the number of transactions accepted by /api/verify_transactions
+    VERIFY_TRANSACTIONS_MAX_ITEMS = int(os.environ.get("VERIFY_TRANSACTIONS_MAX_ITEMS") or 10000)
+    # Rows validated, checked and inserted together by the bulk user import
+    IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE") or 1000)
+    # Bytes of an /api/import_users upload buffered in memory before it is spooled to a temporary file
+    IMPORT_SPOOL_MAX_MEMORY = int(os.environ.get("IMPORT_SPOOL_MAX_MEMORY") or 8 * 1024 * 1024)
+    # Maximum page size for keyset-paginated /api/users requests
+    USERS_PAGE_MAX_LIMIT = int(os.environ.get("USERS_PAGE_MAX_LIMIT") or 1000)
+    # Number of rows fetched per round trip when streaming /api/users as NDJSON
+    USERS_STREAM_BATCH_SIZE = int(os.environ.get("USERS_STREAM_BATCH_SIZE") or 500)
+    # Set COMPRESSION_ENABLED=0 to never gzip responses (e.g. when a proxy compresses them)
+    COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "1") != "0"
+    # Smallest JSON response body in bytes that is gzip-compressed for clients accepting it
+    COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE") or 1024)
+    # gzip compression level (1 fastest - 9 smallest)
+    COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL") or 5)
+    # Maximum age of a secret code accepted by /api/validate_secret (six 3-minute rotations)
+    SECRET_VALIDITY_SECONDS = int(os.environ.get("SECRET_VALIDITY_SECONDS") or 1080)
+    # Set GROUP_COMMIT_ENABLED=1 to batch /api/add_balance credits into shared transactions
+    GROUP_COMMIT_ENABLED = os.environ.get("GROUP_COMMIT_ENABLED", "0") == "1"
+    # Milliseconds the group-commit flusher waits for more credits before committing
+    GROUP_COMMIT_INTERVAL_MS = float(os.environ.get("GROUP_COMMIT_INTERVAL_MS") or 5)
+    # Number of queued credits that triggers an immediate group commit
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH") or 500)
+    # Seconds a request waits for its credit to be committed
+    GROUP_COMMIT_TIMEOUT = float(os.environ.get("GROUP_COMMIT_TIMEOUT") or 10)
+    # Number of Idempotency-Key responses kept in memory per process
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE") or 10000)
+    # Seconds an Idempotency-Key and its response are kept (the retry window)
+    IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL") or 86400)
+    # Seconds a duplicate request waits for the original request with the same key
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get("IDEMPOTENCY_WAIT_TIMEOUT") or 30)
+    # Maximum page size for /api/transactions
+    TRANSACTIONS_PAGE_MAX_LIMIT = int(os.environ.get("TRANSACTIONS_PAGE_MAX_LIMIT") or 500)
+    # Minutes between two balance snapshot runs; bounds the ledger range read by /api/balance_at
+    BALANCE_SNAPSHOT_INTERVAL = int(os.environ.get("BALANCE_SNAPSHOT_INTERVAL") or 60)
+    # Seconds a ledger entry must be old before it is snapshotted; longer than any balance transaction
+    BALANCE_SNAPSHOT_GRACE_SECONDS = float(os.environ.get("BALANCE_SNAPSHOT_GRACE_SECONDS") or 60)
+    # Seconds a cached /api/all_secrets snapshot is served before its rotation version is rechecked
+    SECRETS_VERSION_CHECK_INTERVAL = float(os.environ.get("SECRETS_VERSION_CHECK_INTERVAL") or 5)
+    # Set SCHEDULER_ENABLED=0 to run this process without the secret rotation scheduler
+    SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") != "0"
+    # Seconds after startup before this process starts its scheduler (0 starts it during create_app)
+    SCHEDULER_START_DELAY = float(os.environ.get("SCHEDULER_START_DELAY") or 0)
+    # Set SEED_ON_STARTUP=0 to only insert the default banks with `flask seed-banks`
+    SEED_ON_STARTUP = os.environ.get("SEED_ON_STARTUP", "1") != "0"
+    # Secret rotation strategy: "full" replaces all codes per bank, "rolling" only the oldest one,
+    # "derived" computes the codes per time window without storing them (see app.secret_derivation)
+    SECRET_ROTATION_MODE = os.environ.get("SECRET_ROTATION_MODE") or "full"
+    # Seconds per time window in the "derived" mode; each window adds one code per bank
+    SECRET_WINDOW_SECONDS = int(os.environ.get("SECRET_WINDOW_SECONDS") or 180)
+    # Key the "derived" codes are computed from; required in that mode and the same for every process
+    SECRET_DERIVATION_KEY = os.environ.get("SECRET_DERIVATION_KEY") or ""
+    # Number of banks rotated per transaction
+    SECRET_ROTATION_CHUNK_SIZE = int(os.environ.get("SECRET_ROTATION_CHUNK_SIZE") or 500)
+    # How the process that rotates secrets is chosen: "file" (lock file), "database" (lease row) or "none"
+    SCHEDULER_LEADER_ELECTION = os.environ.get("SCHEDULER_LEADER_ELECTION") or "file"
+    # Lock file shared by all workers on one host when SCHEDULER_LEADER_ELECTION is "file"
+    SCHEDULER_LOCK_FILE = os.environ.get("SCHEDULER_LOCK_FILE") or os.path.join(basedir, "scheduler.lock")
+    # Seconds a database lease stays valid without renewal; must exceed the rotation interval
+    SCHEDULER_LEASE_TTL = int(os.environ.get("SCHEDULER_LEASE_TTL") or 450)
+    # Set METRICS_ENABLED=0 to disable request/database metrics and the /metrics endpoint
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+    # Directory where every worker process publishes its metrics for /metrics (empty: this process only)
+    METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(basedir, "metrics"))
+    # Seconds between two writes of a worker process's metrics file
+    METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL") or 5)
+    # Set PROFILER_ENABLED=0 to remove the request profiler hooks
+    PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "1") != "0"
+    # Shared secret for the X-Profile header and the /api/admin endpoints (empty disables both)
+    PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN") or ""
+    # Keep profiles of sampled requests slower than this many milliseconds (0 disables slow-request capture)
+    PROFILER_SLOW_MS = float(os.environ.get("PROFILER_SLOW_MS") or 0)
+    # Fraction of requests profiled for slow-request capture
+    PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE") or 0.01)
+    # Directory holding captured profiles and the runtime profiling switch
+    PROFILER_DIR = os.environ.get("PROFILER_DIR") or os.path.join(basedir, "profiles")
+    # Number of captured profiles kept; older ones are deleted
+    PROFILER_MAX_CAPTURES = int(os.environ.get("PROFILER_MAX_CAPTURES") or 50)
+    # Set ADMISSION_ENABLED=1 to enable rate limiting and load shedding (see app.admission)
+    ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "0") == "1"
+    # Requests per second a single client may send across all routes (0 disables the limit)
+    ADMISSION_CLIENT_RATE = float(os.environ.get("ADMISSION_CLIENT_RATE") or 100)
+    # Requests a client may send in a burst before ADMISSION_CLIENT_RATE applies
+    ADMISSION_CLIENT_BURST = int(os.environ.get("ADMISSION_CLIENT_BURST") or 200)
+    # Requests per second a single client may send to one route (0 disables the limit)
+    ADMISSION_ROUTE_RATE = float(os.environ.get("ADMISSION_ROUTE_RATE") or 50)
+    # Requests a client may send to one route in a burst
+    ADMISSION_ROUTE_BURST = int(os.environ.get("ADMISSION_ROUTE_BURST") or 100)
+    # Per-route overrides keyed by URL rule, e.g. "/api/all_secrets=1:5,/api/profiles/<name>=1:2" (rate:burst)
+    ADMISSION_ROUTE_LIMITS = os.environ.get("ADMISSION_ROUTE_LIMITS") or ""
+    # Requests executing at once per process; further requests are shed with 503 (0 disables the limit)
+    ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT") or 64)
+    # Header carrying the client address when behind a trusted proxy (e.g. X-Forwarded-For)
+    ADMISSION_CLIENT_HEADER = os.environ.get("ADMISSION_CLIENT_HEADER") or ""
+    # Maximum number of clients whose token buckets are tracked
+    ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS") or 100000)
+    # Maximum number of users whose risk state is cached for /api/verify_transaction (0 disables caching)
+    RISK_CACHE_SIZE = int(os.environ.get("RISK_CACHE_SIZE") or 100000)
+    # Seconds a cached risk state is trusted; bounds staleness for writes made by other processes
+    RISK_CACHE_TTL = float(os.environ.get("RISK_CACHE_TTL") or 2)
+    # Worker processes used for password hashing (0 hashes on the request thread)
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS") or min(4, os.cpu_count() or 1))
+    # Maximum hashing jobs running or queued at once; further logins are rejected with 503
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING") or 64)
+    # Seconds to wait for a single hashing job
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT") or 10)
+    # Key derivation method passed to werkzeug.security.generate_password_hash
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "scrypt"
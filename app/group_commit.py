@@ -0,0 +1,251 @@
+"""
+Group commit module for the application.
+
+With one transaction per request, every /api/add_balance call pays for its own commit
+(and, depending on the storage profile, its own fsync), which caps write throughput at
+a few hundred requests per second. In group-commit mode (GROUP_COMMIT_ENABLED) request
+threads only enqueue their credit and wait. A single flusher thread per process
+collects the queued credits for up to GROUP_COMMIT_INTERVAL_MS milliseconds or
+GROUP_COMMIT_MAX_BATCH credits and applies them in one transaction with
+apply_balance_batch(), which coalesces them into one UPDATE per account and records one
+ledger entry per credit.
+
+A caller is only answered after the transaction holding its credit has been committed,
+so a successful response still means the write is durable.
+
+Credits sent with an Idempotency-Key carry the request's claim (see app.idempotency):
+the key is inserted together with the response in the transaction that commits the
+credit, so the key is recorded if and only if the credit is. If another process
+recorded the key first, the transaction is rolled back, that credit fails with the
+IntegrityError (its request is then answered with the stored response) and the rest
+of the batch is applied again.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app.balance import apply_balance_batch
+from app.extensions import db
+from app.idempotency import StoredResponse, record_claims, recorded_scopes
+from app.risk_cache import invalidate_risk_state
+from app.models import User
+from app.serializers import serialize_users
+
+# Error returned when a queued credit was not committed within GROUP_COMMIT_TIMEOUT
+CREDIT_PENDING_ERROR = "Credit is still being committed; retry with the same Idempotency-Key for its outcome"
+
+
+class GroupCommitter:
+    """
+    Queues balance credits and commits them in batches on a background thread.
+
+    Args:
+        app (Flask): Application whose context the flusher thread runs in.
+        interval (float): Seconds to wait for further credits once one is queued.
+        max_batch (int): Number of credits that triggers an immediate flush.
+        timeout (float): Seconds a caller waits for its credit to be committed.
+    """
+
+    def __init__(self, app, interval, max_batch, timeout):
+        self.app = app
+        self.interval = interval
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def credit(self, matriculation_number, amount, claim=None):
+        """
+        Queue a credit and block until it is committed.
+
+        ``claim`` is the request's idempotency claim (app.idempotency.group_commit_claim());
+        its key and response are recorded in the transaction of the credit.
+
+        Returns a tuple (new_balance, user_data) with the balance right after this
+        credit, or None if the user does not exist. Raises the error of the failed
+        transaction, or TimeoutError if it was not committed within the timeout (the
+        credit may then still be committed later).
+        """
+        return self.submit(matriculation_number, amount, claim).result(timeout=self.timeout)
+
+    def submit(self, matriculation_number, amount, claim=None):
+        """
+        Queue a credit without waiting for it.
+
+        Returns a Future resolving like credit(). It must not be cancelled; async
+        callers wrap it with asyncio.shield().
+        """
+        future = Future()
+        if claim is not None:
+            claim["future"] = future
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Group commit is shut down")
+            self._pending.append((matriculation_number, amount, future, claim))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if not self._pending and self._stopped:
+                    return
+                # Give concurrent requests a short window to join this batch
+                deadline = time.monotonic() + self.interval
+                while len(self._pending) < self.max_batch and not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """
+        Apply a batch of credits in one transaction and resolve the callers' futures.
+        """
+        rejected = []
+        with self.app.app_context():
+            for attempt in range(2):
+                try:
+                    outcomes, credited = self._apply(batch)
+                    db.session.commit()
+                    break
+                except IntegrityError as e:
+                    db.session.rollback()
+                    if attempt == 0 and any(claim is not None for *_, claim in batch):
+                        # An Idempotency-Key was recorded concurrently: retry without its credit
+                        batch, rejected = self._split_recorded_keys(batch)
+                        error = e
+                        continue
+                    self._fail(batch + rejected, e)
+                    return
+                except Exception as e:
+                    db.session.rollback()
+                    self._fail(batch + rejected, e)
+                    return
+
+        # Fail the duplicates only now, so their requests find the recorded key
+        for _, _, future, _ in rejected:
+            future.set_exception(error)
+        self.batches += 1
+        invalidate_risk_state(*credited)
+        for (_, _, future, claim), outcome in zip(batch, outcomes):
+            if claim is not None and outcome is not None:
+                claim["state"] = "stored"
+            future.set_result(outcome)
+
+    def _apply(self, batch):
+        """
+        Apply the credits and record the Idempotency-Keys of the successful ones in the
+        current transaction.
+
+        Returns a tuple (outcomes, credited): (new_balance, user_data) or None per
+        credit, and the set of credited matriculation numbers.
+        """
+        results = apply_balance_batch([
+            {"matriculationNumber": number, "amount": amount, "type": "credit"}
+            for number, amount, _, _ in batch
+        ])
+        credited = {r["matriculationNumber"] for r in results if r["status"] == "success"}
+        users = User.query.filter(User.matriculationNumber.in_(credited)).all() if credited else []
+        # Serialize before committing, like the single-request path
+        user_data = {user["matriculationNumber"]: user for user in serialize_users(users)}
+
+        outcomes = []
+        claims = []
+        for (_, _, _, claim), result in zip(batch, results):
+            if result["status"] != "success":
+                outcomes.append(None)
+                continue
+            # Report the balance right after this credit, not after the whole batch
+            data = dict(user_data[result["matriculationNumber"]], balance=result["new_balance"])
+            outcomes.append((result["new_balance"], data))
+            if claim is not None:
+                body = self.app.json.dumps(claim["render"](result["new_balance"], data))
+                claim["stored"] = StoredResponse(claim["fingerprint"], 200, body)
+                claims.append(claim)
+        record_claims(claims)
+        return outcomes, credited
+
+    def _split_recorded_keys(self, batch):
+        """
+        Split off the credits whose Idempotency-Key already exists or repeats within
+        the batch. Returns a tuple (remaining, rejected).
+        """
+        recorded = recorded_scopes({claim["scope"] for *_, claim in batch if claim is not None})
+        remaining = []
+        rejected = []
+        for item in batch:
+            claim = item[3]
+            if claim is not None:
+                if claim["scope"] in recorded:
+                    rejected.append(item)
+                    continue
+                recorded.add(claim["scope"])
+            remaining.append(item)
+        return remaining, rejected
+
+    def _fail(self, batch, error):
+        logging.error(f"[{os.getpid()}] Group commit of {len(batch)} credits failed: {error}", exc_info=error)
+        for _, _, future, _ in batch:
+            future.set_exception(error)
+
+    def shutdown(self):
+        """
+        Stop accepting credits, flush the queued ones and stop the flusher thread.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+
+_committer = None
+_committer_lock = threading.Lock()
+
+
+def get_group_committer():
+    """
+    Return the process-wide committer, creating it from the GROUP_COMMIT_* settings.
+    """
+    global _committer
+    if _committer is None:
+        with _committer_lock:
+            if _committer is None:
+                config = current_app.config
+                _committer = GroupCommitter(
+                    current_app._get_current_object(),
+                    config["GROUP_COMMIT_INTERVAL_MS"] / 1000.0,
+                    config["GROUP_COMMIT_MAX_BATCH"],
+                    config["GROUP_COMMIT_TIMEOUT"]
+                )
+    return _committer
+
+
+def shutdown_group_committer():
+    """
+    Flush and stop the committer; the next get_group_committer() call creates a new one.
+    """
+    global _committer
+    with _committer_lock:
+        if _committer is not None:
+            _committer.shutdown()
+            _committer = None
+
+
+# Commit queued credits before the interpreter exits
+atexit.register(shutdown_group_committer)
@@ -0,0 +1,406 @@
+"""
+Idempotency module for the application.
+
+Gateways retry write requests after a timeout, which must not credit an account twice.
+Write endpoints decorated with ``idempotent`` accept an ``Idempotency-Key`` header:
+the first request with a key is executed normally and its response is stored; every
+later request with the same key (on the same endpoint) receives the stored response
+without executing the view, i.e. without touching ``User`` or committing anything.
+A key reused for a different request (method, URL rule, query string or body, see
+request_fingerprint()) is answered with 422 instead.
+
+Stored responses live in a bounded in-memory LRU cache with a time to live
+(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL) backed by the ``idempotency_keys`` table,
+which lets other worker processes and restarted processes find them as well:
+
+- Duplicates arriving at the same moment in one process wait for the first request
+  and receive its response.
+- The key row is inserted in the same transaction as the request's own write (by a
+  ``before_commit`` hook), so a key is recorded if and only if the write is committed.
+  A duplicate that is processed concurrently by another process fails on the primary
+  key and is answered with the stored response, or 409 while the original is still in
+  flight.
+- Group-committed credits (app.group_commit) are not written through the request's
+  session. The view hands its claim to the committer (group_commit_claim()), which
+  inserts the key together with the response in the transaction of the credit, with
+  the same primary-key protection. If the caller stops waiting for a queued credit,
+  duplicates in this process are answered with 409 until the credit is settled, and
+  afterwards with the stored response.
+
+Only responses of requests that committed a write are stored. Rejected requests
+changed nothing and are simply executed again on retry.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, g, has_request_context, jsonify, make_response, request
+from sqlalchemy import delete, event, insert, select, tuple_, update
+from app.models import IdempotencyKey
+from app.extensions import db
+
+# Maximum accepted length of an Idempotency-Key header
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse:
+    """
+    Response recorded for an idempotency key.
+    """
+    __slots__ = ("fingerprint", "status_code", "body")
+
+    def __init__(self, fingerprint, status_code, body):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of StoredResponse records with a per-entry time to live.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, stored):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (stored, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IdempotencyStore:
+    """
+    Coordinates requests that share an idempotency key within this process and stores
+    their responses in the cache and the ``idempotency_keys`` table.
+    """
+
+    def __init__(self, cache_size, ttl, wait_timeout):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.cache = ResponseCache(cache_size, ttl)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def handle(self, scope, fingerprint, view):
+        """
+        Return the stored response for ``scope`` (endpoint, key), or execute ``view``
+        and store its response.
+        """
+        while True:
+            stored = self.cache.get(scope)
+            if stored is not None:
+                return replay(stored, fingerprint)
+
+            with self._lock:
+                pending = self._inflight.get(scope)
+                if pending is None:
+                    pending = self._inflight[scope] = Future()
+                    break
+            # Another thread is executing a request with this key: wait for its outcome
+            try:
+                stored = pending.result(timeout=self.wait_timeout)
+            except TimeoutError:
+                return in_progress()
+            if stored is not None:
+                return replay(stored, fingerprint)
+            # The first request stored nothing (it did not write); try again ourselves
+
+        stored = queued = None
+        try:
+            stored, response, queued = self._execute(scope, fingerprint, view)
+            return response
+        finally:
+            if queued is None:
+                self._release(scope, pending, stored)
+            else:
+                # Keep duplicates waiting until the queued credit is committed or has failed
+                queued["future"].add_done_callback(lambda _: self._settle(scope, pending, queued))
+
+    def _release(self, scope, pending, stored):
+        with self._lock:
+            del self._inflight[scope]
+        pending.set_result(stored)
+
+    def _settle(self, scope, pending, claim):
+        """
+        Release a key whose group-committed credit outlived its request.
+        """
+        stored = claim["stored"] if claim["state"] == "stored" else None
+        if stored is not None:
+            self.cache.put(scope, stored)
+        self._release(scope, pending, stored)
+
+    def _execute(self, scope, fingerprint, view):
+        """
+        Execute the view for the first request with ``scope`` in this process.
+
+        Returns a tuple (stored, response, queued); ``stored`` is None if nothing was
+        recorded, ``queued`` is the claim of a group-committed credit that is still
+        queued after the view returned (None otherwise).
+        """
+        stored = self._load(scope)
+        if stored is not None:
+            return stored, replay(stored, fingerprint), None
+
+        g.idempotency_claim = {"scope": scope, "fingerprint": fingerprint, "state": "pending"}
+        response = make_response(view())
+        claim = g.pop("idempotency_claim")
+
+        if claim["state"] == "stored":
+            # The group committer recorded the key with the response in the credit's transaction
+            stored = claim["stored"]
+        elif "future" in claim and not claim["future"].done():
+            # The view stopped waiting for its queued credit; the committer records the key
+            # if the credit is committed
+            return None, response, claim
+        elif claim["state"] == "committed":
+            # The key row was committed together with the view's write; attach the response
+            stored = StoredResponse(fingerprint, response.status_code, response.get_data(as_text=True))
+            db.session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.endpoint == scope[0], IdempotencyKey.key == scope[1])
+                .values(status_code=stored.status_code, body=stored.body)
+            )
+            db.session.commit()
+        else:
+            # Nothing was committed. If another process committed this key meanwhile,
+            # the view failed on the key's primary key: answer with that request's outcome.
+            other = self._load(scope)
+            if other is not None:
+                return other, replay(other, fingerprint), None
+            return None, response, None
+
+        self.cache.put(scope, stored)
+        return stored, response, None
+
+    def _load(self, scope):
+        """
+        Read a key from the table. Returns a StoredResponse (status_code None while the
+        original request is still being processed) or None. Expired keys are removed.
+        """
+        row = db.session.execute(
+            select(IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+                   IdempotencyKey.body, IdempotencyKey.created_at)
+            .where(IdempotencyKey.endpoint == scope[0], IdempotencyKey.key == scope[1])
+        ).first()
+        if row is None:
+            db.session.rollback()
+            return None
+        if row.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+            db.session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.endpoint == scope[0], IdempotencyKey.key == scope[1])
+            )
+            db.session.commit()
+            return None
+        db.session.rollback()
+        stored = StoredResponse(row.fingerprint, row.status_code, row.body)
+        if stored.status_code is not None:
+            self.cache.put(scope, stored)
+        return stored
+
+
+def replay(stored, fingerprint):
+    """
+    Build the response for a repeated request from a stored response.
+    """
+    if stored.fingerprint != fingerprint:
+        return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+    if stored.status_code is None:
+        return in_progress()
+    response = Response(stored.body, status=stored.status_code, mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def in_progress():
+    """
+    Response for a repeated request whose original request has no outcome yet.
+    """
+    return jsonify({"error": "A request with this Idempotency-Key is still being processed"}), 409, {"Retry-After": "1"}
+
+
+def group_commit_claim(render):
+    """
+    Return the idempotency claim of the current request for GroupCommitter.credit(), or
+    None if the request has no Idempotency-Key.
+
+    ``render(new_balance, user_data)`` must return the response body of a successful
+    credit; the committer stores it with the key in the credit's transaction.
+    """
+    claim = g.get("idempotency_claim") if has_request_context() else None
+    if claim is not None:
+        claim["render"] = render
+    return claim
+
+
+def record_claims(claims):
+    """
+    Insert the keys of group-committed credits with their stored responses into the
+    current transaction. The caller commits; a key that already exists raises
+    IntegrityError.
+    """
+    if not claims:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(IdempotencyKey), [
+        {
+            "endpoint": claim["scope"][0],
+            "key": claim["scope"][1],
+            "fingerprint": claim["fingerprint"],
+            "status_code": claim["stored"].status_code,
+            "body": claim["stored"].body,
+            "created_at": now,
+        }
+        for claim in claims
+    ])
+
+
+def recorded_scopes(scopes):
+    """
+    Return the subset of (endpoint, key) scopes that already have a key row.
+    """
+    if not scopes:
+        return set()
+    rows = db.session.execute(
+        select(IdempotencyKey.endpoint, IdempotencyKey.key)
+        .where(tuple_(IdempotencyKey.endpoint, IdempotencyKey.key).in_(list(scopes)))
+    ).all()
+    db.session.rollback()
+    return {tuple(row) for row in rows}
+
+
+def _claim_key_on_commit(session):
+    """
+    Insert the pending key row of the current request into the committing transaction.
+    """
+    if not has_request_context():
+        return
+    claim = g.get("idempotency_claim")
+    if claim is None or claim["state"] != "pending":
+        return
+    scope = claim["scope"]
+    session.execute(insert(IdempotencyKey).values(
+        endpoint=scope[0], key=scope[1], fingerprint=claim["fingerprint"], created_at=datetime.utcnow()
+    ))
+    claim["state"] = "flushed"
+
+
+def _confirm_claim(session):
+    if has_request_context():
+        claim = g.get("idempotency_claim")
+        if claim is not None and claim["state"] == "flushed":
+            claim["state"] = "committed"
+
+
+def _reset_claim(session, previous_transaction=None):
+    if has_request_context():
+        claim = g.get("idempotency_claim")
+        if claim is not None and claim["state"] == "flushed":
+            claim["state"] = "pending"
+
+
+event.listen(db.session, "before_commit", _claim_key_on_commit)
+event.listen(db.session, "after_commit", _confirm_claim)
+event.listen(db.session, "after_soft_rollback", _reset_claim)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    """
+    Return the process-wide store, creating it from the IDEMPOTENCY_* settings.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = current_app.config
+                _store = IdempotencyStore(
+                    config["IDEMPOTENCY_CACHE_SIZE"],
+                    config["IDEMPOTENCY_TTL"],
+                    config["IDEMPOTENCY_WAIT_TIMEOUT"]
+                )
+    return _store
+
+
+def idempotent(view):
+    """
+    Decorator enabling the Idempotency-Key header on a write endpoint.
+
+    Requests without the header are passed through unchanged.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}), 400
+
+        fingerprint = request_fingerprint()
+        return get_idempotency_store().handle(
+            (request.endpoint, key), fingerprint, lambda: view(*args, **kwargs)
+        )
+    return wrapper
+
+
+def request_fingerprint():
+    """
+    Hash what makes the current request distinct: method, URL rule, query string and
+    body. A key reused with any of them changed is answered with 422, not a replay.
+    """
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    digest = hashlib.sha256()
+    for part in (request.method.encode("utf-8"), rule.encode("utf-8"), request.query_string, request.get_data()):
+        # Length-prefixed, so the parts cannot run into each other
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def prune_idempotency_keys(ttl):
+    """
+    Delete keys older than ``ttl`` seconds. Returns the number of deleted rows; the
+    caller commits the session.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    return db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)).rowcount
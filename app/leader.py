@@ -0,0 +1,152 @@
+"""
+Leader election module for the application.
+
+When the app runs in several worker processes, each of them starts the secret rotation
+scheduler. Only the process holding the leader lease actually rotates secrets; the
+others skip the job and pick up new secrets through the rotation version (see
+app.secrets_cache). Two lease implementations are available:
+
+- FileLease: an exclusive, non-blocking lock on a shared file. Suitable when all workers
+  run on the same host. The lock is released by the OS when the process exits.
+- DatabaseLease: a row in ``scheduler_leases`` holding the leader's identity and an
+  expiry time. Suitable across hosts; a crashed leader is replaced once its lease expires.
+"""
+
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from app.models import SchedulerLease
+from app.extensions import db
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class AlwaysLeader:
+    """
+    Lease that is always held; used when leader election is disabled.
+    """
+
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class FileLease:
+    """
+    Leadership through an exclusive lock on ``path``. Once acquired, the lock is kept
+    for the lifetime of the process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """
+        Try to take the lock without blocking. Returns True if this process is the leader.
+        """
+        if self._file is not None:
+            return True
+
+        handle = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            return False
+
+        # Record the holder for operators; the lock itself is what matters
+        handle.seek(0)
+        handle.truncate()
+        handle.write(f"{socket.gethostname()}:{os.getpid()}\n")
+        handle.flush()
+        self._file = handle
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DatabaseLease:
+    """
+    Leadership through a row in ``scheduler_leases`` that expires after ``ttl`` seconds.
+
+    Every call to acquire() either renews the lease held by this process or takes over
+    an expired one, using a single conditional UPDATE. The ttl must be longer than the
+    interval between calls, otherwise leadership may move between processes.
+    """
+
+    def __init__(self, app, name, ttl):
+        self.app = app
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self):
+        """
+        Renew or take over the lease. Returns True if this process is the leader.
+        """
+        with self.app.app_context():
+            now = datetime.utcnow()
+            expires_at = now + timedelta(seconds=self.ttl)
+            try:
+                result = db.session.execute(
+                    update(SchedulerLease)
+                    .where(
+                        SchedulerLease.name == self.name,
+                        or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now)
+                    )
+                    .values(holder=self.holder, expires_at=expires_at)
+                )
+                if result.rowcount == 0:
+                    # Either another process holds a valid lease or the row does not exist yet
+                    if db.session.get(SchedulerLease, self.name) is not None:
+                        db.session.rollback()
+                        return False
+                    db.session.add(SchedulerLease(name=self.name, holder=self.holder, expires_at=expires_at))
+                db.session.commit()
+                return True
+            except IntegrityError:
+                # Another process created the row first
+                db.session.rollback()
+                return False
+
+    def release(self):
+        """
+        Give up the lease early so another process can take over immediately.
+        """
+        with self.app.app_context():
+            db.session.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+                .values(expires_at=datetime.utcnow())
+            )
+            db.session.commit()
+
+
+def create_leader_lease(app, name="secret_rotation"):
+    """
+    Build the lease configured by SCHEDULER_LEADER_ELECTION ("file", "database" or "none").
+    """
+    strategy = app.config["SCHEDULER_LEADER_ELECTION"]
+    if strategy == "file":
+        return FileLease(app.config["SCHEDULER_LOCK_FILE"])
+    if strategy == "database":
+        return DatabaseLease(app, name, app.config["SCHEDULER_LEASE_TTL"])
+    if strategy == "none":
+        return AlwaysLeader()
+    raise ValueError(f"Unknown SCHEDULER_LEADER_ELECTION strategy: {strategy!r}")
@@ -0,0 +1,175 @@
+"""
+Ledger module for the application.
+
+Every change to ``User.balance`` is also appended to ``ledger_entries`` in the same
+transaction, so the history of an account is never lost. Rows are only ever inserted.
+
+A periodic job condenses the ledger into ``balance_snapshots``: for every account that
+changed since the previous run it stores the balance after its latest entry. The
+balance at any point in time is then the latest snapshot before it plus the few
+entries recorded after that snapshot, which keeps historical lookups cheap no matter
+how large the ledger grows. History pages are read with keyset pagination on the
+(matriculationNumber, timestamp) index, so their cost does not depend on the page
+number either.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, func, insert, literal, select, tuple_
+from app.models import BalanceSnapshot, LedgerEntry, User
+from app.extensions import db
+
+
+def record_entries(entries, session=None):
+    """
+    Append ledger entries in the current transaction.
+
+    Args:
+        entries (list[tuple]): (matriculationNumber, signed amount, kind) per balance change.
+        session: Session to write with (default: db.session); the caller commits it.
+    """
+    if not entries:
+        return
+    session = session or db.session
+    now = datetime.utcnow()
+    session.execute(
+        insert(LedgerEntry.__table__),
+        [
+            {"matriculationNumber": number, "amount": amount, "kind": kind, "timestamp": now}
+            for number, amount, kind in entries
+        ]
+    )
+
+
+def take_balance_snapshots(grace_seconds=0):
+    """
+    Snapshot the balance of every account with ledger entries since the last run.
+
+    Runs as one set-based INSERT ... SELECT: the entries after the newest snapshotted
+    ledger ID are summed per account and added to that account's latest snapshot.
+
+    IDs are assigned when an entry is inserted, not when it is committed: with
+    concurrent writers (anything but SQLite) a transaction holding a lower ID can
+    commit after a higher one is already visible, and would be skipped for good once
+    the watermark passed it. The run therefore stops at the newest entry older than
+    ``grace_seconds``; every transaction is expected to commit within that time.
+    Returns the number of snapshots written. The caller commits the session.
+    """
+    watermark = db.session.execute(
+        select(func.coalesce(func.max(BalanceSnapshot.ledger_entry_id), 0))
+    ).scalar_one()
+    # Entries up to this ID have all been committed (a range scan on the primary key)
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    upper = db.session.execute(
+        select(func.max(LedgerEntry.id)).where(LedgerEntry.id > watermark, LedgerEntry.timestamp <= cutoff)
+    ).scalar_one()
+    if upper is None:
+        return 0
+
+    changes = (
+        select(
+            LedgerEntry.matriculationNumber.label("number"),
+            func.sum(LedgerEntry.amount).label("delta"),
+            func.max(LedgerEntry.id).label("last_id"),
+            func.max(LedgerEntry.timestamp).label("last_at")
+        )
+        .where(LedgerEntry.id > watermark, LedgerEntry.id <= upper)
+        .group_by(LedgerEntry.matriculationNumber)
+        .subquery()
+    )
+    previous = (
+        select(BalanceSnapshot.balance)
+        .where(BalanceSnapshot.matriculationNumber == changes.c.number)
+        .order_by(BalanceSnapshot.taken_at.desc(), BalanceSnapshot.ledger_entry_id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        insert(BalanceSnapshot).from_select(
+            ["matriculationNumber", "balance", "ledger_entry_id", "taken_at"],
+            select(changes.c.number, func.coalesce(previous, 0.0) + changes.c.delta,
+                   changes.c.last_id, changes.c.last_at)
+        )
+    )
+    return result.rowcount
+
+
+def open_ledger_if_needed():
+    """
+    Record opening snapshots for balances that existed before the ledger.
+
+    Runs only while ``balance_snapshots`` is empty, i.e. once, when the ledger is
+    introduced on an existing database. Must be called inside an application context.
+    """
+    if db.session.execute(select(BalanceSnapshot.id).limit(1)).first() is not None:
+        return
+    now = datetime.utcnow()
+    result = db.session.execute(
+        insert(BalanceSnapshot).from_select(
+            ["matriculationNumber", "balance", "ledger_entry_id", "taken_at"],
+            select(User.matriculationNumber, func.coalesce(User.balance, 0.0), literal(0), literal(now, DateTime))
+            .where(func.coalesce(User.balance, 0.0) != 0)
+        )
+    )
+    db.session.commit()
+    if result.rowcount:
+        logging.info(f"Ledger: recorded opening balances for {result.rowcount} users")
+
+
+def balance_at(matriculation_number, at, session=None):
+    """
+    Return the balance of a user as of ``at`` (a naive UTC datetime).
+
+    Finds the latest snapshot taken at or before ``at`` and adds the ledger entries
+    recorded after it, up to ``at``. Accounts without such a snapshot start from 0.
+    """
+    session = session or db.session
+    snapshot = session.execute(
+        select(BalanceSnapshot.balance, BalanceSnapshot.ledger_entry_id, BalanceSnapshot.taken_at)
+        .where(BalanceSnapshot.matriculationNumber == matriculation_number,
+               BalanceSnapshot.taken_at <= at)
+        .order_by(BalanceSnapshot.taken_at.desc(), BalanceSnapshot.ledger_entry_id.desc())
+        .limit(1)
+    ).first()
+
+    # Only the entries between the snapshot and ``at`` are read from the index
+    conditions = [LedgerEntry.matriculationNumber == matriculation_number, LedgerEntry.timestamp <= at]
+    base = 0.0
+    if snapshot is not None:
+        base = snapshot.balance
+        conditions += [LedgerEntry.timestamp >= snapshot.taken_at, LedgerEntry.id > snapshot.ledger_entry_id]
+
+    delta = session.execute(
+        select(func.coalesce(func.sum(LedgerEntry.amount), 0.0)).where(*conditions)
+    ).scalar_one()
+    return base + delta
+
+
+def ledger_page(matriculation_number, limit, cursor=None, session=None):
+    """
+    Return one page of a user's ledger, newest entries first.
+
+    ``cursor`` is the ID of the last entry on the previous page. Pages are read with a
+    keyset condition on (timestamp, id) from the (matriculationNumber, timestamp)
+    index. Returns a tuple (entries, next_cursor); next_cursor is None on the last page.
+    """
+    session = session or db.session
+    query = (
+        select(LedgerEntry)
+        .where(LedgerEntry.matriculationNumber == matriculation_number)
+        .order_by(LedgerEntry.timestamp.desc(), LedgerEntry.id.desc())
+    )
+    if cursor is not None:
+        after = session.execute(
+            select(LedgerEntry.timestamp, LedgerEntry.id)
+            .where(LedgerEntry.id == cursor, LedgerEntry.matriculationNumber == matriculation_number)
+        ).first()
+        if after is None:
+            return [], None
+        query = query.where(tuple_(LedgerEntry.timestamp, LedgerEntry.id) < tuple_(after.timestamp, after.id))
+
+    # Fetch one extra row to find out whether another page exists
+    entries = session.execute(query.limit(limit + 1)).scalars().all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return entries, entries[-1].id if has_more else None
@@ -0,0 +1,419 @@
+"""
+Metrics module for the application.
+
+Keeps low-overhead in-process counters, gauges and histograms and renders them in the
+Prometheus text format for GET /metrics:
+
+- request latency per route, method and status
+- SQL statements and database time per request, recorded with SQLAlchemy engine
+  events (statements run outside a request, e.g. by the scheduler, are counted apart)
+- duration and failures of the scheduler jobs and rows written by secret rotations
+- hits and misses of the in-memory caches (risk state, secrets snapshot, idempotency
+  keys), from which hit ratios are derived in the query, e.g.
+  ``rate(studipay_cache_hits_total[5m]) / (rate(studipay_cache_hits_total[5m]) + rate(studipay_cache_misses_total[5m]))``
+
+Every worker process only updates its own metrics. To answer /metrics for all of them,
+each process writes its values to ``<METRICS_DIR>/<pid>.json`` at most every
+METRICS_FLUSH_INTERVAL seconds (after a request or a scheduler job), and /metrics sums
+the files of all live processes. Files of processes that have exited are removed, so
+their counters disappear; Prometheus treats this like a counter reset.
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets for the number of SQL statements per request
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Buckets for scheduler job durations in seconds
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Metric:
+    """
+    Base class of a metric family: a name, a help text and a fixed set of label names.
+    Values are kept per tuple of label values.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def export(self):
+        """
+        Return this family as a JSON-serializable dict (see write_metrics_file()).
+        """
+        with self._lock:
+            samples = [[list(labels), value] for labels, value in self._values.items()]
+        return {"type": self.type, "help": self.documentation, "labelnames": list(self.labelnames),
+                "samples": samples}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set_total(self, value, *labels):
+        """
+        Mirror a total that is counted elsewhere (e.g. a cache's own hit counter).
+        """
+        with self._lock:
+            self._values[labels] = float(value)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = float(value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Per-bucket (not cumulative) counts plus one overflow slot; cumulated on export
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def export(self):
+        with self._lock:
+            samples = [[list(labels), list(counts), total] for labels, (counts, total) in self._values.items()]
+        return {"type": self.type, "help": self.documentation, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets), "samples": samples}
+
+
+REGISTRY = []
+
+REQUEST_LATENCY = Histogram(
+    "studipay_request_duration_seconds", "Request latency by route.", ("route", "method", "status")
+)
+REQUEST_STATEMENTS = Histogram(
+    "studipay_db_statements_per_request", "SQL statements executed per request.", ("route",),
+    buckets=STATEMENT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    "studipay_db_seconds_per_request", "Time spent executing SQL statements per request.", ("route",)
+)
+BACKGROUND_STATEMENTS = Counter(
+    "studipay_db_background_statements_total", "SQL statements executed outside requests."
+)
+BACKGROUND_DB_TIME = Counter(
+    "studipay_db_background_seconds_total", "Time spent executing SQL statements outside requests."
+)
+JOB_DURATION = Histogram(
+    "studipay_scheduler_job_duration_seconds", "Duration of successful scheduler job runs.", ("job",),
+    buckets=JOB_BUCKETS
+)
+JOB_FAILURES = Counter(
+    "studipay_scheduler_job_failures_total", "Failed scheduler job runs.", ("job",)
+)
+SECRET_ROTATION_ROWS = Counter(
+    "studipay_secret_rotation_rows_written_total", "Secret rows written by secret rotations."
+)
+CACHE_HITS = Counter("studipay_cache_hits_total", "Lookups answered from an in-memory cache.", ("cache",))
+CACHE_MISSES = Counter("studipay_cache_misses_total", "Lookups that had to go to the database.", ("cache",))
+CACHE_ENTRIES = Gauge("studipay_cache_entries", "Entries held by an in-memory cache.", ("cache",))
+REQUESTS_IN_FLIGHT = Gauge("studipay_requests_in_flight", "Requests admitted and still executing.")
+
+
+def collect_process_metrics():
+    """
+    Copy values kept by other modules into the registry before it is exported.
+    """
+    from app import admission, idempotency, risk_cache
+
+    for name, cache in (("risk_state", risk_cache._cache),
+                        ("idempotency", idempotency._store.cache if idempotency._store else None)):
+        if cache is not None:
+            CACHE_HITS.set_total(cache.hits, name)
+            CACHE_MISSES.set_total(cache.misses, name)
+            CACHE_ENTRIES.set(len(cache), name)
+    if admission._controller is not None:
+        REQUESTS_IN_FLIGHT.set(admission._controller.in_flight)
+
+
+def export_metrics():
+    """
+    Return this process's metrics as a dict of name -> exported family.
+    """
+    collect_process_metrics()
+    return {metric.name: metric.export() for metric in REGISTRY}
+
+
+def reset_metrics():
+    for metric in REGISTRY:
+        metric.reset()
+
+
+# A forked worker must not report the values its parent recorded before the fork
+os.register_at_fork(after_in_child=reset_metrics)
+
+
+# Per-request [statement count, seconds]; None outside of requests
+_request_sql = ContextVar("request_sql", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _request_sql.get()
+    if stats is None:
+        BACKGROUND_STATEMENTS.inc()
+        BACKGROUND_DB_TIME.inc(amount=elapsed)
+    else:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute: drop its start time
+    conn = exception_context.connection
+    if conn is not None and exception_context.statement is not None:
+        started = conn.info.get("query_started")
+        if started:
+            started.pop()
+
+
+def start_request_metrics():
+    """
+    Start measuring a request. Returns a token for finish_request_metrics().
+    """
+    return time.perf_counter(), _request_sql.set([0, 0.0])
+
+
+def finish_request_metrics(token, route, method, status):
+    """
+    Record latency and SQL statistics of a request started with start_request_metrics().
+    """
+    started, sql_token = token
+    REQUEST_LATENCY.observe(time.perf_counter() - started, route, method, str(status))
+    statements, seconds = _request_sql.get()
+    _request_sql.reset(sql_token)
+    REQUEST_STATEMENTS.observe(statements, route)
+    REQUEST_DB_TIME.observe(seconds, route)
+    maybe_flush_metrics()
+
+
+def discard_request_metrics(token):
+    """
+    Stop measuring a request without recording it.
+    """
+    _request_sql.reset(token[1])
+
+
+def observe_job(job, started, failed=False):
+    """
+    Record a scheduler job run that began at ``started`` (time.perf_counter()).
+    """
+    if failed:
+        JOB_FAILURES.inc(job)
+    else:
+        JOB_DURATION.observe(time.perf_counter() - started, job)
+    maybe_flush_metrics()
+
+
+_metrics_dir = None
+_flush_interval = 5.0
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def configure_metrics(metrics_dir, flush_interval):
+    """
+    Set where and how often this process publishes its metrics ("" or None: not at all).
+    """
+    global _metrics_dir, _flush_interval
+    _metrics_dir = metrics_dir or None
+    _flush_interval = flush_interval
+    if _metrics_dir:
+        os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def maybe_flush_metrics():
+    """
+    Write this process's metrics file if the flush interval has passed.
+    """
+    global _last_flush
+    if _metrics_dir is None or time.monotonic() - _last_flush < _flush_interval:
+        return
+    # Only one thread writes; the others carry on without waiting
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = time.monotonic()
+        write_metrics_file()
+    finally:
+        _flush_lock.release()
+
+
+def write_metrics_file():
+    """
+    Atomically replace ``<METRICS_DIR>/<pid>.json`` with this process's metrics.
+    """
+    path = os.path.join(_metrics_dir, f"{os.getpid()}.json")
+    temporary = path + ".tmp"
+    with open(temporary, "w") as handle:
+        json.dump(export_metrics(), handle)
+    os.replace(temporary, path)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect_all_processes():
+    """
+    Return the exported metrics of every live worker process, this one included.
+    """
+    exports = [export_metrics()]
+    if _metrics_dir is None:
+        return exports
+    for path in glob.glob(os.path.join(_metrics_dir, "*.json")):
+        pid = int(os.path.basename(path)[:-len(".json")])
+        if pid == os.getpid():
+            continue
+        if not process_alive(pid):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path) as handle:
+                exports.append(json.load(handle))
+        except (OSError, ValueError):
+            # Being replaced right now; it will be complete on the next scrape
+            continue
+    return exports
+
+
+def merge_exports(exports):
+    """
+    Sum the samples of several processes per metric family and label values.
+    """
+    merged = {}
+    for export in exports:
+        for name, family in export.items():
+            target = merged.setdefault(name, dict(family, samples={}))
+            samples = target["samples"]
+            for sample in family["samples"]:
+                labels = tuple(sample[0])
+                if family["type"] == "histogram":
+                    counts, total = samples.get(labels, ([0] * len(sample[1]), 0.0))
+                    samples[labels] = ([a + b for a, b in zip(counts, sample[1])], total + sample[2])
+                else:
+                    samples[labels] = samples.get(labels, 0.0) + sample[1]
+    return merged
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render_metrics():
+    """
+    Return the metrics of all worker processes in the Prometheus text format.
+    """
+    lines = []
+    for name, family in sorted(merge_exports(collect_all_processes()).items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        names = family["labelnames"]
+        for labels, value in sorted(family["samples"].items()):
+            if family["type"] != "histogram":
+                lines.append(f"{name}{format_labels(names, labels)} {format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(family["buckets"] + ["+Inf"], counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else format_value(bound)
+                lines.append(f"{name}_bucket{format_labels(names, labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(names, labels)} {format_value(total)}")
+            lines.append(f"{name}_count{format_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def init_metrics(app):
+    """
+    Record latency and SQL statistics for every request of ``app`` (unless METRICS_ENABLED is off).
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return
+    configure_metrics(app.config["METRICS_DIR"], app.config["METRICS_FLUSH_INTERVAL"])
+    # Listen on the Engine class, so the read engine and the async engines are covered too
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_token = start_request_metrics()
+
+    @app.after_request
+    def record_request(response):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            finish_request_metrics(token, route, request.method, response.status_code)
+        return response
+
+    @app.teardown_request
+    def discard_request_timer(exc=None):
+        # Only left over if the request ended with an exception that skipped after_request
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            discard_request_metrics(token)
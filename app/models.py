@@ -35,8 +35,10 @@ class User(db.Model):
     bank_code = db.Column(db.String(20), db.ForeignKey('banks.bank_code'), nullable=True)
 
     # New fields for transaction monitoring and risk management:
-    # Count of transactions performed today
+    # Count of transactions performed on daily_transaction_day
     daily_transaction_count = db.Column(db.Integer, default=0)
+    # UTC day the daily transaction count belongs to; the count reads as 0 on later days
+    daily_transaction_day = db.Column(db.Date, nullable=True)
     # Timestamp of the last successful transaction
     last_transaction_date = db.Column(db.DateTime, nullable=True)
     # Number of transactions aborted due to high risk
@@ -47,10 +49,24 @@ class User(db.Model):
     # Relationship to the Bank model for easy access
     bank = db.relationship("Bank", backref=db.backref("users", lazy=True))
 
-    def as_dict(self):
+    def as_dict(self, bank_map=None, fields=None):
         """
         Return a dictionary representation of the user, including related bank data.
+
+        If ``bank_map`` (bank_code -> serialized bank) is given, the nested bank is taken
+        from it instead of lazily loading the relationship. If ``fields`` (names from
+        USER_FIELDS) is given, only those keys are serialized and only their columns are
+        read, so users loaded with load_only() and without their bank can be serialized.
         """
+        if fields is not None:
+            data = {}
+            for field in fields:
+                if field == "bank":
+                    data["bank"] = self._bank_dict(bank_map)
+                else:
+                    data[field] = USER_FIELDS[field][1](self)
+            return data
+
         data = {
             "matriculationNumber": self.matriculationNumber,
             "lastName": self.lastName,
@@ -60,7 +76,7 @@ class User(db.Model):
             "password": self.password,
             "securePin": self.securePin,
             "bank_code": self.bank_code,
-            "dailyTransactionCount": self.daily_transaction_count,
+            "dailyTransactionCount": self.current_daily_transaction_count(),
             "lastTransactionDate": (
                 self.last_transaction_date.isoformat()
                 if self.last_transaction_date else None
@@ -69,9 +85,25 @@ class User(db.Model):
             "lastTransactionRiskValue": self.last_transaction_risk_value,
         }
         # Include nested bank data if available
-        data["bank"] = self.bank.as_dict() if self.bank else None
+        data["bank"] = self._bank_dict(bank_map)
         return data
 
+    def _bank_dict(self, bank_map):
+        if bank_map is not None:
+            return bank_map.get(self.bank_code)
+        return self.bank.as_dict() if self.bank else None
+
+    def current_daily_transaction_count(self, today=None):
+        """
+        Return the daily transaction count as seen on ``today`` (defaults to the UTC date).
+        """
+        return effective_daily_transaction_count(
+            self.daily_transaction_count,
+            self.daily_transaction_day,
+            self.last_transaction_date,
+            today
+        )
+
     def __repr__(self):
         """
         Return a developer-friendly string representation of the user.
@@ -79,6 +111,54 @@ class User(db.Model):
         return f"<User {self.matriculationNumber} - {self.firstName} {self.lastName}>"
 
 
+# Serialized user fields (keys of User.as_dict()) -> (columns they are read from, getter).
+# Getters only read their columns, so they also work on rows selecting those columns.
+# The nested "bank" is read through the bank_code column and the relationship.
+USER_FIELDS = {
+    "matriculationNumber": (("matriculationNumber",), lambda user: user.matriculationNumber),
+    "lastName": (("lastName",), lambda user: user.lastName),
+    "firstName": (("firstName",), lambda user: user.firstName),
+    "accountNumber": (("accountNumber",), lambda user: user.accountNumber),
+    "balance": (("balance",), lambda user: user.balance),
+    "password": (("password",), lambda user: user.password),
+    "securePin": (("securePin",), lambda user: user.securePin),
+    "bank_code": (("bank_code",), lambda user: user.bank_code),
+    "dailyTransactionCount": (
+        ("daily_transaction_count", "daily_transaction_day", "last_transaction_date"),
+        lambda user: effective_daily_transaction_count(
+            user.daily_transaction_count, user.daily_transaction_day, user.last_transaction_date
+        )
+    ),
+    "lastTransactionDate": (
+        ("last_transaction_date",),
+        lambda user: user.last_transaction_date.isoformat() if user.last_transaction_date else None
+    ),
+    "highRiskAbortedCount": (("high_risk_aborted_count",), lambda user: user.high_risk_aborted_count),
+    "lastTransactionRiskValue": (("last_transaction_risk_value",), lambda user: user.last_transaction_risk_value),
+    "bank": (("bank_code",), None),
+}
+
+
+def effective_daily_transaction_count(count, day, last_transaction_date=None, today=None):
+    """
+    Return a stored daily transaction count as it applies to ``today``.
+
+    Counters are stored together with the day they belong to and are treated as reset
+    once that day has passed, so no global reset job is needed. Rows written before the
+    day was tracked fall back to the day of their last transaction.
+    """
+    today = today or datetime.utcnow().date()
+    if day is None and last_transaction_date is not None:
+        day = last_transaction_date.date()
+    if day is not None and day != today:
+        return 0
+    return count or 0
+
+
+# Number of secret codes kept per bank
+SECRETS_PER_BANK = 6
+
+
 def generate_secret_code():
     """
     Generate a random 6-character alphanumeric secret code.
@@ -89,9 +169,9 @@ def generate_secret_code():
 
 def get_current_timestamp():
     """
-    Return the current UTC timestamp as an ISO-formatted string.
+    Return the current UTC timestamp.
     """
-    return datetime.utcnow().isoformat()
+    return datetime.utcnow()
 
 
 class Bank(db.Model):
@@ -131,6 +211,10 @@ class BankSecret(db.Model):
     Stores a single secret code generated for a bank, with a timestamp.
     """
     __tablename__ = 'bank_secrets'
+    # Composite index for validating a code of a bank; also serves per-bank lookups
+    __table_args__ = (
+        db.Index("ix_bank_secrets_bank_code_secret", "bank_code", "secret"),
+    )
 
     # Auto-incremented primary key
     id = db.Column(db.Integer, primary_key=True)
@@ -138,8 +222,8 @@ class BankSecret(db.Model):
     bank_code = db.Column(db.String(20), db.ForeignKey('banks.bank_code'), nullable=False)
     # The 6-character secret code
     secret = db.Column(db.String(6), nullable=False)
-    # ISO-formatted timestamp when this code was generated
-    generated_at = db.Column(db.String(30), nullable=False)
+    # UTC timestamp when this code was generated
+    generated_at = db.Column(db.DateTime, nullable=False)
 
     def as_dict(self):
         """
@@ -147,27 +231,136 @@ class BankSecret(db.Model):
         """
         return {
             "secret": self.secret,
-            "generated_at": self.generated_at
+            "generated_at": self.generated_at.isoformat()
         }
 
 
-class ResetInfo(db.Model):
+class SchedulerLease(db.Model):
     """
-    Tracks when system-wide reset operations were last performed.
+    Time-limited lease used to elect a single scheduler leader across worker processes.
     """
-    __tablename__ = "reset_info"
+    __tablename__ = "scheduler_leases"
 
-    # Auto-incremented primary key
+    # Name of the leased role, e.g. "secret_rotation"
+    name = db.Column(db.String(50), primary_key=True)
+    # Identifier of the process currently holding the lease
+    holder = db.Column(db.String(100), nullable=False)
+    # Time after which other processes may take over the lease
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class SchemaVersion(db.Model):
+    """
+    Singleton record (ID=1) holding the schema version (app.schema.SCHEMA_VERSION) the
+    database was last created or upgraded to, so startup can skip the schema checks.
+    """
+    __tablename__ = "schema_version"
+
+    # Always 1
     id = db.Column(db.Integer, primary_key=True)
-    # Timestamp of the last reset operation
-    last_reset = db.Column(
-        db.DateTime,
-        nullable=False,
-        default=datetime.utcnow
+    # SCHEMA_VERSION of the application that last created or upgraded the schema
+    version = db.Column(db.Integer, nullable=False)
+    # UTC timestamp of that creation or upgrade
+    upgraded_at = db.Column(db.DateTime, nullable=False)
+
+
+class SecretRotationState(db.Model):
+    """
+    Singleton record (ID=1) whose version is incremented after every completed secret
+    rotation, so other processes can detect new secrets with a primary-key lookup.
+    """
+    __tablename__ = "secret_rotation_state"
+
+    # Always 1
+    id = db.Column(db.Integer, primary_key=True)
+    # Incremented once per completed rotation
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # Timestamp of the last completed rotation
+    rotated_at = db.Column(db.DateTime, nullable=True)
+
+
+class LedgerEntry(db.Model):
+    """
+    Append-only record of a single change to a user's balance. Rows are never updated
+    or deleted; the balance at any point in time is a BalanceSnapshot plus the entries
+    recorded after it.
+    """
+    __tablename__ = "ledger_entries"
+    # History and range scans per user in time order
+    __table_args__ = (
+        db.Index("ix_ledger_entries_user_timestamp", "matriculationNumber", "timestamp"),
     )
 
-    def __repr__(self):
+    # Auto-incremented primary key; increases in insert order, which is only guaranteed to
+    # be the commit order with a single writer (see ledger.take_balance_snapshots)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # The user whose balance changed
+    matriculationNumber = db.Column(db.String(10), nullable=False)
+    # Signed change applied to the balance (positive for credits)
+    amount = db.Column(db.Float, nullable=False)
+    # Origin of the change: "credit", "debit" or "adjustment"
+    kind = db.Column(db.String(20), nullable=False)
+    # UTC timestamp of the change
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    def as_dict(self):
         """
-        Return a developer-friendly string representation of the reset info.
+        Return a dictionary representation of the ledger entry.
         """
-        return f"<ResetInfo last_reset={self.last_reset.isoformat()}>"
+        return {
+            "id": self.id,
+            "matriculationNumber": self.matriculationNumber,
+            "amount": self.amount,
+            "kind": self.kind,
+            "timestamp": self.timestamp.isoformat()
+        }
+
+
+class BalanceSnapshot(db.Model):
+    """
+    A user's balance after all ledger entries up to ``ledger_entry_id``. Written
+    periodically by the snapshot job, so historical balances only need a short range
+    scan of the ledger. Opening snapshots (ledger_entry_id 0) record balances that
+    existed before the ledger was introduced.
+    """
+    __tablename__ = "balance_snapshots"
+    # Latest snapshot of a user at or before a point in time
+    __table_args__ = (
+        db.Index("ix_balance_snapshots_user_taken_at", "matriculationNumber", "taken_at"),
+    )
+
+    # Auto-incremented primary key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # The user this snapshot belongs to
+    matriculationNumber = db.Column(db.String(10), nullable=False)
+    # Balance after the last included ledger entry
+    balance = db.Column(db.Float, nullable=False)
+    # ID of the last ledger entry included in the balance (0 for opening snapshots)
+    ledger_entry_id = db.Column(db.Integer, nullable=False)
+    # Timestamp of the last included ledger entry; the balance is valid as of this time
+    taken_at = db.Column(db.DateTime, nullable=False)
+
+
+class IdempotencyKey(db.Model):
+    """
+    Stored response of a write request sent with an Idempotency-Key header, so that
+    retries of the same request can be answered without executing it again.
+    """
+    __tablename__ = "idempotency_keys"
+    # Expired keys are pruned by age
+    __table_args__ = (
+        db.Index("ix_idempotency_keys_created_at", "created_at"),
+    )
+
+    # Endpoint the key was used with; keys are scoped per endpoint
+    endpoint = db.Column(db.String(100), primary_key=True)
+    # Client-supplied Idempotency-Key header value
+    key = db.Column(db.String(255), primary_key=True)
+    # SHA-256 of the request body; a reused key with another body is rejected
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # HTTP status of the stored response (NULL while the request is still being processed)
+    status_code = db.Column(db.Integer, nullable=True)
+    # Body of the stored response
+    body = db.Column(db.Text, nullable=True)
+    # UTC timestamp of the first request with this key
+    created_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,180 @@
+"""
+Password hashing module for the application.
+
+Key derivation (scrypt / pbkdf2 via werkzeug.security) is deliberately expensive. Running
+it on the request thread would tie up the web workers during sign-in peaks, so hashing
+and verification are offloaded to a bounded process pool. Requests beyond the pool's
+queue depth are rejected immediately with PasswordPoolSaturated instead of piling up,
+and jobs that do not finish within PASSWORD_HASH_TIMEOUT raise PasswordHashTimeout, a
+subclass that callers answer the same way (503 with Retry-After).
+"""
+
+import hashlib
+import hmac
+import itertools
+import multiprocessing
+import string
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Prefixes of the hash formats produced by werkzeug.security
+HASH_PREFIXES = ("scrypt:", "pbkdf2:")
+
+
+class PasswordPoolSaturated(Exception):
+    """
+    Raised when the hashing pool already has the maximum number of pending jobs.
+    """
+
+
+class PasswordHashTimeout(PasswordPoolSaturated):
+    """
+    Raised when a hashing job does not finish within the timeout (the pool is overloaded).
+    """
+
+
+def is_password_hash(value):
+    """
+    Return True if ``value`` is a werkzeug password hash rather than a legacy plaintext password.
+    """
+    return isinstance(value, str) and value.startswith(HASH_PREFIXES)
+
+
+def is_valid_password_hash(value):
+    """
+    Return True if ``value`` is a well-formed werkzeug password hash, i.e. a method with
+    valid parameters, a salt and a hex digest that check_password_hash() can verify.
+    """
+    if not is_password_hash(value) or value.count("$") != 2:
+        return False
+    method, salt, digest = value.split("$")
+    if not salt or not digest or not all(character in string.hexdigits for character in digest):
+        return False
+    name, *args = method.split(":")
+    try:
+        if name == "scrypt":
+            return len(args) == 3 and all(int(arg) > 0 for arg in args)
+        # pbkdf2[:digest[:iterations]]
+        if len(args) > 2 or (len(args) == 2 and int(args[1]) <= 0):
+            return False
+        hashlib.new(args[0] if args else "sha256")
+        return True
+    except ValueError:
+        return False
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a bounded process pool.
+
+    Args:
+        workers (int): Number of worker processes; 0 runs the work inline (e.g. for development).
+        max_pending (int): Maximum number of jobs running or queued at once.
+        timeout (float): Seconds to wait for a single job.
+        method (str): Hash method passed to generate_password_hash.
+    """
+
+    def __init__(self, workers, max_pending, timeout, method):
+        self.workers = workers
+        self.timeout = timeout
+        self.method = method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        if workers > 0:
+            # Spawn instead of fork: forking a multi-threaded web process is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolSaturated()
+        try:
+            if self._executor is None:
+                return func(*args)
+            return self._executor.submit(func, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHashTimeout() from None
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """
+        Return a salted hash of ``password``.
+        """
+        return self._run(generate_password_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """
+        Return salted hashes of ``passwords``, in order, computed in parallel on all
+        workers. The whole batch occupies a single pending slot.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolSaturated()
+        try:
+            if self._executor is None:
+                return [generate_password_hash(password, self.method) for password in passwords]
+            # Larger chunks save inter-process round trips while keeping all workers busy
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            rounds = -(-len(passwords) // self.workers)
+            return list(self._executor.map(
+                generate_password_hash, passwords, itertools.repeat(self.method, len(passwords)),
+                timeout=self.timeout * max(1, rounds), chunksize=chunksize
+            ))
+        except TimeoutError:
+            raise PasswordHashTimeout() from None
+        finally:
+            self._slots.release()
+
+    def verify(self, stored, password):
+        """
+        Check ``password`` against a stored value. Legacy plaintext values are compared
+        in constant time without using the pool. A stored value that only looks like a
+        hash (a malformed hash, or plaintext starting with a hash prefix) never matches.
+        """
+        if not is_password_hash(stored):
+            return hmac.compare_digest(str(stored).encode("utf-8"), password.encode("utf-8"))
+        try:
+            return self._run(check_password_hash, stored, password)
+        except ValueError:
+            return False
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    """
+    Return the process-wide hasher, creating it from the PASSWORD_HASH_* settings.
+    """
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                config = current_app.config
+                _hasher = PasswordHasher(
+                    config["PASSWORD_HASH_WORKERS"],
+                    config["PASSWORD_HASH_MAX_PENDING"],
+                    config["PASSWORD_HASH_TIMEOUT"],
+                    config["PASSWORD_HASH_METHOD"]
+                )
+    return _hasher
+
+
+def shutdown_password_hasher():
+    """
+    Stop the worker processes; the next get_password_hasher() call creates a new pool.
+    """
+    global _hasher
+    with _hasher_lock:
+        if _hasher is not None:
+            _hasher.shutdown()
+            _hasher = None
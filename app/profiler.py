@@ -0,0 +1,330 @@
+"""
+Request profiler module for the application.
+
+Profiles individual requests with cProfile and records the SQL statements they run,
+so slow /api/users or /api/update_user calls can be analyzed after the fact. A request
+is profiled when
+
+- it carries an ``X-Profile`` header holding PROFILER_TOKEN, or
+- runtime profiling was switched on with POST /api/admin/profiler (optionally for one
+  route, for a limited time, for a sample of requests and/or only keeping requests
+  slower than a threshold), or
+- slow-request capture is configured (PROFILER_SLOW_MS): a PROFILER_SAMPLE_RATE
+  sample of all requests is profiled and kept if slower than the threshold.
+
+Each captured request is written to PROFILER_DIR as ``<name>.prof`` (load it with
+pstats or snakeviz) and ``<name>.json`` (request, timings, the most expensive
+functions and the SQL statements with their durations; bound parameters are not
+stored, as they may hold passwords). The directory is a ring buffer of at most
+PROFILER_MAX_CAPTURES captures.
+
+cProfile allows only one active profiler per process (from Python 3.12 on), so a
+process profiles one request at a time: requests arriving while another one is being
+profiled are served without a capture.
+
+The runtime switch is stored in ``<PROFILER_DIR>/state.json`` and re-read by every
+worker process at most once per second. When nothing is enabled, a request only pays
+for one comparison and, if a token is configured, one header lookup.
+"""
+
+import cProfile
+import glob
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Header that requests profiling of a single request
+PROFILE_HEADER = "X-Profile"
+# Seconds between two checks of the runtime state file
+STATE_CHECK_INTERVAL = 1.0
+# Number of functions listed in a capture's summary
+TOP_FUNCTIONS = 25
+
+
+class ProfilerState:
+    """
+    Runtime profiling switch set through the admin endpoint.
+    """
+    __slots__ = ("until", "route", "sample_rate", "threshold_ms")
+
+    def __init__(self, until=0.0, route=None, sample_rate=1.0, threshold_ms=0.0):
+        self.until = until
+        self.route = route
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+
+    def active(self):
+        return self.until > time.time()
+
+    def as_dict(self):
+        return {
+            "active": self.active(),
+            "until": datetime.utcfromtimestamp(self.until).isoformat() if self.until else None,
+            "route": self.route,
+            "sample_rate": self.sample_rate,
+            "threshold_ms": self.threshold_ms,
+        }
+
+
+class Capture:
+    """
+    Profile and SQL statements of one request being profiled.
+    """
+    __slots__ = ("reason", "threshold_ms", "started", "profile", "statements")
+
+    def __init__(self, reason, threshold_ms):
+        self.reason = reason
+        self.threshold_ms = threshold_ms
+        self.statements = []
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        _active_capture.release()
+
+
+# The capture of the request running in this context, if it is being profiled
+_capture = ContextVar("profiler_capture", default=None)
+# Held while a request of this process is being profiled
+_active_capture = threading.Lock()
+
+_state = ProfilerState()
+_state_mtime = None
+_state_checked = 0.0
+_state_lock = threading.Lock()
+
+
+def state_path(directory):
+    return os.path.join(directory, "state.json")
+
+
+def load_state(directory):
+    """
+    Return the runtime state, re-reading the state file at most once per second.
+    """
+    global _state, _state_mtime, _state_checked
+    now = time.monotonic()
+    if now - _state_checked < STATE_CHECK_INTERVAL:
+        return _state
+    with _state_lock:
+        if now - _state_checked < STATE_CHECK_INTERVAL:
+            return _state
+        _state_checked = now
+        try:
+            mtime = os.stat(state_path(directory)).st_mtime
+        except FileNotFoundError:
+            _state, _state_mtime = ProfilerState(), None
+            return _state
+        if mtime != _state_mtime:
+            try:
+                with open(state_path(directory)) as handle:
+                    _state = ProfilerState(**json.load(handle))
+                _state_mtime = mtime
+            except (OSError, ValueError, TypeError):
+                # Being replaced right now; read it again on the next check
+                _state_checked = 0.0
+    return _state
+
+
+def save_state(directory, state):
+    """
+    Publish a new runtime state to all worker processes.
+    """
+    global _state_checked
+    os.makedirs(directory, exist_ok=True)
+    temporary = state_path(directory) + f".{os.getpid()}.tmp"
+    with open(temporary, "w") as handle:
+        json.dump({name: getattr(state, name) for name in ProfilerState.__slots__}, handle)
+    os.replace(temporary, state_path(directory))
+    # Let this process pick it up immediately
+    _state_checked = 0.0
+
+
+def valid_token(value, token):
+    return bool(token) and value is not None and hmac.compare_digest(value.encode("utf-8"), token.encode("utf-8"))
+
+
+def start_capture(reason, threshold_ms):
+    """
+    Start profiling the current request. Returns a Capture, or None if another request
+    of this process is being profiled or another profiling tool is active.
+    """
+    if not _active_capture.acquire(blocking=False):
+        return None
+    try:
+        return Capture(reason, threshold_ms)
+    except ValueError:
+        # "Another profiling tool is already active"
+        _active_capture.release()
+        return None
+
+
+def choose_capture(config, path, header_value):
+    """
+    Decide whether the current request is profiled. Returns a Capture or None.
+    """
+    if header_value is not None and valid_token(header_value, config["PROFILER_TOKEN"]):
+        return start_capture("header", 0.0)
+    state = load_state(config["PROFILER_DIR"])
+    if state.until and state.active() and (state.route is None or state.route == path):
+        if random.random() < state.sample_rate:
+            return start_capture("runtime", state.threshold_ms)
+        return None
+    if config["PROFILER_SLOW_MS"] > 0 and random.random() < config["PROFILER_SAMPLE_RATE"]:
+        return start_capture("slow", config["PROFILER_SLOW_MS"])
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _capture.get() is not None:
+        conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    capture = _capture.get()
+    if capture is not None:
+        elapsed = time.perf_counter() - conn.info["profiler_started"].pop()
+        capture.statements.append({
+            "statement": statement,
+            "executemany": executemany,
+            "duration_ms": round(elapsed * 1000, 3),
+        })
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute: drop its start time
+    conn = exception_context.connection
+    if conn is not None and exception_context.statement is not None and _capture.get() is not None:
+        started = conn.info.get("profiler_started")
+        if started:
+            started.pop()
+
+
+def finish_capture(capture, directory, max_captures, method, path, status):
+    """
+    Stop profiling a request and store it if it was slow enough.
+    """
+    capture.stop()
+    duration_ms = (time.perf_counter() - capture.started) * 1000
+    if duration_ms < capture.threshold_ms:
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}-{slug}"
+    capture.profile.dump_stats(os.path.join(directory, name + ".prof"))
+
+    summary = io.StringIO()
+    pstats.Stats(capture.profile, stream=summary).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    metadata = {
+        "name": name,
+        "reason": capture.reason,
+        "method": method,
+        "path": path,
+        "status": status,
+        "duration_ms": round(duration_ms, 3),
+        "sql_count": len(capture.statements),
+        "sql_ms": round(sum(statement["duration_ms"] for statement in capture.statements), 3),
+        "captured_at": datetime.utcnow().isoformat(),
+        "top_functions": summary.getvalue(),
+        "sql": capture.statements,
+    }
+    with open(os.path.join(directory, name + ".json"), "w") as handle:
+        json.dump(metadata, handle, indent=1)
+    prune_captures(directory, max_captures)
+    return name
+
+
+def prune_captures(directory, max_captures):
+    """
+    Delete the oldest captures beyond ``max_captures``.
+    """
+    names = sorted(os.path.basename(path)[:-len(".json")] for path in glob.glob(os.path.join(directory, "*-*.json")))
+    for name in names[:max(0, len(names) - max_captures)]:
+        for extension in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures(directory):
+    """
+    Return the metadata of the stored captures, newest first, without SQL and summaries.
+    """
+    captures = []
+    for path in sorted(glob.glob(os.path.join(directory, "*-*.json")), reverse=True):
+        try:
+            with open(path) as handle:
+                metadata = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        captures.append({key: value for key, value in metadata.items() if key not in ("sql", "top_functions")})
+    return captures
+
+
+def init_profiler(app):
+    """
+    Install the profiling hooks for every request of ``app`` (unless PROFILER_ENABLED is off).
+    """
+    if not app.config["PROFILER_ENABLED"]:
+        return
+    config = app.config
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+    @app.before_request
+    def start_profiling():
+        header_value = request.headers.get(PROFILE_HEADER) if config["PROFILER_TOKEN"] else None
+        # Fast path: nothing can enable profiling for this request
+        if header_value is None and config["PROFILER_SLOW_MS"] <= 0 and not load_state(config["PROFILER_DIR"]).until:
+            return
+        capture = choose_capture(config, request.path, header_value)
+        if capture is not None:
+            _capture.set(capture)
+            g.profiler_capture = capture
+
+    @app.after_request
+    def stop_profiling(response):
+        capture = g.pop("profiler_capture", None)
+        if capture is None:
+            return response
+        method, path = request.method, request.path
+
+        def finish():
+            _capture.set(None)
+            name = finish_capture(capture, config["PROFILER_DIR"], config["PROFILER_MAX_CAPTURES"],
+                                  method, path, response.status_code)
+            if name is not None:
+                logging.info(f"[{os.getpid()}] Profiled {method} {path}: {name}")
+
+        if response.is_streamed:
+            # The body is generated while it is sent: finish once the server closes the response
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+
+    @app.teardown_request
+    def discard_profiling(exc=None):
+        # Only left over if the request failed before after_request ran
+        capture = g.pop("profiler_capture", None)
+        if capture is not None:
+            capture.stop()
+            _capture.set(None)
@@ -0,0 +1,184 @@
+"""
+Risk cache module for the application.
+
+/api/verify_transaction only needs a handful of per-user fields to reach a decision.
+This module keeps those fields in a compact, bounded in-memory LRU cache so that
+repeated authorizations for the same user do not hit the database at all.
+
+Every write path that changes one of the cached fields (balance updates, risk parameter
+updates, user updates) invalidates the affected entries after its commit. Entries also
+expire after RISK_CACHE_TTL seconds, which bounds staleness for writes performed by
+other worker processes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import select
+from app.models import User, effective_daily_transaction_count
+from app.extensions import db
+
+
+class RiskState:
+    """
+    Compact snapshot of the user fields used by verify_transaction().
+    """
+    __slots__ = (
+        "balance",
+        "daily_transaction_count",
+        "daily_transaction_day",
+        "last_transaction_date",
+        "high_risk_aborted_count",
+        "last_transaction_risk_value",
+    )
+
+    def __init__(self, balance, daily_transaction_count, daily_transaction_day,
+                 last_transaction_date, high_risk_aborted_count, last_transaction_risk_value):
+        self.balance = balance or 0.0
+        self.daily_transaction_count = daily_transaction_count or 0
+        self.daily_transaction_day = daily_transaction_day
+        self.last_transaction_date = last_transaction_date
+        self.high_risk_aborted_count = high_risk_aborted_count or 0
+        self.last_transaction_risk_value = last_transaction_risk_value or 0
+
+    def current_daily_transaction_count(self, today=None):
+        """
+        Return the daily transaction count as seen on ``today`` (see User).
+        """
+        return effective_daily_transaction_count(
+            self.daily_transaction_count,
+            self.daily_transaction_day,
+            self.last_transaction_date,
+            today
+        )
+
+
+# Columns loaded for a RiskState, in constructor order
+RISK_COLUMNS = (
+    User.balance,
+    User.daily_transaction_count,
+    User.daily_transaction_day,
+    User.last_transaction_date,
+    User.high_risk_aborted_count,
+    User.last_transaction_risk_value,
+)
+
+
+class RiskStateCache:
+    """
+    Thread-safe LRU cache of RiskState records with a per-entry time to live.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Incremented by every invalidation; loads that raced with one are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return a tuple (state, generation) for ``key``.
+
+        ``state`` is None on a miss; the caller then loads the state itself and hands
+        it to put() together with ``generation``.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], self._generation
+            self.misses += 1
+            return None, self._generation
+
+    def put(self, key, state, generation):
+        """
+        Cache ``state`` for ``key`` unless an invalidation happened since ``generation``
+        was read, so a slow reader can never re-insert data that a writer just replaced.
+        None states (unknown users) are not cached.
+        """
+        if state is None or self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (state, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached state for ``key``, or call ``loader(key)`` and cache its result.
+        """
+        state, generation = self.get(key)
+        if state is None:
+            state = loader(key)
+            self.put(key, state, generation)
+        return state
+
+    def invalidate(self, *keys):
+        """
+        Drop the given keys from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_risk_cache():
+    """
+    Return the process-wide cache, creating it from RISK_CACHE_SIZE / RISK_CACHE_TTL.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RiskStateCache(
+                    current_app.config["RISK_CACHE_SIZE"],
+                    current_app.config["RISK_CACHE_TTL"]
+                )
+    return _cache
+
+
+def load_risk_state(matriculation_number):
+    """
+    Read only the risk-relevant columns of one user. Returns None if the user does not exist.
+    """
+    row = db.session.execute(
+        select(*RISK_COLUMNS).where(User.matriculationNumber == matriculation_number)
+    ).first()
+    return RiskState(*row) if row is not None else None
+
+
+def get_risk_state(matriculation_number):
+    """
+    Return the RiskState for a user, served from the cache when possible.
+    """
+    return get_risk_cache().get_or_load(matriculation_number, load_risk_state)
+
+
+def invalidate_risk_state(*matriculation_numbers):
+    """
+    Invalidate cached risk state after a committed write to these users.
+    """
+    if _cache is not None:
+        _cache.invalidate(*matriculation_numbers)
@@ -10,4 +10,15 @@ def init_app(app):
     app.register_blueprint(auth_bp)
 
     from app.routes.risk_routes import risk_bp
-    app.register_blueprint(risk_bp)
\ No newline at end of file
+    app.register_blueprint(risk_bp)
+
+    from app.routes.ledger_routes import ledger_bp
+    app.register_blueprint(ledger_bp)
+
+    if app.config["PROFILER_ENABLED"]:
+        from app.routes.profiler_routes import profiler_bp
+        app.register_blueprint(profiler_bp)
+
+    if app.config["METRICS_ENABLED"]:
+        from app.routes.metrics_routes import metrics_bp
+        app.register_blueprint(metrics_bp)
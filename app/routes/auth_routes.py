@@ -1,6 +1,10 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import select, update
+from app.balance import parse_amount
 from app.models import User
 from app.extensions import db
+from app.passwords import PasswordPoolSaturated, get_password_hasher, is_password_hash
+from app.risk_cache import RISK_COLUMNS, get_risk_state
 from datetime import datetime
 import dateutil.parser
 
@@ -8,6 +12,63 @@ import dateutil.parser
 auth_bp = Blueprint("auth", __name__, url_prefix="/api")
 
 
+@auth_bp.route("/login", methods=["POST"])
+def login():
+    """
+    Check a user's credentials.
+
+    Expects JSON payload with:
+      - matriculationNumber: User's unique ID (required)
+      - password: The user's password (required)
+
+    Password verification runs on the bounded hashing process pool. Users still stored
+    with a plaintext password are rehashed on their first successful login.
+
+    HTTP status codes:
+      - 200 on successful login
+      - 400 if required fields are missing or not strings
+      - 401 if the credentials are invalid
+      - 503 if the hashing pool is saturated or too slow to answer (with a Retry-After header)
+    """
+    data = request.get_json(silent=True)
+
+    # Extract required fields from the payload
+    if not isinstance(data, dict) or not data.get("matriculationNumber") or not data.get("password"):
+        return jsonify({"error": "matriculationNumber and password must be provided"}), 400
+
+    matriculationNumber = data["matriculationNumber"]
+    password = data["password"]
+    if not isinstance(matriculationNumber, str) or not isinstance(password, str):
+        return jsonify({"error": "matriculationNumber and password must be strings"}), 400
+
+    # Only the stored password is needed to check the credentials
+    stored = db.session.execute(
+        select(User.password).where(User.matriculationNumber == matriculationNumber)
+    ).scalar_one_or_none()
+    # End the read transaction before the (slow) key derivation
+    db.session.rollback()
+    if stored is None:
+        return jsonify({"error": "Invalid credentials"}), 401
+
+    hasher = get_password_hasher()
+    try:
+        if not hasher.verify(stored, password):
+            return jsonify({"error": "Invalid credentials"}), 401
+
+        if not is_password_hash(stored):
+            # Lazily migrate legacy plaintext passwords; skip if the password changed meanwhile
+            db.session.execute(
+                update(User)
+                .where(User.matriculationNumber == matriculationNumber, User.password == stored)
+                .values(password=hasher.hash(password))
+            )
+            db.session.commit()
+    except PasswordPoolSaturated:
+        return jsonify({"error": "Too many concurrent logins, please retry"}), 503, {"Retry-After": "1"}
+
+    return jsonify({"message": "Login successful", "matriculationNumber": matriculationNumber}), 200
+
+
 @auth_bp.route("/verify_transaction", methods=["POST"])
 def verify_transaction_endpoint():
     """
@@ -36,14 +97,18 @@ def verify_transaction_endpoint():
     amount = data.get("amount")
     if not matriculationNumber or amount is None:
         return jsonify({"error": "matriculationNumber and amount must be provided"}), 402
+    try:
+        amount = parse_amount(amount)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Look up user by matriculation number
-    user = User.query.filter_by(matriculationNumber=matriculationNumber).first()
-    if not user:
+    # Look up the user's risk state (served from the in-memory cache when possible)
+    risk_state = get_risk_state(matriculationNumber)
+    if not risk_state:
         return jsonify({"error": "User not found"}), 404
 
     # Delegate the core logic to verify_transaction()
-    is_authorized, message = verify_transaction(user, float(amount))
+    is_authorized, message = verify_transaction(risk_state, amount)
     if is_authorized:
         return jsonify({"status": "success", "message": message}), 200
     else:
@@ -54,9 +119,12 @@ def verify_transaction(user, amount):
     """
     Core logic to decide if a transaction should be allowed.
 
+    ``user`` may be a User or a RiskState; only the risk-related fields are read.
+
     Steps:
       1. Check user's balance is sufficient.
-      2. If daily transaction count < 5, auto-approve.
+      2. If today's transaction count < 5, auto-approve (counts stored for an
+         earlier day read as 0).
       3. If last transaction risk value > 80 and there was a prior high-risk abort, reject.
       4. If daily count >= 5, enforce stricter checks:
          a. Parse last_transaction_date and compare with today.
@@ -69,8 +137,11 @@ def verify_transaction(user, amount):
     if user.balance < amount:
         return False, "Insufficient funds"
 
+    today = datetime.utcnow().date()
+
     # 2. Quick path for users with fewer than 5 transactions today
-    if user.daily_transaction_count < 5:
+    #    (counters stored for an earlier day count as 0)
+    if user.current_daily_transaction_count(today) < 5:
         return True, "Transaction authorized"
 
     # Additional risk check for heavy usage
@@ -79,11 +150,9 @@ def verify_transaction(user, amount):
             return False, "Risk too high!"
 
     # 3. Time-based daily enforcement
-    today = datetime.utcnow().date()
     if user.last_transaction_date:
         try:
-            # Attempt to parse stored date (ISO format)
-            last_date = dateutil.parser.isoparse(user.last_transaction_date).date()
+            last_date = parse_transaction_day(user.last_transaction_date)
         except Exception:
             return False, "Invalid date format for last transaction"
 
@@ -100,3 +169,200 @@ def verify_transaction(user, amount):
     else:
         # No previous transaction date recorded, allow transaction
         return True, "Transaction authorized (no prior transaction date)"
+
+
+def parse_transaction_day(value):
+    """
+    Return the date of a stored last_transaction_date.
+
+    The column holds a datetime; legacy ISO-formatted strings are parsed as well.
+    Raises an exception for values that cannot be interpreted.
+    """
+    if isinstance(value, str):
+        value = dateutil.parser.isoparse(value)
+    return value.date()
+
+
+# Outcomes of the vectorized rules, in the order they are checked by verify_transaction()
+VERDICTS = (
+    (False, "User not found"),
+    (False, "Insufficient funds"),
+    (True, "Transaction authorized"),
+    (False, "Risk too high!"),
+    (False, "Invalid date format for last transaction"),
+    (False, "Too many high-risk aborts today"),
+    (True, "Transaction authorized despite daily limit"),
+    (True, "Transaction authorized (new day)"),
+    (True, "Transaction authorized (no prior transaction date)"),
+)
+
+
+@auth_bp.route("/verify_transactions", methods=["POST"])
+def verify_transactions_endpoint():
+    """
+    Endpoint to authorize or reject many transactions at once.
+
+    Expects JSON payload with:
+      - transactions: List of transactions (required), each either an object with
+        matriculationNumber and amount, or a [matriculationNumber, amount] pair
+
+    The risk fields of all referenced users are loaded in one query and the rules of
+    verify_transaction() are evaluated over NumPy arrays. Results are identical to
+    calling /api/verify_transaction for each item.
+
+    Returns JSON with one result per transaction (matriculationNumber, authorized flag,
+    status and message) plus a summary. HTTP status codes:
+      - 200 if the batch was evaluated
+      - 400 if the payload is malformed or exceeds VERIFY_TRANSACTIONS_MAX_ITEMS items
+    """
+    data = request.get_json(silent=True)
+
+    # Check that a list of transactions was sent
+    if not data or not isinstance(data.get("transactions"), list):
+        return jsonify({"error": "transactions list is required"}), 400
+
+    transactions = data["transactions"]
+    max_items = current_app.config["VERIFY_TRANSACTIONS_MAX_ITEMS"]
+    if len(transactions) > max_items:
+        return jsonify({"error": f"At most {max_items} transactions are allowed per batch"}), 400
+
+    numbers = []
+    amounts = []
+    for index, item in enumerate(transactions):
+        try:
+            if isinstance(item, dict):
+                number, amount = item["matriculationNumber"], parse_amount(item["amount"])
+            else:
+                number, amount = item[0], parse_amount(item[1])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return jsonify({"error": f"Transaction {index} needs matriculationNumber and amount"}), 400
+        if not number or not isinstance(number, str):
+            return jsonify({"error": f"Transaction {index} needs matriculationNumber and amount"}), 400
+        numbers.append(number)
+        amounts.append(amount)
+
+    # NumPy is only needed for batches; importing it here keeps it off the startup path
+    import numpy as np
+
+    # Load all referenced users once and map every transaction to its user's row
+    positions, columns = load_risk_columns(set(numbers))
+    user_rows = np.fromiter((positions.get(number, -1) for number in numbers), dtype=np.int64, count=len(numbers))
+    authorized, messages = verify_transactions(user_rows, np.asarray(amounts, dtype=np.float64), columns)
+
+    results = [
+        {
+            "matriculationNumber": number,
+            "authorized": is_authorized,
+            "status": "success" if is_authorized else "failure",
+            "message": message
+        }
+        for number, is_authorized, message in zip(numbers, authorized, messages)
+    ]
+    approved = sum(authorized)
+    return jsonify({
+        "summary": {"authorized": approved, "rejected": len(results) - approved},
+        "results": results
+    }), 200
+
+
+def load_risk_columns(matriculation_numbers, today=None):
+    """
+    Load the risk fields of many users with a single query, as columnar NumPy arrays.
+
+    Returns a tuple (positions, columns): ``positions`` maps each found
+    matriculationNumber to its row, ``columns`` maps field names to arrays with one
+    entry per row:
+      - balance, daily_count (already reset for earlier days), risk_value, aborted
+      - has_date, invalid_date, same_day: flags derived from last_transaction_date
+    """
+    import numpy as np
+
+    today = today or datetime.utcnow().date()
+    rows = []
+    if matriculation_numbers:
+        rows = db.session.execute(
+            select(User.matriculationNumber, *RISK_COLUMNS)
+            .where(User.matriculationNumber.in_(list(matriculation_numbers)))
+        ).all()
+
+    numbers, balances, counts, count_days, last_dates, aborted, risk_values = (
+        zip(*rows) if rows else ((),) * 7
+    )
+    positions = {number: i for i, number in enumerate(numbers)}
+    size = len(numbers)
+
+    # Day of the last transaction; unparsable legacy values are flagged, not raised
+    has_date = np.fromiter((bool(value) for value in last_dates), dtype=bool, count=size)
+    invalid_date = np.zeros(size, dtype=bool)
+    last_days = []
+    for i, value in enumerate(last_dates):
+        try:
+            last_days.append(parse_transaction_day(value) if value else None)
+        except Exception:
+            invalid_date[i] = True
+            last_days.append(None)
+    today64 = np.datetime64(today, "D")
+    last_day = np.array(last_days, dtype="datetime64[D]")
+    count_day = np.array(count_days, dtype="datetime64[D]")
+
+    # Counters belong to their stored day (or, for older rows, the last transaction day)
+    # and read as 0 on any other day, exactly like effective_daily_transaction_count()
+    count_day = np.where(np.isnat(count_day), last_day, count_day)
+    daily_count = np.array([count or 0 for count in counts], dtype=np.int64)
+    daily_count[~np.isnat(count_day) & (count_day != today64)] = 0
+
+    columns = {
+        "balance": np.array([value or 0.0 for value in balances], dtype=np.float64),
+        "daily_count": daily_count,
+        "risk_value": np.array([value or 0 for value in risk_values], dtype=np.float64),
+        "aborted": np.array([value or 0 for value in aborted], dtype=np.int64),
+        "has_date": has_date,
+        "invalid_date": invalid_date,
+        "same_day": ~np.isnat(last_day) & (last_day == today64),
+    }
+    return positions, columns
+
+
+def verify_transactions(user_rows, amounts, columns):
+    """
+    Vectorized version of verify_transaction().
+
+    Args:
+        user_rows (numpy.ndarray): Row in ``columns`` per transaction, -1 for unknown users.
+        amounts (numpy.ndarray): Transaction amounts, aligned with ``user_rows``.
+        columns (dict): Per-user arrays as returned by load_risk_columns().
+
+    Returns a tuple (authorized: list[bool], messages: list[str]).
+    """
+    import numpy as np
+
+    found = user_rows >= 0
+    if not found.any():
+        return [False] * len(user_rows), [VERDICTS[0][1]] * len(user_rows)
+
+    # Gather each transaction's user fields; unknown users read row 0 but are masked by ~found
+    rows = np.where(found, user_rows, 0)
+    balance = columns["balance"][rows]
+    aborted = columns["aborted"][rows]
+    has_date = columns["has_date"][rows]
+    same_day = columns["same_day"][rows]
+
+    # Evaluate the rules in the same order as verify_transaction(); the first match wins
+    verdict = np.select(
+        [
+            ~found,
+            balance < amounts,
+            columns["daily_count"][rows] < 5,
+            (columns["risk_value"][rows] > 80) & (aborted > 0),
+            has_date & columns["invalid_date"][rows],
+            has_date & same_day & (aborted >= 2),
+            has_date & same_day,
+            has_date,
+        ],
+        np.arange(8),
+        default=8
+    ).tolist()
+
+    authorized = [VERDICTS[v][0] for v in verdict]
+    messages = [VERDICTS[v][1] for v in verdict]
+    return authorized, messages
@@ -1,6 +1,11 @@
-from flask import Blueprint, jsonify, request
-from app.models import Bank, User
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.balance import apply_balance_batch, credit_balance, debit_balance, parse_positive_amount
 from app.extensions import db
+from app.group_commit import CREDIT_PENDING_ERROR, get_group_committer
+from app.idempotency import group_commit_claim, idempotent
+from app.risk_cache import invalidate_risk_state
+from app.secrets_cache import get_secrets_snapshot, validate_secret
+from app.serializers import parse_fields, project
 
 # Create a Blueprint for bank-related API endpoints under the '/api' prefix
 bank_bp = Blueprint("bank", __name__, url_prefix="/api")
@@ -16,111 +21,215 @@ def get_all_bank_secrets():
       - secrets: List of secret code records, each with:
           - code: The secret code string
           - generated_at: Timestamp when the code was generated
+
+    The response is served from an in-memory snapshot that is replaced whenever the
+    secrets are rotated. It carries an ETag; requests with a matching If-None-Match
+    header receive 304 Not Modified without a body.
+    """
+    snapshot = get_secrets_snapshot()
+
+    response = Response(snapshot.body, status=200, mimetype="application/json")
+    response.set_etag(snapshot.etag)
+    # Clients may cache the body but must revalidate it on every poll
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@bank_bp.route("/validate_secret", methods=["POST"])
+def validate_bank_secret():
+    """
+    Check whether a secret code is currently valid for a bank.
+
+    Expects JSON payload with:
+      - bank_code: Unique identifier of the bank (required)
+      - code: The secret code to check (required)
+
+    Lets terminals verify one code instead of downloading all secrets. Returns JSON with:
+      - valid: True if the code may be used
+      - status: "valid", "expired" or "invalid"
     """
-    # Query all Bank records from the database
-    banks = Bank.query.all()
-    result = []
-
-    # Build the response list
-    for bank in banks:
-        result.append({
-            "bank_name": bank.name,
-            "bank_code": bank.bank_code,
-            "secrets": [
-                {
-                    "code": secret.secret,
-                    "generated_at": secret.generated_at
-                }
-                for secret in bank.secrets  # Access related BankSecret entries
-            ]
-        })
-
-    # Return the compiled list of banks and their secrets
-    return jsonify({"banks": result}), 200
+    data = request.get_json(silent=True)
+
+    # Validate required input fields
+    if not isinstance(data, dict) or not data.get("bank_code") or not data.get("code"):
+        return jsonify({"error": "bank_code and code are required"}), 400
+    if not isinstance(data["bank_code"], str) or not isinstance(data["code"], str):
+        return jsonify({"error": "bank_code and code must be strings"}), 400
+
+    status = validate_secret(data["bank_code"], data["code"])
+    return jsonify({"bank_code": data["bank_code"], "valid": status == "valid", "status": status}), 200
 
 @bank_bp.route("/add_balance", methods=["POST"])
+@idempotent
 def add_balance():
     """
     Increase a user's account balance.
 
     Expects JSON payload with:
       - matriculationNumber: User's unique matriculation ID (required)
-      - amount: Amount to add to the balance (required, numeric)
-
-    Returns the updated user record and new balance.
+      - amount: Amount to add to the balance (required, positive number)
+
+    With GROUP_COMMIT_ENABLED, credits are committed together with other
+    concurrent credits (see app.group_commit); the response is still only sent once
+    the credit has been committed. If it is not committed within GROUP_COMMIT_TIMEOUT,
+    409 with a Retry-After header is returned: the credit may still be committed, and
+    a retry with the same Idempotency-Key receives its outcome.
+    Supports the Idempotency-Key header (see app.idempotency).
+    Returns the updated user record, reduced to the optional ``fields`` query parameter,
+    and the new balance.
     """
     data = request.get_json()
 
     # Validate required input fields
     if not data or "matriculationNumber" not in data or "amount" not in data:
         return jsonify({"error": "matriculationNumber and amount are required"}), 400
+    try:
+        amount = parse_positive_amount(data["amount"])
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     matriculationNumber = data["matriculationNumber"]
-    amount = data["amount"]
 
-    # Look up the user by matriculation number
-    user = User.query.filter_by(matriculationNumber=matriculationNumber).first()
-    if not user:
-        return jsonify({"error": "User not found"}), 404
+    def respond(new_balance, user_data):
+        return {
+            "message": "Balance updated successfully",
+            "new_balance": new_balance,
+            "user": project(user_data, fields)
+        }
 
     try:
-        # Add the specified amount to the user's balance
-        user.balance += float(amount)
-        db.session.commit()
+        if current_app.config["GROUP_COMMIT_ENABLED"]:
+            # Queue the credit; returns once the batch containing it (and the request's
+            # Idempotency-Key) has been committed
+            result = get_group_committer().credit(
+                matriculationNumber, amount, claim=group_commit_claim(respond)
+            )
+            if result is None:
+                return jsonify({"error": "User not found"}), 404
+            return jsonify(respond(*result)), 200
+        else:
+            # Add the amount in a single atomic UPDATE ... RETURNING statement
+            user = credit_balance(matriculationNumber, amount)
+            if not user:
+                db.session.rollback()
+                return jsonify({"error": "User not found"}), 404
+            # Serialize before committing so the response reflects exactly this update
+            new_balance = user.balance
+            user_data = user.as_dict(fields=fields)
+            db.session.commit()
+            invalidate_risk_state(matriculationNumber)
 
         # Return success response with updated balance
         return jsonify({
             "message": "Balance updated successfully",
-            "new_balance": user.balance,
-            "user": user.as_dict()
+            "new_balance": new_balance,
+            "user": user_data
         }), 200
+    except TimeoutError:
+        # The queued credit may still be committed: the client must not retry without
+        # the same Idempotency-Key
+        return jsonify({"error": CREDIT_PENDING_ERROR}), 409, {"Retry-After": "1"}
     except Exception as e:
         # Roll back on error and return details
         db.session.rollback()
         return jsonify({"error": "Error updating balance", "details": str(e)}), 500
 
 @bank_bp.route("/deduct_balance", methods=["POST"])
+@idempotent
 def deduct_balance():
     """
     Decrease a user's account balance.
 
     Expects JSON payload with:
       - matriculationNumber: User's unique matriculation ID (required)
-      - amount: Amount to deduct from the balance (required, numeric)
+      - amount: Amount to deduct from the balance (required, positive number)
 
-    Checks that the user has sufficient funds before deduction.
-    Returns the updated user record and new balance.
+    The sufficient-funds check and the deduction happen in one conditional
+    UPDATE, so concurrent deductions can never overdraw the account.
+    Supports the Idempotency-Key header (see app.idempotency).
+    Returns the updated user record, reduced to the optional ``fields`` query parameter,
+    and the new balance.
     """
     data = request.get_json()
 
     # Validate required input fields
     if not data or "matriculationNumber" not in data or "amount" not in data:
         return jsonify({"error": "matriculationNumber and amount are required"}), 400
+    try:
+        amount = parse_positive_amount(data["amount"])
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     matriculationNumber = data["matriculationNumber"]
-    amount = float(data["amount"])
-
-    # Look up the user by matriculation number
-    user = User.query.filter_by(matriculationNumber=matriculationNumber).first()
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-
-    # Ensure the user has enough balance to cover the deduction
-    if user.balance < amount:
-        return jsonify({"error": "Insufficient balance", "current_balance": user.balance}), 400
 
     try:
-        # Subtract the specified amount from the user's balance
-        user.balance -= amount
+        # Deduct in a single conditional UPDATE that only matches if balance >= amount
+        user, current_balance = debit_balance(matriculationNumber, amount)
+        if not user:
+            db.session.rollback()
+            if current_balance is None:
+                return jsonify({"error": "User not found"}), 404
+            # The user exists but does not have enough balance to cover the deduction
+            return jsonify({"error": "Insufficient balance", "current_balance": current_balance}), 400
+        # Serialize before committing so the response reflects exactly this update
+        user_data = user.as_dict(fields=fields)
         db.session.commit()
+        invalidate_risk_state(matriculationNumber)
 
         # Return success response with updated balance
         return jsonify({
             "message": "Amount deducted successfully",
-            "new_balance": user.balance,
-            "user": user.as_dict()
+            "new_balance": current_balance,
+            "user": user_data
         }), 200
     except Exception as e:
         # Roll back on error and return details
         db.session.rollback()
         return jsonify({"error": "Error updating balance", "details": str(e)}), 500
+
+@bank_bp.route("/batch_balance", methods=["POST"])
+def batch_balance():
+    """
+    Apply many credit/debit operations in a single transaction.
+
+    Expects JSON payload with:
+      - operations: List of operations (required), each with:
+          - matriculationNumber: User's unique matriculation ID
+          - amount: Positive amount to credit or debit
+          - type: "credit" or "debit"
+
+    Operations are applied in order with set-based SQL. A failing operation does not
+    abort the batch; instead every operation gets its own result with a status of
+    "success", "insufficient_funds", "user_not_found" or "invalid".
+    Returns the per-operation results and a summary count per status.
+    """
+    data = request.get_json(silent=True)
+
+    # Validate the operations list
+    if not data or not isinstance(data.get("operations"), list):
+        return jsonify({"error": "operations list is required"}), 400
+
+    operations = data["operations"]
+    max_operations = current_app.config["BATCH_BALANCE_MAX_OPERATIONS"]
+    if len(operations) > max_operations:
+        return jsonify({"error": f"At most {max_operations} operations are allowed per batch"}), 400
+
+    try:
+        results = apply_balance_batch(operations)
+        db.session.commit()
+        invalidate_risk_state(*{r["matriculationNumber"] for r in results if r["status"] == "success"})
+    except Exception as e:
+        # Roll back the whole batch on error and return details
+        db.session.rollback()
+        return jsonify({"error": "Error applying batch", "details": str(e)}), 500
+
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+    return jsonify({
+        "message": "Batch processed",
+        "summary": summary,
+        "results": results
+    }), 200
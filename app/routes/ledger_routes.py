@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+from flask import Blueprint, current_app, jsonify, request
+from app.ledger import balance_at, ledger_page
+from app.storage import get_read_session
+
+# Create a Blueprint for transaction history endpoints under the '/api' prefix
+ledger_bp = Blueprint("ledger", __name__, url_prefix="/api")
+
+@ledger_bp.route("/transactions", methods=["GET"])
+def get_transactions():
+    """
+    Retrieve a user's balance changes, newest first.
+
+    Query parameters:
+      - matriculationNumber: user's matriculation ID (required)
+      - limit: page size (optional, capped at TRANSACTIONS_PAGE_MAX_LIMIT)
+      - cursor: ``next_cursor`` of the previous page (optional)
+
+    Returns the ledger entries of the page and ``next_cursor`` (None on the last page).
+    Pages are read by keyset from the (matriculationNumber, timestamp) index, so every
+    page costs the same regardless of how many entries exist.
+    """
+    matriculationNumber = request.args.get("matriculationNumber")
+    if not matriculationNumber:
+        return jsonify({"error": "Matriculation number must be provided"}), 400
+
+    max_limit = current_app.config["TRANSACTIONS_PAGE_MAX_LIMIT"]
+    limit = request.args.get("limit", type=int) or max_limit
+    cursor = request.args.get("cursor", type=int)
+    if limit <= 0:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    entries, next_cursor = ledger_page(matriculationNumber, min(limit, max_limit), cursor, get_read_session())
+    return jsonify({
+        "transactions": [entry.as_dict() for entry in entries],
+        "next_cursor": next_cursor
+    }), 200
+
+@ledger_bp.route("/balance_at", methods=["GET"])
+def get_balance_at():
+    """
+    Retrieve a user's balance at a point in time.
+
+    Query parameters:
+      - matriculationNumber: user's matriculation ID (required)
+      - at: ISO8601 UTC timestamp (optional, defaults to now)
+
+    The balance is computed from the latest balance snapshot before ``at`` plus the
+    ledger entries recorded after it.
+    """
+    matriculationNumber = request.args.get("matriculationNumber")
+    if not matriculationNumber:
+        return jsonify({"error": "Matriculation number must be provided"}), 400
+
+    at = datetime.utcnow()
+    if request.args.get("at"):
+        try:
+            at = datetime.fromisoformat(request.args["at"])
+        except ValueError:
+            return jsonify({
+                "error": "Invalid date format for at",
+                "details": f"Expected ISO format, got {request.args['at']!r}"
+            }), 400
+        if at.tzinfo is not None:
+            # Timestamps are stored as naive UTC
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return jsonify({
+        "matriculationNumber": matriculationNumber,
+        "at": at.isoformat(),
+        "balance": balance_at(matriculationNumber, at, get_read_session())
+    }), 200
@@ -0,0 +1,13 @@
+from flask import Blueprint, Response
+from app.metrics import render_metrics
+
+# Create a Blueprint for the Prometheus scrape endpoint (outside the '/api' prefix)
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Return the metrics of all worker processes in the Prometheus text format.
+    """
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,72 @@
+import os
+import time
+from flask import Blueprint, current_app, jsonify, request, send_from_directory
+from app.profiler import ProfilerState, list_captures, load_state, save_state, valid_token
+
+# Create a Blueprint for the profiler administration endpoints under the '/api/admin' prefix
+profiler_bp = Blueprint("profiler", __name__, url_prefix="/api/admin")
+
+
+@profiler_bp.before_request
+def require_profiler_token():
+    """
+    Only allow requests carrying PROFILER_TOKEN in the X-Profiler-Token header.
+    """
+    if not valid_token(request.headers.get("X-Profiler-Token"), current_app.config["PROFILER_TOKEN"]):
+        return jsonify({"error": "A valid X-Profiler-Token header is required"}), 403
+
+@profiler_bp.route("/profiler", methods=["GET"])
+def get_profiler():
+    """
+    Return the runtime profiling state and the stored captures, newest first.
+    """
+    directory = current_app.config["PROFILER_DIR"]
+    return jsonify({
+        "state": load_state(directory).as_dict(),
+        "captures": list_captures(directory)
+    }), 200
+
+@profiler_bp.route("/profiler", methods=["POST"])
+def enable_profiler():
+    """
+    Switch on runtime profiling in all worker processes.
+
+    Expects JSON payload with:
+      - seconds (float): How long profiling stays on (optional, default 60)
+      - route (str): Only profile requests to this path, e.g. "/api/users" (optional)
+      - sample_rate (float): Fraction of matching requests to profile (optional, default 1)
+      - threshold_ms (float): Only keep captures of requests slower than this (optional, default 0)
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get("seconds", 60))
+        sample_rate = float(data.get("sample_rate", 1.0))
+        threshold_ms = float(data.get("threshold_ms", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds, sample_rate and threshold_ms must be numbers"}), 400
+    if seconds <= 0 or not 0 < sample_rate <= 1 or threshold_ms < 0:
+        return jsonify({"error": "seconds must be positive, sample_rate in (0, 1] and threshold_ms >= 0"}), 400
+
+    state = ProfilerState(time.time() + seconds, data.get("route"), sample_rate, threshold_ms)
+    save_state(current_app.config["PROFILER_DIR"], state)
+    return jsonify({"message": "Profiling enabled", "state": state.as_dict()}), 200
+
+@profiler_bp.route("/profiler", methods=["DELETE"])
+def disable_profiler():
+    """
+    Switch off runtime profiling in all worker processes.
+    """
+    save_state(current_app.config["PROFILER_DIR"], ProfilerState())
+    return jsonify({"message": "Profiling disabled"}), 200
+
+@profiler_bp.route("/profiles/<name>", methods=["GET"])
+def get_profile(name):
+    """
+    Return one capture: ``<name>`` for its JSON report, ``<name>.prof`` for the pstats file.
+    """
+    directory = current_app.config["PROFILER_DIR"]
+    if name.endswith(".prof"):
+        return send_from_directory(directory, name, mimetype="application/octet-stream", as_attachment=True)
+    if not os.path.isfile(os.path.join(directory, os.path.basename(name) + ".json")):
+        return jsonify({"error": "Profile not found"}), 404
+    return send_from_directory(directory, os.path.basename(name) + ".json", mimetype="application/json")
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from app.models import User  # Ensure that your User model includes the new risk-related fields
 from app.extensions import db
+from app.risk_cache import invalidate_risk_state
+from app.serializers import parse_fields
 from datetime import datetime
 
 # Create a Blueprint for risk management endpoints under the '/api' prefix
@@ -18,12 +20,17 @@ def update_risk_params():
       - highRiskAbortedCount (int): Count of aborted high-risk transactions (optional)
       - lastTransactionRiskValue (float): Risk score of the last transaction (optional)
 
+    The returned user record can be reduced with the ``fields`` query parameter.
     Returns a JSON response indicating success or error details.
     """
     data = request.get_json()
     # Validate that some data was provided
     if not data:
         return jsonify({"error": "No data provided"}), 400
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Extract and validate matriculation number
     matriculationNumber = data.get("matriculationNumber")
@@ -37,7 +44,9 @@ def update_risk_params():
 
     # Update risk parameters if present in the payload
     if "dailyTransactionCount" in data:
+        # The counter belongs to the current UTC day and reads as 0 once the day is over
         user.daily_transaction_count = data["dailyTransactionCount"]
+        user.daily_transaction_day = datetime.utcnow().date()
 
     if "lastTransactionDate" in data:
         try:
@@ -58,10 +67,11 @@ def update_risk_params():
     try:
         # Commit all changes to the database
         db.session.commit()
+        invalidate_risk_state(matriculationNumber)
         return jsonify({
             "status": "success",
             "message": "Risk parameters updated successfully.",
-            "user": user.as_dict()  # Requires an as_dict() method on the User model
+            "user": user.as_dict(fields=fields)
         }), 200
     except Exception as e:
         # Roll back if any database error occurs
@@ -1,14 +1,26 @@
-from datetime import timedelta, datetime
+import json
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 
-from app.models import User, ResetInfo
+from sqlalchemy.orm import joinedload
+
+from app.balance import BalanceConflict, parse_amount, set_balance
+from app.models import Bank, User
 from app.extensions import db
+from app.idempotency import idempotent
+from app.passwords import PasswordPoolSaturated, get_password_hasher
+from app.risk_cache import invalidate_risk_state
+from app.serializers import (
+    BankDictCache, includes_bank, parse_fields, serialize_users, user_columns, user_load_options
+)
+from app.storage import get_read_session
+from app.user_import import FORMATS, UserImporter, read_rows, spool_upload
 
 # Create a Blueprint for user-related API endpoints under the '/api' prefix
 user_bp = Blueprint("user", __name__, url_prefix="/api")
 
 @user_bp.route("/register", methods=["POST"])
+@idempotent
 def register_user():
     """
     Register a new user with the provided details.
@@ -17,9 +29,10 @@ def register_user():
       - matriculationNumber: user's unique matriculation ID
       - lastName: user's last name
       - firstName: user's first name
-      - password: user's password (should be hashed in a real app)
+      - password: user's password (stored as a salted hash)
       - accountNumber: user's bank account number
 
+    Supports the Idempotency-Key header (see app.idempotency).
     Returns a success message or error details.
     """
     data = request.get_json()
@@ -33,12 +46,18 @@ def register_user():
     if User.query.filter_by(matriculationNumber=data["matriculationNumber"]).first():
         return jsonify({"message": "Matriculation number already exists"}), 400
 
+    # Hash the password on the bounded hashing pool
+    try:
+        password_hash = get_password_hasher().hash(data["password"])
+    except PasswordPoolSaturated:
+        return jsonify({"error": "Password service busy, please retry"}), 503, {"Retry-After": "1"}
+
     # Create new user record with initial balance 0.0
     new_user = User(
         matriculationNumber=data["matriculationNumber"],
         lastName=data["lastName"],
         firstName=data["firstName"],
-        password=data["password"],
+        password=password_hash,
         accountNumber=data["accountNumber"],
         balance=0.0
     )
@@ -51,13 +70,59 @@ def register_user():
         db.session.rollback()
         return jsonify({"error": "Error saving data", "details": str(e)}), 500
 
+@user_bp.route("/import_users", methods=["POST"])
+def import_users():
+    """
+    Register many users from a CSV or NDJSON upload (see app.user_import).
+
+    The request body is the file itself, with the register fields (matriculationNumber,
+    lastName, firstName, password, accountNumber, optionally bank_code) as CSV columns
+    or JSON object keys. The format is taken from the ``format`` query parameter
+    ("csv" or "ndjson") or from the Content-Type (text/csv, application/x-ndjson).
+    Passwords are hashed unless ``prehashed=1`` is given, in which case well-formed
+    werkzeug hashes are stored as they are.
+
+    The upload is received completely first (in memory up to IMPORT_SPOOL_MAX_MEMORY,
+    then in a temporary file), because not every WSGI server can read the request
+    body while the response is streamed, and then processed in chunks. The response
+    is streamed as NDJSON: one line per rejected row (line, matriculationNumber, error)
+    followed by a final {"summary": {"imported": ..., "rejected": ...}} line.
+    """
+    format = request.args.get("format")
+    if format is None:
+        format = "csv" if request.mimetype == "text/csv" else "ndjson" if request.mimetype.endswith("ndjson") else None
+    if format not in FORMATS:
+        return jsonify({"error": "format must be csv or ndjson (query parameter or Content-Type)"}), 400
+
+    upload = spool_upload(request.stream, current_app.config["IMPORT_SPOOL_MAX_MEMORY"])
+    importer = UserImporter(get_password_hasher(), current_app.config["IMPORT_CHUNK_SIZE"],
+                            prehashed=request.args.get("prehashed") == "1")
+    current_app.logger.info(f"User import started (format={format})")
+
+    def generate():
+        try:
+            for rejection in importer.run(read_rows(upload, format)):
+                yield json.dumps(rejection.as_dict()) + "\n"
+        except Exception as e:
+            # Chunks committed so far stay imported; report where the import stopped
+            db.session.rollback()
+            yield json.dumps({"error": "Import aborted", "details": str(e), "summary": importer.summary()}) + "\n"
+            return
+        finally:
+            upload.close()
+        current_app.logger.info(f"User import finished: {importer.summary()}")
+        yield json.dumps({"summary": importer.summary()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 @user_bp.route("/user", methods=["GET"])
 def get_user():
     """
     Retrieve a user by their matriculation number.
 
-    Query parameter:
+    Query parameters:
       - matriculationNumber: user's matriculation ID
+      - fields: optional comma-separated subset of user fields (see app.serializers)
 
     Returns the user data if found.
     """
@@ -65,44 +130,103 @@ def get_user():
 
     if not matriculationNumber:
         return jsonify({"error": "Matriculation number must be provided"}), 400
-
-    user = User.query.filter_by(matriculationNumber=matriculationNumber).first()
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = get_read_session().query(User)
+    if fields is None or "bank" in fields:
+        # Load the user together with its bank and the bank's secrets in two queries (read engine)
+        query = query.options(joinedload(User.bank).selectinload(Bank.secrets))
+    if fields is not None:
+        query = query.options(user_load_options(fields))
+    user = query.filter_by(matriculationNumber=matriculationNumber).first()
     if user:
-        return jsonify({"exists": True, "user": user.as_dict()}), 200
+        return jsonify({"exists": True, "user": user.as_dict(fields=fields)}), 200
     else:
         return jsonify({"exists": False, "message": "User not found"}), 404
 
 @user_bp.route("/users", methods=["GET"])
 def get_all_users():
     """
-    Retrieve all users and reset daily transaction counters every 24 hours.
+    Retrieve users.
+
+    Optional query parameters:
+      - limit: page size; enables keyset pagination ordered by matriculationNumber
+      - cursor: matriculationNumber of the last user on the previous page
+      - format: "ndjson" streams users as newline-delimited JSON instead of one list
+      - fields: comma-separated subset of user fields; only their columns are selected
+        and banks are only loaded if "bank" is requested (see app.serializers)
 
-    Uses a singleton ResetInfo record (ID=1) to track the last reset time.
-    If more than 24 hours have passed since last reset, zero out all users' daily transaction counts.
+    Without parameters, returns a list of all user records. With ``limit`` the response
+    also contains ``next_cursor`` (None on the last page). The NDJSON stream reads rows
+    in batches, so memory stays flat regardless of table size.
 
-    Returns a list of all user records.
+    This is a pure read: daily transaction counters are stored per day and read as 0
+    on later days, so no reset has to run here. It is served from the read engine.
     """
-    now = datetime.utcnow()
-
-    # Fetch or create the global reset tracker
-    existing = ResetInfo.query.get(1)
-    if existing is None:
-        # Initialize reset info on first call
-        existing = ResetInfo(id=1, last_reset=now)
-        db.session.add(existing)
-    elif now - existing.last_reset >= timedelta(hours=24):
-        # Zero out daily counters if 24 hours have elapsed
-        User.query.update(
-            {User.daily_transaction_count: 0},
-            synchronize_session='fetch'
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor")
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    session = get_read_session()
+    if includes_bank(fields):
+        query = session.query(User)
+        if fields is not None:
+            query = query.options(user_load_options(fields))
+    else:
+        # Plain rows of the requested columns; no User objects are built
+        query = session.query(*user_columns(fields))
+    # Keyset pagination: continue strictly after the cursor, ordered by primary key
+    query = query.order_by(User.matriculationNumber)
+    if cursor:
+        query = query.filter(User.matriculationNumber > cursor)
+
+    if request.args.get("format") == "ndjson":
+        if limit is not None:
+            query = query.limit(limit)
+        return Response(
+            stream_with_context(_stream_users_ndjson(session, query.statement, fields)),
+            mimetype="application/x-ndjson"
         )
-        existing.last_reset = now
 
-    db.session.commit()
+    if limit is None and cursor is None:
+        # Return all users as a JSON list
+        users = query.all()
+        return jsonify({"users": serialize_users(users, BankDictCache(session), fields)}), 200
 
-    # Return all users as a JSON list
-    users = User.query.all()
-    return jsonify({"users": [u.as_dict() for u in users]}), 200
+    limit = min(limit or current_app.config["USERS_PAGE_MAX_LIMIT"], current_app.config["USERS_PAGE_MAX_LIMIT"])
+    # Fetch one extra row to find out whether another page exists
+    users = query.limit(limit + 1).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+    return jsonify({
+        "users": serialize_users(users, BankDictCache(session), fields),
+        "next_cursor": users[-1].matriculationNumber if has_more else None
+    }), 200
+
+
+def _stream_users_ndjson(session, statement, fields=None):
+    """
+    Yield one JSON document per user, loading rows in fixed-size batches.
+
+    Banks are serialized once per request and shared across batches.
+    """
+    bank_cache = BankDictCache(session)
+    result = session.execute(
+        statement.execution_options(yield_per=current_app.config["USERS_STREAM_BATCH_SIZE"])
+    )
+    if includes_bank(fields):
+        result = result.scalars()
+    for batch in result.partitions():
+        for user_data in serialize_users(batch, bank_cache, fields):
+            yield json.dumps(user_data) + "\n"
 
 @user_bp.route("/update_secure_pin", methods=["POST"])
 def update_secure_pin():
@@ -113,13 +237,17 @@ def update_secure_pin():
       - matriculationNumber: user's ID
       - newSecurePin: the updated secure PIN value
 
-    Returns the updated user record.
+    Returns the updated user record, reduced to the optional ``fields`` query parameter.
     """
     data = request.get_json()
 
     # Validate input data
     if not data or "matriculationNumber" not in data or "newSecurePin" not in data:
         return jsonify({"error": "Matriculation number and newSecurePin are required"}), 400
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Look up the user
     user = User.query.filter_by(matriculationNumber=data["matriculationNumber"]).first()
@@ -131,7 +259,7 @@ def update_secure_pin():
 
     try:
         db.session.commit()
-        return jsonify({"message": "Secure PIN updated successfully", "user": user.as_dict()}), 200
+        return jsonify({"message": "Secure PIN updated successfully", "user": user.as_dict(fields=fields)}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Error updating secure PIN", "details": str(e)}), 500
@@ -145,14 +273,35 @@ def update_user():
       - matriculationNumber: user's ID (required)
       - Any other User model fields to update (e.g., lastName, firstName, password, accountNumber, balance, securePin, bank_code)
 
-    Only provided fields will be changed.
-    Returns the updated user record.
+    Only provided fields will be changed. A new balance is applied atomically and the
+    difference is recorded in the ledger as an adjustment (see app.balance.set_balance).
+    Returns the updated user record, reduced to the optional ``fields`` query parameter.
     """
     data = request.get_json()
-    current_app.logger.info(f"Update User Payload: {data}")
+    # Never write plaintext passwords to the log
+    logged = {**data, "password": "***"} if data and "password" in data else data
+    current_app.logger.info(f"Update User Payload: {logged}")
 
     if not data or "matriculationNumber" not in data:
         return jsonify({"error": "Matriculation number must be provided"}), 400
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    balance = None
+    if "balance" in data:
+        try:
+            balance = parse_amount(data["balance"])
+        except ValueError:
+            return jsonify({"error": "balance must be a number"}), 400
+
+    # Store new passwords as salted hashes, computed on the bounded hashing pool
+    password_hash = None
+    if "password" in data:
+        try:
+            password_hash = get_password_hasher().hash(data["password"])
+        except PasswordPoolSaturated:
+            return jsonify({"error": "Password service busy, please retry"}), 503, {"Retry-After": "1"}
 
     # Find the user by matriculation number
     user = User.query.filter_by(matriculationNumber=data["matriculationNumber"]).first()
@@ -160,15 +309,28 @@ def update_user():
         return jsonify({"error": "User not found"}), 404
 
     # Update only the fields present in the request
-    for field in ["lastName", "firstName", "password", "accountNumber", "balance", "securePin", "bank_code"]:
+    for field in ["lastName", "firstName", "accountNumber", "securePin", "bank_code"]:
         if field in data:
             setattr(user, field, data[field])
 
+    if password_hash is not None:
+        user.password = password_hash
+
     try:
+        if balance is not None:
+            # Conditional UPDATE ... RETURNING plus a ledger adjustment, in this transaction
+            set_balance(user.matriculationNumber, balance)
         db.session.commit()
+        invalidate_risk_state(data["matriculationNumber"])
         db.session.refresh(user)  # Refresh to ensure all changes are loaded
-        current_app.logger.info(f"User updated: {user.as_dict()}")
-        return jsonify({"message": "User updated successfully", "user": user.as_dict()}), 200
+        user_data = user.as_dict(fields=fields)
+        # The stored password hash stays out of the log as well
+        logged = {key: value for key, value in user_data.items() if key != "password"}
+        current_app.logger.info(f"User updated: {logged}")
+        return jsonify({"message": "User updated successfully", "user": user_data}), 200
+    except BalanceConflict:
+        db.session.rollback()
+        return jsonify({"error": "The balance is being changed concurrently, please retry"}), 409
     except Exception as e:
         db.session.rollback()
         current_app.logger.error("Error updating user", exc_info=e)
@@ -2,57 +2,237 @@
 Scheduler module for the application.
 
 This module configures and starts a background scheduler that periodically regenerates
-secret codes for all banks. It uses APScheduler to run the regeneration job at a fixed interval.
+secret codes for all banks and snapshots account balances from the ledger. It uses
+APScheduler to run both jobs at fixed intervals. Every worker process runs the
+scheduler, but only the process holding the leader lease (see app.leader) performs them.
 """
 
 import os
 import logging
+import threading
+import time
 from apscheduler.schedulers.background import BackgroundScheduler
-from app.models import Bank, BankSecret, generate_secret_code, get_current_timestamp
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from app.models import Bank, BankSecret, SECRETS_PER_BANK, generate_secret_code, get_current_timestamp
 from app.extensions import db
+from app.idempotency import prune_idempotency_keys
+from app.ledger import take_balance_snapshots
+from app.leader import create_leader_lease
+from app.metrics import SECRET_ROTATION_ROWS, observe_job
+from app.secrets_cache import publish_secrets_rotation
 
 
 def regenerate_bank_secrets(app):
     """
     Regenerate and store new secret codes for every bank in the database.
 
-    This function is intended to be run inside the Flask application context. It deletes
-    existing secrets for each bank and generates six new secret codes, recording the
-    generation timestamp.
+    This function is intended to be run inside the Flask application context. Depending
+    on SECRET_ROTATION_MODE it either replaces all six secrets of every bank ("full") or
+    only the oldest secret per bank ("rolling", a sliding window of six codes). Banks are
+    processed in chunks of SECRET_ROTATION_CHUNK_SIZE with set-based statements, and each
+    chunk is committed separately to keep write locks short. After the last commit, the
+    rotation version is incremented and the cached /api/all_secrets snapshot is replaced.
+    The duration and the rows written are recorded in app.metrics. In the "derived" mode
+    secrets are computed per time window (see app.secret_derivation), so nothing is written.
+
+    Returns the number of secret rows written, or None if the rotation failed.
     """
     pid = os.getpid()
+    if app.config["SECRET_ROTATION_MODE"] == "derived":
+        logging.info(f"[{pid}] Secrets are derived per time window; nothing to regenerate.")
+        return 0
+    started = time.perf_counter()
     logging.info(f"[{pid}] Attempting to run regenerate_bank_secrets...")
 
     # Enter the Flask application context to access the database
     with app.app_context():
         try:
-            # Retrieve all banks from the database
-            banks = Bank.query.all()
-            logging.info(f"[{pid}] Regenerating secrets for {len(banks)} banks...")
-
-            for bank in banks:
-                # Choose an appropriate synchronization strategy before deleting old secrets
-                BankSecret.query.filter_by(bank_code=bank.bank_code).delete(synchronize_session='fetch')
-                # db.session.flush()  # Optional, depending on session behavior
-
-                # Generate and store six new secret codes per bank
-                for _ in range(6):
-                    secret_code = generate_secret_code()
-                    timestamp = get_current_timestamp()
-                    new_secret = BankSecret(
-                        bank_code=bank.bank_code,
-                        secret=secret_code,
-                        generated_at=timestamp
-                    )
-                    db.session.add(new_secret)
-
-            # Commit all changes to the database
+            mode = app.config["SECRET_ROTATION_MODE"]
+            chunk_size = app.config["SECRET_ROTATION_CHUNK_SIZE"]
+
+            # Only the bank codes are needed, so skip hydrating Bank objects
+            bank_codes = db.session.execute(select(Bank.bank_code).order_by(Bank.bank_code)).scalars().all()
             db.session.commit()
-            logging.info(f"[{pid}] Successfully regenerated bank secrets.")
+            logging.info(f"[{pid}] Regenerating secrets for {len(bank_codes)} banks (mode={mode})...")
+
+            rows_written = 0
+            for start in range(0, len(bank_codes), chunk_size):
+                chunk = bank_codes[start:start + chunk_size]
+                if mode == "rolling":
+                    rows_written += rotate_oldest_secrets(chunk)
+                else:
+                    rows_written += replace_all_secrets(chunk)
+                # Commit each chunk on its own so writers are never blocked for long
+                db.session.commit()
+
+            # Bump the rotation version and publish the new secrets to /api/all_secrets
+            publish_secrets_rotation()
+            logging.info(f"[{pid}] Successfully regenerated bank secrets ({rows_written} rows written).")
+            SECRET_ROTATION_ROWS.inc(amount=rows_written)
+            observe_job("secret_rotation", started)
+            return rows_written
         except Exception as e:
             # Roll back the transaction on error and log the full stack trace
             db.session.rollback()
             logging.error(f"[{pid}] Error during secret regeneration: {e}", exc_info=True)
+            observe_job("secret_rotation", started, failed=True)
+
+
+def replace_all_secrets(bank_codes):
+    """
+    Replace all secrets of the given banks with SECRETS_PER_BANK new codes.
+
+    Uses one DELETE and one executemany INSERT for the whole chunk.
+    Returns the number of rows written. The caller commits.
+    """
+    db.session.execute(delete(BankSecret).where(BankSecret.bank_code.in_(bank_codes)))
+    rows = [
+        {"bank_code": bank_code, "secret": generate_secret_code(), "generated_at": get_current_timestamp()}
+        for bank_code in bank_codes
+        for _ in range(SECRETS_PER_BANK)
+    ]
+    if rows:
+        db.session.execute(insert(BankSecret.__table__), rows)
+    return len(rows)
+
+
+def rotate_oldest_secrets(bank_codes):
+    """
+    Replace only the oldest secret of each given bank (sliding window rotation).
+
+    Banks holding fewer than SECRETS_PER_BANK secrets are topped up instead. Uses one
+    grouped SELECT to find the oldest slots, one executemany UPDATE and, if needed,
+    one executemany INSERT. Returns the number of rows written. The caller commits.
+    """
+    secrets = BankSecret.__table__
+
+    # Number of secrets currently stored per bank
+    counts = dict(db.session.execute(
+        select(secrets.c.bank_code, func.count())
+        .where(secrets.c.bank_code.in_(bank_codes))
+        .group_by(secrets.c.bank_code)
+    ).all())
+
+    # Oldest slot per bank; ties on generated_at are broken by the lowest id
+    oldest = (
+        select(secrets.c.bank_code, func.min(secrets.c.generated_at).label("generated_at"))
+        .where(secrets.c.bank_code.in_(bank_codes))
+        .group_by(secrets.c.bank_code)
+        .subquery()
+    )
+    oldest_ids = db.session.execute(
+        select(func.min(secrets.c.id))
+        .join(oldest, (secrets.c.bank_code == oldest.c.bank_code) & (secrets.c.generated_at == oldest.c.generated_at))
+        .where(secrets.c.bank_code.in_([code for code in bank_codes if counts.get(code, 0) >= SECRETS_PER_BANK]))
+        .group_by(secrets.c.bank_code)
+    ).scalars().all()
+
+    updates = [
+        {"slot_id": slot_id, "new_secret": generate_secret_code(), "new_generated_at": get_current_timestamp()}
+        for slot_id in oldest_ids
+    ]
+    if updates:
+        db.session.execute(
+            update(secrets)
+            .where(secrets.c.id == bindparam("slot_id"))
+            .values(secret=bindparam("new_secret"), generated_at=bindparam("new_generated_at")),
+            updates
+        )
+
+    inserts = [
+        {"bank_code": bank_code, "secret": generate_secret_code(), "generated_at": get_current_timestamp()}
+        for bank_code in bank_codes
+        for _ in range(SECRETS_PER_BANK - counts.get(bank_code, 0))
+    ]
+    if inserts:
+        db.session.execute(insert(secrets), inserts)
+    return len(updates) + len(inserts)
+
+
+def snapshot_balances(app):
+    """
+    Write balance snapshots for all accounts changed since the previous run.
+
+    Returns the number of snapshots written, or None if the job failed.
+    """
+    pid = os.getpid()
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            written = take_balance_snapshots(app.config["BALANCE_SNAPSHOT_GRACE_SECONDS"])
+            db.session.commit()
+            logging.info(f"[{pid}] Balance snapshots written for {written} accounts.")
+            observe_job("balance_snapshots", started)
+            return written
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"[{pid}] Error during balance snapshot: {e}", exc_info=True)
+            observe_job("balance_snapshots", started, failed=True)
+            return None
+
+
+def prune_expired_idempotency_keys(app):
+    """
+    Delete stored idempotency keys older than IDEMPOTENCY_TTL.
+
+    Returns the number of deleted keys, or None if the job failed.
+    """
+    pid = os.getpid()
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            deleted = prune_idempotency_keys(app.config["IDEMPOTENCY_TTL"])
+            db.session.commit()
+            logging.info(f"[{pid}] Pruned {deleted} expired idempotency keys.")
+            observe_job("idempotency_pruning", started)
+            return deleted
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"[{pid}] Error while pruning idempotency keys: {e}", exc_info=True)
+            observe_job("idempotency_pruning", started, failed=True)
+            return None
+
+
+def is_scheduler_leader(lease):
+    """
+    Return True if this process holds (or could take) the leader lease.
+    """
+    pid = os.getpid()
+    try:
+        return lease.acquire()
+    except Exception as e:
+        logging.error(f"[{pid}] Leader election failed: {e}", exc_info=True)
+        return False
+
+
+def run_rotation_if_leader(app, lease):
+    """
+    Scheduler job: rotate secrets only if this process holds (or can take) the leader lease.
+    """
+    if not is_scheduler_leader(lease):
+        logging.info(f"[{os.getpid()}] Not the scheduler leader; skipping secret regeneration.")
+        return None
+    return regenerate_bank_secrets(app)
+
+
+def run_snapshots_if_leader(app, lease):
+    """
+    Scheduler job: snapshot balances only if this process holds (or can take) the leader lease.
+    """
+    if not is_scheduler_leader(lease):
+        logging.info(f"[{os.getpid()}] Not the scheduler leader; skipping balance snapshots.")
+        return None
+    return snapshot_balances(app)
+
+
+def run_pruning_if_leader(app, lease):
+    """
+    Scheduler job: prune idempotency keys only if this process holds (or can take) the leader lease.
+    """
+    if not is_scheduler_leader(lease):
+        logging.info(f"[{os.getpid()}] Not the scheduler leader; skipping idempotency key pruning.")
+        return None
+    return prune_expired_idempotency_keys(app)
 
 
 def start_secret_regeneration_scheduler(app):
@@ -61,37 +241,83 @@ def start_secret_regeneration_scheduler(app):
     the regenerate_bank_secrets function.
 
     This function ensures the scheduler is only started once (avoiding multiple
-    schedulers during Flask's auto-reload) and sets up a job to run every 3 minutes.
+    schedulers during Flask's auto-reload) and sets up a job to run every 3 minutes,
+    plus the balance snapshot job every BALANCE_SNAPSHOT_INTERVAL minutes and an
+    hourly job that prunes expired idempotency keys.
+    Each job first tries to acquire the leader lease configured by
+    SCHEDULER_LEADER_ELECTION, so only one worker process runs it.
+    With SCHEDULER_START_DELAY, the scheduler is started that many seconds later from
+    a timer thread instead of during application startup.
     """
     pid = os.getpid()
 
+    if not app.config["SCHEDULER_ENABLED"]:
+        logging.info(f"[{pid}] Scheduler disabled by configuration.")
+        return
+
     # Only initialize the scheduler in the main process (not during Werkzeug's reload)
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not app.debug:
-        logging.info(f"[{pid}] Initializing scheduler...")
+        delay = app.config["SCHEDULER_START_DELAY"]
+        if delay > 0:
+            # Keep the scheduler setup off this process's startup path
+            timer = threading.Timer(delay, start_scheduler, args=[app])
+            timer.daemon = True
+            timer.start()
+            logging.info(f"[{pid}] Scheduler start deferred by {delay:g}s.")
+        else:
+            start_scheduler(app)
+    else:
+        # Executed in Werkzeug's reload process; skip starting the scheduler here
+        logging.info(f"[{pid}] Skipping scheduler start in Werkzeug reload process.")
+
 
-        scheduler = BackgroundScheduler(daemon=True)
+def start_scheduler(app):
+    """
+    Create the scheduler with its jobs and start it in this process.
+    """
+    pid = os.getpid()
+    logging.info(f"[{pid}] Initializing scheduler...")
 
-        # Schedule the secret regeneration job to run every 3 minutes
+    scheduler = BackgroundScheduler(daemon=True)
+    lease = create_leader_lease(app)
+
+    # Schedule the secret regeneration job to run every 3 minutes (derived secrets need none)
+    if app.config["SECRET_ROTATION_MODE"] != "derived":
         scheduler.add_job(
-            func=regenerate_bank_secrets,
+            func=run_rotation_if_leader,
             trigger='interval',
             minutes=3,
-            args=[app],
+            args=[app, lease],
             id='regenerate_bank_secrets_job',
             replace_existing=True
         )
+    # Condense the ledger into balance snapshots
+    scheduler.add_job(
+        func=run_snapshots_if_leader,
+        trigger='interval',
+        minutes=app.config["BALANCE_SNAPSHOT_INTERVAL"],
+        args=[app, lease],
+        id='snapshot_balances_job',
+        replace_existing=True
+    )
+    # Remove idempotency keys whose retry window has passed
+    scheduler.add_job(
+        func=run_pruning_if_leader,
+        trigger='interval',
+        hours=1,
+        args=[app, lease],
+        id='prune_idempotency_keys_job',
+        replace_existing=True
+    )
 
-        try:
-            scheduler.start()
-            logging.info(f"[{pid}] Secret-Regeneration-Scheduler started successfully.")
-        except (KeyboardInterrupt, SystemExit):
-            # Gracefully shut down on exit signals
-            logging.info(f"[{pid}] Shutting down scheduler on exit signal.")
-            if scheduler.running:
-                scheduler.shutdown()
-        except Exception as e:
-            # Log any startup failures with stack trace
-            logging.error(f"[{pid}] Failed to start scheduler: {e}", exc_info=True)
-    else:
-        # Executed in Werkzeug's reload process; skip starting the scheduler here
-        logging.info(f"[{pid}] Skipping scheduler start in Werkzeug reload process.")
+    try:
+        scheduler.start()
+        logging.info(f"[{pid}] Secret-Regeneration-Scheduler started successfully.")
+    except (KeyboardInterrupt, SystemExit):
+        # Gracefully shut down on exit signals
+        logging.info(f"[{pid}] Shutting down scheduler on exit signal.")
+        if scheduler.running:
+            scheduler.shutdown()
+    except Exception as e:
+        # Log any startup failures with stack trace
+        logging.error(f"[{pid}] Failed to start scheduler: {e}", exc_info=True)
@@ -0,0 +1,116 @@
+"""
+Schema module for the application.
+
+``db.create_all()`` only creates missing tables; it never changes existing ones. This
+module brings databases created by earlier versions of the application up to date by
+adding columns and indexes that were introduced later, by rebuilding tables whose
+column types changed and by recording opening balances when the ledger is introduced.
+
+Reflecting every table on every boot is wasted work once a database is current, so
+ensure_schema() records SCHEMA_VERSION in the ``schema_version`` table after creating
+or upgrading the schema, and later startups only read that single row.
+"""
+
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.types import String
+from app.extensions import db
+from app.ledger import open_ledger_if_needed
+from app.models import SchemaVersion
+
+# Version of the schema defined by the models and the upgrade steps below. Increment it
+# with every change to them, so existing databases are upgraded on the next startup.
+SCHEMA_VERSION = 1
+
+# Columns added after the initial release: (table, column, DDL type)
+ADDED_COLUMNS = [
+    ("users", "daily_transaction_day", "DATE"),
+]
+
+
+def stored_schema_version():
+    """
+    Return the schema version recorded in the database, or None if there is none yet.
+    """
+    try:
+        # Plain SQL: compiling a first ORM statement would add to every process's startup
+        return db.session.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar()
+    except (OperationalError, ProgrammingError):
+        # The table does not exist: a new database or one created by an earlier version
+        return None
+    finally:
+        db.session.rollback()
+
+
+def ensure_schema(force=False):
+    """
+    Create and upgrade the schema unless the database already records SCHEMA_VERSION
+    (or a newer version, written by a newer release during a rolling deployment).
+
+    Must be called inside an application context. Returns True if the schema was
+    created or upgraded, False if it was current.
+    """
+    stored = stored_schema_version()
+    if not force and stored is not None and stored >= SCHEMA_VERSION:
+        return False
+
+    db.create_all()  # Create all tables defined by SQLAlchemy models
+    upgrade_schema()  # Add columns missing from databases created by older versions
+    version = max(stored or 0, SCHEMA_VERSION)
+    db.session.merge(SchemaVersion(id=1, version=version, upgraded_at=datetime.utcnow()))
+    db.session.commit()
+    logging.info(f"Schema upgrade: database is at schema version {version}")
+    return True
+
+
+def upgrade_schema():
+    """
+    Add any missing columns listed in ADDED_COLUMNS to existing tables and create any
+    index declared on the models that does not exist yet.
+
+    Must be called inside an application context after ``db.create_all()``.
+    """
+    rebuild_bank_secrets_if_needed()
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table, column, ddl_type in ADDED_COLUMNS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+                logging.info(f"Schema upgrade: added column {table}.{column}")
+
+        for table in db.metadata.sorted_tables:
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    logging.info(f"Schema upgrade: created index {index.name}")
+
+    open_ledger_if_needed()
+
+
+def rebuild_bank_secrets_if_needed():
+    """
+    Recreate ``bank_secrets`` if ``generated_at`` is still stored as a string.
+
+    Earlier versions stored ISO-formatted strings; the column is now a DateTime. Secrets
+    are short-lived, so instead of converting rows the table is recreated and every bank
+    receives a fresh set of secrets.
+    """
+    from app.models import Bank, BankSecret
+    from app.scheduler import replace_all_secrets
+
+    columns = {c["name"]: c["type"] for c in inspect(db.engine).get_columns("bank_secrets")}
+    if not isinstance(columns.get("generated_at"), String):
+        return
+
+    BankSecret.__table__.drop(db.engine)
+    BankSecret.__table__.create(db.engine)
+    bank_codes = db.session.execute(select(Bank.bank_code)).scalars().all()
+    for start in range(0, len(bank_codes), 500):
+        replace_all_secrets(bank_codes[start:start + 500])
+    db.session.commit()
+    logging.info(f"Schema upgrade: rebuilt bank_secrets with a DateTime generated_at for {len(bank_codes)} banks")
@@ -0,0 +1,135 @@
+"""
+Derived bank secrets module for the application.
+
+With SECRET_ROTATION_MODE "derived", bank secrets are not stored or rotated at all.
+Like TOTP, time is divided into windows of SECRET_WINDOW_SECONDS and every bank's code
+for a window is computed from a per-bank key and the window index:
+
+    bank key = HMAC-SHA256(SECRET_DERIVATION_KEY, "bank-secret:" + bank_code)
+    code     = HMAC-SHA256(bank key, window index) mapped to 6 characters [A-Z0-9]
+
+Every worker process computes the same codes without coordination. A bank publishes the
+codes of its SECRETS_PER_BANK most recent windows, each with the window start as
+``generated_at``, which matches the sliding window of the "rolling" rotation mode.
+Serving /api/all_secrets and validating codes only reads the bank list; the scheduler
+does not write to ``bank_secrets`` in this mode.
+
+SECRET_DERIVATION_KEY must be set explicitly in this mode: codes derived from a default
+key could be computed by anyone (see derivation_key()).
+
+Both HMAC steps are memoized, so each code is computed once per process. Bank keys are
+kept for every bank; codes are kept per window for the CACHED_WINDOWS most recent
+windows, which covers the published and the expired codes of a snapshot whatever the
+number of banks.
+"""
+
+import hashlib
+import hmac
+import string
+import threading
+from datetime import datetime
+from app.models import SECRETS_PER_BANK
+
+# Characters of a secret code, as produced by models.generate_secret_code()
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+# Length of a secret code
+CODE_LENGTH = 6
+# Windows whose codes are memoized: the published and the expired windows of a snapshot,
+# plus the next window so a window change does not evict codes still in use
+CACHED_WINDOWS = 2 * SECRETS_PER_BANK + 1
+
+# (master_key, bank_code) -> bank key
+_bank_keys = {}
+# window -> {(master_key, bank_code): code}
+_window_codes = {}
+_window_codes_lock = threading.Lock()
+
+
+def derivation_key(config):
+    """
+    Return SECRET_DERIVATION_KEY from ``config``.
+
+    Raises:
+        ValueError: if the key is not set.
+    """
+    key = config["SECRET_DERIVATION_KEY"]
+    if not key:
+        raise ValueError('SECRET_ROTATION_MODE "derived" requires SECRET_DERIVATION_KEY to be set')
+    return key
+
+
+def window_index(now, window_seconds):
+    """
+    Return the index of the time window containing ``now`` (seconds since the epoch).
+    """
+    return int(now // window_seconds)
+
+
+def window_start(window, window_seconds):
+    """
+    Return the start of a window as a naive UTC datetime, like stored generated_at values.
+    """
+    return datetime.utcfromtimestamp(window * window_seconds)
+
+
+def bank_key(master_key, bank_code):
+    """
+    Return the per-bank key derived from the master key.
+    """
+    key = _bank_keys.get((master_key, bank_code))
+    if key is None:
+        key = _bank_keys[(master_key, bank_code)] = hmac.new(
+            master_key.encode("utf-8"), f"bank-secret:{bank_code}".encode("utf-8"), hashlib.sha256
+        ).digest()
+    return key
+
+
+def window_codes(window):
+    """
+    Return the memoized codes of a window, evicting the oldest windows beyond CACHED_WINDOWS.
+    """
+    codes = _window_codes.get(window)
+    if codes is None:
+        with _window_codes_lock:
+            codes = _window_codes.get(window)
+            if codes is None:
+                codes = _window_codes[window] = {}
+                while len(_window_codes) > CACHED_WINDOWS:
+                    del _window_codes[min(_window_codes)]
+    return codes
+
+
+def derive_code(master_key, bank_code, window):
+    """
+    Return the secret code of ``bank_code`` for a time window.
+    """
+    codes = window_codes(window)
+    code = codes.get((master_key, bank_code))
+    if code is None:
+        code = codes[(master_key, bank_code)] = compute_code(bank_key(master_key, bank_code), window)
+    return code
+
+
+def compute_code(key, window):
+    """
+    Compute the secret code for a window from a bank key.
+    """
+    digest = hmac.new(key, window.to_bytes(8, "big", signed=True), hashlib.sha256).digest()
+    # 64 bits reduced to 36^6 values; the bias of the modulo is below 2^-30
+    value = int.from_bytes(digest[:8], "big")
+    characters = []
+    for _ in range(CODE_LENGTH):
+        value, index = divmod(value, len(CODE_ALPHABET))
+        characters.append(CODE_ALPHABET[index])
+    return "".join(characters)
+
+
+def derived_codes(master_key, bank_code, last_window, count, window_seconds):
+    """
+    Return (code, generated_at) of ``bank_code`` for the ``count`` windows ending with
+    ``last_window``, oldest first.
+    """
+    return [
+        (derive_code(master_key, bank_code, window), window_start(window, window_seconds))
+        for window in range(last_window - count + 1, last_window + 1)
+    ]
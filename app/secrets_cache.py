@@ -0,0 +1,302 @@
+"""
+Secrets cache module for the application.
+
+Payment terminals poll /api/all_secrets constantly, while the underlying data only
+changes when the scheduler rotates the bank secrets. This module keeps the fully
+serialized response body in memory together with a content-derived ETag. The snapshot
+is swapped atomically after every rotation commit, so serving a poll costs no
+database work and unchanged data can be answered with 304 Not Modified.
+
+Only one process rotates secrets (see app.leader). Every rotation increments the
+version stored in ``secret_rotation_state``; other processes compare it with the
+version of their snapshot at most every SECRETS_VERSION_CHECK_INTERVAL seconds and
+rebuild only when it changed.
+
+Snapshots are built from the read engine (see app.storage), so rebuilding one does not
+compete with writers for a primary connection.
+
+Each snapshot also carries a hash table of (bank_code, code) -> generated_at, so
+/api/validate_secret can check a single code in O(1) without sending terminals the
+full secrets list. Codes that left the table are remembered for SECRET_VALIDITY_SECONDS,
+so they are reported as expired rather than invalid for that long.
+
+In the "derived" SECRET_ROTATION_MODE (see app.secret_derivation) the codes are
+computed instead of read from ``bank_secrets``. A snapshot then covers one time window:
+it is rebuilt once the window has ended, without any version check, and nothing is
+ever written to the database.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from app.models import Bank, BankSecret, SECRETS_PER_BANK, SecretRotationState
+from app.extensions import db
+from app.metrics import CACHE_HITS, CACHE_MISSES
+from app.secret_derivation import derivation_key, derived_codes, window_index
+from app.serializers import bank_query
+from app.storage import close_read_session, get_read_session
+
+
+class SecretsSnapshot:
+    """
+    Immutable, pre-serialized /api/all_secrets response plus a lookup table of the
+    current codes and the codes replaced by recent rotations.
+
+    For stored secrets ``previous_codes`` maps each replaced (bank_code, code) to the
+    time.monotonic() it was replaced at; for derived secrets it is the set of codes of
+    the windows before the published ones.
+
+    Snapshots of derived secrets carry the end of their time window as ``valid_until``
+    (seconds since the epoch); for stored secrets it is None and ``rotation_version``
+    decides whether the snapshot is current.
+    """
+    __slots__ = ("body", "etag", "rotation_version", "checked_at", "codes", "previous_codes", "valid_until")
+
+    def __init__(self, body, etag, rotation_version, checked_at, codes, previous_codes, valid_until=None):
+        self.body = body
+        self.etag = etag
+        self.rotation_version = rotation_version
+        self.checked_at = checked_at
+        self.codes = codes
+        self.previous_codes = previous_codes
+        self.valid_until = valid_until
+
+    def checked(self, checked_at):
+        """
+        Return a copy of this snapshot marked as validated at ``checked_at``.
+        """
+        return SecretsSnapshot(self.body, self.etag, self.rotation_version, checked_at,
+                               self.codes, self.previous_codes, self.valid_until)
+
+    def expired(self):
+        """
+        Return True if this is a snapshot of derived secrets whose time window has ended.
+        """
+        return self.valid_until is not None and time.time() >= self.valid_until
+
+
+_snapshot = None
+# Serializes rebuilds and version checks so each happens only once at a time, and
+# rebuilds never drop codes that a concurrent rebuild just retired
+_rebuild_lock = threading.Lock()
+
+
+def read_rotation_version():
+    """
+    Return the version of the last completed secret rotation (0 if none was recorded).
+    """
+    version = get_read_session().execute(
+        select(SecretRotationState.version).where(SecretRotationState.id == 1)
+    ).scalar_one_or_none()
+    return version or 0
+
+
+def publish_secrets_rotation():
+    """
+    Record a completed rotation and swap in a fresh snapshot for this process.
+
+    Increments the stored rotation version in its own short transaction so that other
+    processes notice the new secrets on their next version check.
+    """
+    result = db.session.execute(
+        update(SecretRotationState)
+        .where(SecretRotationState.id == 1)
+        .values(version=SecretRotationState.version + 1, rotated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        db.session.add(SecretRotationState(id=1, version=1, rotated_at=datetime.utcnow()))
+    db.session.commit()
+    return refresh_secrets_snapshot()
+
+
+def build_secrets_payload():
+    """
+    Query all banks with their secrets.
+
+    Returns a tuple (payload, codes): the /api/all_secrets payload and a dict mapping
+    (bank_code, code) to the code's generated_at timestamp.
+    """
+    result = []
+    codes = {}
+    for bank in bank_query(get_read_session()).all():
+        result.append({
+            "bank_name": bank.name,
+            "bank_code": bank.bank_code,
+            "secrets": [
+                {
+                    "code": secret.secret,
+                    "generated_at": secret.generated_at.isoformat()
+                }
+                for secret in bank.secrets
+            ]
+        })
+        for secret in bank.secrets:
+            codes[(bank.bank_code, secret.secret)] = secret.generated_at
+    return {"banks": result}, codes
+
+
+def build_derived_payload(config, window):
+    """
+    Compute the secrets of all banks for the SECRETS_PER_BANK windows ending with ``window``.
+
+    Returns a tuple (payload, codes, previous_codes) like build_secrets_payload(), plus
+    the codes of the SECRETS_PER_BANK windows before, which are reported as expired.
+    """
+    key, seconds = derivation_key(config), config["SECRET_WINDOW_SECONDS"]
+    result = []
+    codes = {}
+    previous_codes = set()
+    banks = get_read_session().execute(select(Bank.name, Bank.bank_code).order_by(Bank.id)).all()
+    for name, bank_code in banks:
+        secrets = derived_codes(key, bank_code, window, SECRETS_PER_BANK, seconds)
+        result.append({
+            "bank_name": name,
+            "bank_code": bank_code,
+            "secrets": [{"code": code, "generated_at": generated_at.isoformat()} for code, generated_at in secrets]
+        })
+        for code, generated_at in secrets:
+            codes[(bank_code, code)] = generated_at
+        for code, _ in derived_codes(key, bank_code, window - SECRETS_PER_BANK, SECRETS_PER_BANK, seconds):
+            previous_codes.add((bank_code, code))
+    # A code recurring within the published windows is valid, not expired
+    return {"banks": result}, codes, frozenset(previous_codes - codes.keys())
+
+
+def refresh_secrets_snapshot():
+    """
+    Rebuild the snapshot from the database and swap it in atomically.
+
+    Must be called inside an application context, e.g. right after a secret rotation
+    has been committed. Returns the new snapshot.
+    """
+    with _rebuild_lock:
+        return _rebuild_snapshot()
+
+
+def retire_codes(previous, codes, retention):
+    """
+    Return the replaced codes of a new snapshot with the current ``codes``: the codes of
+    the ``previous`` snapshot that are gone, plus those it already remembered for less
+    than ``retention`` seconds.
+    """
+    now = time.monotonic()
+    retired = {}
+    if previous is not None and previous.valid_until is None:
+        retired = {
+            key: retired_at for key, retired_at in previous.previous_codes.items()
+            if now - retired_at < retention and key not in codes
+        }
+        retired.update(dict.fromkeys(previous.codes.keys() - codes.keys(), now))
+    return retired
+
+
+def _rebuild_snapshot():
+    """
+    Build and swap in a new snapshot; the caller holds _rebuild_lock.
+    """
+    global _snapshot
+    # Start a new read transaction so that a rotation committed just before is visible
+    close_read_session()
+    config = current_app.config
+    valid_until = None
+    if config["SECRET_ROTATION_MODE"] == "derived":
+        # The window index takes the place of the rotation version
+        rotation_version = window_index(time.time(), config["SECRET_WINDOW_SECONDS"])
+        valid_until = (rotation_version + 1) * config["SECRET_WINDOW_SECONDS"]
+        payload, codes, previous_codes = build_derived_payload(config, rotation_version)
+        close_read_session()
+    else:
+        # Read the version first: if a rotation commits meanwhile, the next check rebuilds again
+        rotation_version = read_rotation_version()
+        payload, codes = build_secrets_payload()
+        # Codes that left the table are remembered so they can be reported as expired
+        previous_codes = retire_codes(_snapshot, codes, config["SECRET_VALIDITY_SECONDS"])
+    # Match the compact, key-sorted output of Flask's jsonify
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    # Content hash: identical data yields the same ETag in every worker process
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    # A single reference assignment, so readers always see a complete snapshot
+    _snapshot = SecretsSnapshot(body, etag, rotation_version, time.monotonic(), codes, previous_codes, valid_until)
+    return _snapshot
+
+
+def fresh_secrets_snapshot(interval):
+    """
+    Return the current snapshot if it was validated less than ``interval`` seconds ago,
+    otherwise None.
+    """
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.checked_at < interval and not snapshot.expired():
+        return snapshot
+    return None
+
+
+def get_secrets_snapshot():
+    """
+    Return the current snapshot.
+
+    If the snapshot has not been validated for SECRETS_VERSION_CHECK_INTERVAL seconds,
+    the stored rotation version is compared with the snapshot's version (a single
+    primary-key lookup) and the snapshot is rebuilt only if a rotation happened. Derived
+    secrets are rebuilt once their time window has ended. Only one thread checks or
+    rebuilds at a time; concurrent callers wait for it.
+    """
+    global _snapshot
+    interval = current_app.config["SECRETS_VERSION_CHECK_INTERVAL"]
+    snapshot = fresh_secrets_snapshot(interval)
+    if snapshot is not None:
+        CACHE_HITS.inc("secrets_snapshot")
+        return snapshot
+
+    CACHE_MISSES.inc("secrets_snapshot")
+    with _rebuild_lock:
+        # Another thread may have checked or rebuilt the snapshot while we were waiting
+        snapshot = fresh_secrets_snapshot(interval)
+        if snapshot is not None:
+            return snapshot
+        snapshot = _snapshot
+        if snapshot is not None and (
+            not snapshot.expired() if snapshot.valid_until is not None
+            else read_rotation_version() == snapshot.rotation_version
+        ):
+            # Nothing changed; keep serving the same bytes
+            _snapshot = snapshot.checked(time.monotonic())
+            return _snapshot
+        return _rebuild_snapshot()
+
+
+def validate_secret(bank_code, code):
+    """
+    Check a single secret code of a bank.
+
+    Returns "valid", "expired" (the code was replaced within the last
+    SECRET_VALIDITY_SECONDS or is older than that) or "invalid". Codes found in the in-memory table are
+    answered without database work; unknown codes fall back to an indexed lookup on
+    (bank_code, secret), which covers rotations committed since the last version check.
+    Derived secrets are never stored, so they are checked against the snapshot only.
+    """
+    snapshot = get_secrets_snapshot()
+    key = (bank_code, code)
+    generated_at = snapshot.codes.get(key)
+    if generated_at is None:
+        if key in snapshot.previous_codes:
+            return "expired"
+        if snapshot.valid_until is not None:
+            return "invalid"
+        generated_at = get_read_session().execute(
+            select(BankSecret.generated_at)
+            .where(BankSecret.bank_code == bank_code, BankSecret.secret == code)
+            .order_by(BankSecret.generated_at.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+        if generated_at is None:
+            return "invalid"
+
+    validity = timedelta(seconds=current_app.config["SECRET_VALIDITY_SECONDS"])
+    if datetime.utcnow() - generated_at > validity:
+        return "expired"
+    return "valid"
@@ -0,0 +1,126 @@
+"""
+Serialization helpers for the application.
+
+Serializing users one by one through ``User.as_dict()`` lazily loads every user's bank
+and every bank's secrets, which costs 1 + N + N queries for N users. The helpers in
+this module load all banks referenced by a set of users up front (one query for the
+banks, one for their secrets) and reuse the resulting dictionaries, so serializing
+any number of users takes a constant number of queries.
+
+Clients that only need a few fields (typically the balance) pass ``?fields=`` with a
+comma-separated list of User.as_dict() keys. Only the columns behind those fields are
+selected and serialized, and banks are not loaded at all unless "bank" is requested.
+Without "bank", lists select plain rows (user_columns) instead of User objects, which
+skips the ORM's per-object bookkeeping.
+"""
+
+from sqlalchemy.orm import load_only, selectinload
+from app.models import USER_FIELDS, Bank, User
+from app.extensions import db
+
+# Maximum number of bank codes used in a single IN (...) lookup
+BANK_LOOKUP_CHUNK_SIZE = 500
+
+
+def bank_query(session=None):
+    """
+    Return a Bank query that eager-loads secrets with a single SELECT ... IN.
+
+    Uses the primary session unless another ``session`` (e.g. the read session) is given.
+    """
+    return (session or db.session).query(Bank).options(selectinload(Bank.secrets))
+
+
+class BankDictCache:
+    """
+    Caches serialized banks by bank code and loads missing ones in bulk.
+
+    A single instance can be reused across batches (e.g. while streaming) so each
+    bank is loaded and serialized at most once per request.
+    """
+
+    def __init__(self, session=None):
+        self._session = session
+        self._banks = {}
+
+    def load(self, bank_codes):
+        """
+        Load and serialize every bank in ``bank_codes`` that is not cached yet.
+        """
+        missing = sorted({code for code in bank_codes if code} - self._banks.keys())
+        for start in range(0, len(missing), BANK_LOOKUP_CHUNK_SIZE):
+            chunk = missing[start:start + BANK_LOOKUP_CHUNK_SIZE]
+            for bank in bank_query(self._session).filter(Bank.bank_code.in_(chunk)).all():
+                self._banks[bank.bank_code] = bank.as_dict()
+        return self._banks
+
+
+def serialize_users(users, bank_cache=None, fields=None):
+    """
+    Serialize a list of users with a constant number of queries.
+
+    Args:
+        users (list[User]): Users to serialize; rows selecting user_columns(fields) if
+            ``fields`` does not include "bank".
+        bank_cache (BankDictCache): Optional cache shared across calls.
+        fields (tuple): Optional subset of fields (see parse_fields); banks are only
+            loaded if it contains "bank".
+
+    Returns:
+        list[dict]: One ``as_dict()`` representation per user.
+    """
+    if not includes_bank(fields):
+        getters = [(field, USER_FIELDS[field][1]) for field in fields]
+        return [{field: getter(user) for field, getter in getters} for user in users]
+    bank_cache = bank_cache or BankDictCache()
+    bank_map = bank_cache.load(user.bank_code for user in users)
+    return [user.as_dict(bank_map=bank_map, fields=fields) for user in users]
+
+
+def parse_fields(value):
+    """
+    Parse a ``fields`` query parameter ("balance,bank_code") into a tuple of field names.
+
+    Returns None (all fields) for a missing or empty value. Raises ValueError naming
+    unknown fields.
+    """
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in USER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(USER_FIELDS)}")
+    return fields or None
+
+
+def includes_bank(fields):
+    """
+    Return True if serializing ``fields`` needs the users' banks (and thus User objects).
+    """
+    return fields is None or "bank" in fields
+
+
+def user_columns(fields):
+    """
+    Return the User columns needed to serialize ``fields`` (without "bank") from rows.
+    """
+    columns = {"matriculationNumber"}
+    for field in fields:
+        columns.update(USER_FIELDS[field][0])
+    return [getattr(User, column) for column in sorted(columns)]
+
+
+def user_load_options(fields):
+    """
+    Return the query options that load only the columns needed to serialize ``fields``.
+    """
+    return load_only(*user_columns(fields))
+
+
+def project(data, fields):
+    """
+    Reduce an already serialized user to ``fields`` (None keeps everything).
+    """
+    if fields is None:
+        return data
+    return {field: data[field] for field in fields}
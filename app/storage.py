@@ -0,0 +1,221 @@
+"""
+Storage module for the application.
+
+Selects a named storage profile (STORAGE_PROFILE) that tunes the SQLite connection
+(journal mode, synchronous level, busy timeout, memory-mapped I/O) and the connection
+pool. Engine and pool options are passed to Flask-SQLAlchemy through
+SQLALCHEMY_ENGINE_OPTIONS; SQLite pragmas are applied to every new DBAPI connection by a
+``connect`` event listener, because they are per-connection settings.
+
+Read-only endpoints use a separate "read" engine (bind key READ_BIND_KEY) with its own
+connection pool. It points to SQLALCHEMY_READ_DATABASE_URI, or to the primary database
+when no replica is configured. In WAL mode readers and the single writer do not block
+each other, so reads no longer queue behind balance updates or secret rotations.
+"""
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from app.extensions import db
+
+# Bind key of the read-only engine in SQLALCHEMY_BINDS
+READ_BIND_KEY = "read"
+
+# Async drivers used by the ASGI serving mode (see app.asgi), by backend name
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+# Named storage profiles. "pragmas" are applied to each SQLite connection in this order,
+# "pool" is passed to create_engine() for every engine.
+STORAGE_PROFILES = {
+    # SQLite defaults (rollback journal, synchronous FULL), as before profiles existed.
+    # Note that journal_mode=WAL is persistent: a database once opened in WAL mode stays in it.
+    "legacy": {
+        "pragmas": {},
+        "pool": {},
+    },
+    # WAL with synchronous NORMAL: durable across application crashes, a power loss can
+    # only drop the most recent commits
+    "balanced": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "mmap_size": 256 * 1024 * 1024,
+        },
+        "pool": {"pool_size": 10, "max_overflow": 10, "pool_timeout": 30},
+    },
+    # WAL with synchronous FULL: every commit is durable, at the cost of one fsync per commit
+    "durable": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "FULL",
+            "busy_timeout": 10000,
+            "mmap_size": 0,
+        },
+        "pool": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 30},
+    },
+    # WAL without fsync; for benchmarks and disposable databases only
+    "throughput": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "busy_timeout": 5000,
+            "mmap_size": 1024 * 1024 * 1024,
+            "temp_store": "MEMORY",
+        },
+        "pool": {"pool_size": 20, "max_overflow": 20, "pool_timeout": 30},
+    },
+}
+
+
+def is_sqlite_memory(uri):
+    """
+    Return True for SQLite in-memory URIs, which cannot be shared between engines.
+    """
+    url = make_url(uri)
+    return (
+        url.get_backend_name() == "sqlite"
+        and (url.database in (None, "", ":memory:") or url.query.get("mode") == "memory")
+    )
+
+
+def get_storage_profile(name):
+    """
+    Return the storage profile called ``name``.
+
+    Raises:
+        ValueError: if no such profile exists.
+    """
+    try:
+        return STORAGE_PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown STORAGE_PROFILE {name!r}; expected one of {', '.join(sorted(STORAGE_PROFILES))}"
+        ) from None
+
+
+def _apply_pragmas(pragmas, query_only=False):
+    """
+    Return a ``connect`` listener that applies ``pragmas`` to each new SQLite connection.
+    """
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            if query_only:
+                # Guard against accidental writes through the read engine
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def init_storage(app):
+    """
+    Configure the engines for the selected storage profile and initialize Flask-SQLAlchemy.
+
+    Engine options already present in the app config take precedence over the profile.
+    The read engine is skipped for in-memory SQLite databases, which cannot be shared
+    between engines; read-only endpoints then use the primary session.
+    """
+    profile = get_storage_profile(app.config["STORAGE_PROFILE"])
+    primary_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    read_uri = app.config.get("SQLALCHEMY_READ_DATABASE_URI") or primary_uri
+
+    # In-memory databases use a StaticPool, which does not accept pool sizing options
+    if not is_sqlite_memory(primary_uri):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            **profile["pool"],
+            **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+        }
+    if not is_sqlite_memory(read_uri):
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds.setdefault(READ_BIND_KEY, {"url": read_uri})
+        app.config["SQLALCHEMY_BINDS"] = binds
+
+    db.init_app(app)
+
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            event.listen(
+                engine,
+                "connect",
+                _apply_pragmas(profile["pragmas"], query_only=bind_key == READ_BIND_KEY)
+            )
+
+    app.teardown_appcontext(close_read_session)
+
+
+def get_read_session():
+    """
+    Return a session bound to the read engine for the current application context.
+
+    Only use it for queries; objects loaded through it must not be modified. Falls
+    back to the primary session when no read engine is configured.
+    """
+    engine = db.engines.get(READ_BIND_KEY)
+    if engine is None:
+        return db.session
+    if "read_session" not in g:
+        g.read_session = Session(bind=engine, autoflush=False)
+    return g.read_session
+
+
+def close_read_session(exception=None):
+    session = g.pop("read_session", None)
+    if session is not None:
+        session.close()
+
+
+def to_async_url(uri):
+    """
+    Return ``uri`` with its driver replaced by the matching async driver.
+
+    Raises:
+        ValueError: if no async driver is known for the backend.
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend {backend!r}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_async_engines(app):
+    """
+    Create async engines for the primary and the read database.
+
+    They use the same storage profile as the sync engines: identical pool options and
+    SQLite pragmas (applied through the ``connect`` event of the underlying sync engine).
+    Returns a tuple (engine, read_engine).
+
+    Raises:
+        ValueError: for in-memory SQLite databases, which the sync and async engines
+            could not share.
+    """
+    # Imported here so the sync deployment does not need the async extras
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    profile = get_storage_profile(app.config["STORAGE_PROFILE"])
+    primary_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    read_uri = app.config.get("SQLALCHEMY_READ_DATABASE_URI") or primary_uri
+    if is_sqlite_memory(primary_uri) or is_sqlite_memory(read_uri):
+        raise ValueError("The async serving mode requires a file or server database")
+
+    def make_engine(uri, query_only):
+        engine = create_async_engine(
+            to_async_url(uri),
+            **{**profile["pool"], **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})}
+        )
+        if engine.dialect.name == "sqlite":
+            event.listen(engine.sync_engine, "connect", _apply_pragmas(profile["pragmas"], query_only))
+        return engine
+
+    return make_engine(primary_uri, query_only=False), make_engine(read_uri, query_only=True)
@@ -0,0 +1,270 @@
+"""
+Bulk user import module for the application.
+
+Onboarding a semester through /api/register costs one duplicate-check SELECT, one
+password hash and one commit per student. The importer reads a CSV or NDJSON stream
+with the same fields (matriculationNumber, lastName, firstName, password,
+accountNumber, optionally bank_code) and processes it in chunks of IMPORT_CHUNK_SIZE
+rows:
+
+- rows are validated, and duplicates within the chunk are rejected
+- one set-based query per chunk finds matriculation and account numbers that
+  already exist
+- passwords are hashed in parallel on the password pool; only a pre-hashed import
+  (``prehashed``) stores well-formed werkzeug hashes as they are
+- the accepted rows are inserted with a single executemany and committed
+
+Field values must be strings (NDJSON integers are accepted and converted); any other
+JSON value rejects the row.
+
+Only one chunk is held in memory at a time and rejected rows are reported as they are
+found, so files of any size can be imported. /api/import_users spools the upload
+(spool_upload()) before it starts streaming its response: many WSGI servers cannot
+read the request body once the response has started. Each chunk is committed on its own: if an
+import is interrupted, running it again rejects the rows already imported as
+duplicates and imports the rest.
+"""
+
+import csv
+import io
+import json
+import shutil
+import tempfile
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from app.models import Bank, User
+from app.extensions import db
+from app.passwords import is_password_hash, is_valid_password_hash
+
+# Fields every imported row must provide
+REQUIRED_FIELDS = ("matriculationNumber", "lastName", "firstName", "password", "accountNumber")
+# Supported upload formats
+FORMATS = ("csv", "ndjson")
+
+
+class Rejection:
+    """
+    A row that was not imported: its line number, matriculation number and the reason.
+    """
+    __slots__ = ("line", "matriculationNumber", "error")
+
+    def __init__(self, line, matriculation_number, error):
+        self.line = line
+        self.matriculationNumber = matriculation_number
+        self.error = error
+
+    def as_dict(self):
+        return {"line": self.line, "matriculationNumber": self.matriculationNumber, "error": self.error}
+
+
+def spool_upload(stream, max_memory):
+    """
+    Copy an upload into a SpooledTemporaryFile (kept in memory up to ``max_memory``
+    bytes) and return it rewound. The caller closes it.
+    """
+    upload = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    try:
+        shutil.copyfileobj(stream, upload)
+        upload.seek(0)
+    except BaseException:
+        upload.close()
+        raise
+    return upload
+
+
+def read_rows(stream, format):
+    """
+    Yield (line, row) tuples from a binary stream; ``row`` is a dict, or a Rejection
+    for lines that cannot be parsed.
+    """
+    if not isinstance(stream, io.BufferedIOBase):
+        stream = io.BufferedReader(stream)
+    # utf-8-sig drops the byte order mark spreadsheet programs put in front of CSV exports
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except csv.Error as e:
+            yield reader.line_num, Rejection(reader.line_num, None, f"Malformed CSV: {e}")
+        return
+
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as e:
+            yield line, Rejection(line, None, f"Malformed JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line, Rejection(line, None, "Expected a JSON object")
+            continue
+        yield line, row
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def text_value(value):
+    """
+    Return a field value as a string, or None if it is neither a string nor an integer.
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def validate_row(line, row, bank_codes, prehashed=False):
+    """
+    Return the insert parameters for a row, or a Rejection.
+
+    With ``prehashed``, passwords that look like werkzeug hashes must be well-formed
+    hashes; they are stored as they are.
+    """
+    number = row.get("matriculationNumber")
+    missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        return Rejection(line, number, f"Missing required data: {', '.join(missing)}")
+    values = {}
+    for field in REQUIRED_FIELDS:
+        value = text_value(row[field])
+        if value is None:
+            return Rejection(line, number, f"{field} must be a string")
+        values[field] = value.strip()
+    for field in ("matriculationNumber", "lastName", "firstName", "accountNumber"):
+        length = User.__table__.c[field].type.length
+        if length and len(values[field]) > length:
+            return Rejection(line, number, f"{field} is longer than {length} characters")
+    if prehashed and is_password_hash(values["password"]) and not is_valid_password_hash(values["password"]):
+        return Rejection(line, number, "password is not a valid password hash")
+    bank_code = row.get("bank_code") or None
+    if bank_code is not None:
+        bank_code = text_value(bank_code)
+        if bank_code is None:
+            return Rejection(line, number, "bank_code must be a string")
+        if bank_code not in bank_codes:
+            return Rejection(line, number, f"Unknown bank_code {bank_code!r}")
+    values.update(bank_code=bank_code, balance=0.0, daily_transaction_count=0,
+                  high_risk_aborted_count=0, last_transaction_risk_value=0)
+    return values
+
+
+class UserImporter:
+    """
+    Imports users chunk by chunk and reports rejected rows.
+
+    Args:
+        hasher (PasswordHasher): Pool used to hash plaintext passwords.
+        chunk_size (int): Rows validated, checked and inserted together.
+        prehashed (bool): Store passwords that are valid werkzeug hashes without hashing
+            them again (e.g. when migrating users from another system).
+    """
+
+    def __init__(self, hasher, chunk_size, prehashed=False):
+        self.hasher = hasher
+        self.chunk_size = chunk_size
+        self.prehashed = prehashed
+        self.imported = 0
+        self.rejected = 0
+        self.bank_codes = set(db.session.execute(select(Bank.bank_code)).scalars())
+        db.session.rollback()
+
+    def run(self, rows):
+        """
+        Import ``rows`` from read_rows() and yield a Rejection for every row not imported.
+        """
+        for chunk in chunked(rows, self.chunk_size):
+            for rejection in self.import_chunk(chunk):
+                self.rejected += 1
+                yield rejection
+
+    def summary(self):
+        return {"imported": self.imported, "rejected": self.rejected}
+
+    def import_chunk(self, chunk):
+        """
+        Validate, de-duplicate, hash and insert one chunk. Returns its rejections.
+        """
+        rejections = []
+        accepted = []
+        seen_numbers, seen_accounts = set(), set()
+        for line, row in chunk:
+            values = row if isinstance(row, Rejection) else validate_row(line, row, self.bank_codes, self.prehashed)
+            if isinstance(values, Rejection):
+                rejections.append(values)
+            elif values["matriculationNumber"] in seen_numbers:
+                rejections.append(Rejection(line, values["matriculationNumber"], "Duplicate matriculation number in upload"))
+            elif values["accountNumber"] in seen_accounts:
+                rejections.append(Rejection(line, values["matriculationNumber"], "Duplicate account number in upload"))
+            else:
+                seen_numbers.add(values["matriculationNumber"])
+                seen_accounts.add(values["accountNumber"])
+                accepted.append((line, values))
+        if not accepted:
+            return rejections
+
+        # Only rows that pass the duplicate check are worth the expensive hashing
+        rows, duplicates = self.filter_existing(accepted)
+        # End the read transaction before the (slow) key derivation
+        db.session.rollback()
+        plaintext = [values for _, values in rows
+                     if not (self.prehashed and is_password_hash(values["password"]))]
+        for values, password_hash in zip(plaintext, self.hasher.hash_many([values["password"] for values in plaintext])):
+            values["password"] = password_hash
+
+        for attempt in range(2):
+            try:
+                if rows:
+                    db.session.execute(insert(User.__table__), [values for _, values in rows])
+                db.session.commit()
+                break
+            except IntegrityError as e:
+                db.session.rollback()
+                if attempt == 0:
+                    # A user was registered concurrently; check the chunk again and retry
+                    rows, more = self.filter_existing(rows)
+                    duplicates += more
+                else:
+                    rejections.extend(Rejection(line, values["matriculationNumber"], f"Error saving data: {e.orig}")
+                                      for line, values in rows)
+                    rows = []
+        rejections.extend(duplicates)
+        self.imported += len(rows)
+        rejections.sort(key=lambda rejection: rejection.line)
+        return rejections
+
+    def filter_existing(self, accepted):
+        """
+        Split rows into new ones and rejections for numbers that already exist, with
+        one query for the whole chunk.
+        """
+        numbers = [values["matriculationNumber"] for _, values in accepted]
+        accounts = [values["accountNumber"] for _, values in accepted]
+        existing = db.session.execute(
+            select(User.matriculationNumber, User.accountNumber)
+            .where(or_(User.matriculationNumber.in_(numbers), User.accountNumber.in_(accounts)))
+        ).all()
+        existing_numbers = {row.matriculationNumber for row in existing}
+        existing_accounts = {row.accountNumber for row in existing}
+
+        rows, duplicates = [], []
+        for line, values in accepted:
+            if values["matriculationNumber"] in existing_numbers:
+                duplicates.append(Rejection(line, values["matriculationNumber"], "Matriculation number already exists"))
+            elif values["accountNumber"] in existing_accounts:
+                duplicates.append(Rejection(line, values["matriculationNumber"], "Account number already exists"))
+            else:
+                rows.append((line, values))
+        return rows, duplicates
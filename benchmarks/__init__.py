@@ -0,0 +1,7 @@
+"""
+Benchmark scripts for the StudiPay backend.
+
+Each module is runnable on its own from the repository root, e.g.
+``python -m benchmarks.bench_balance_concurrency``. Benchmarks always run against a
+throw-away SQLite database and never touch the configured application database.
+"""
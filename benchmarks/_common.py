@@ -0,0 +1,99 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Provides a factory for an application instance bound to a temporary SQLite database,
+user seeding and small timing/statistics utilities.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+
+def create_bench_app(db_dir=None, **env):
+    """
+    Create an application instance backed by a fresh SQLite file.
+
+    The DATABASE_URL environment variable is set before the app package is imported,
+    because Config reads it at import time. The secret rotation scheduler and admission
+    control are disabled so they cannot interfere with measurements. Extra keyword
+    arguments are exported as environment variables as well.
+
+    Returns:
+        tuple: (app, db_path)
+    """
+    db_dir = db_dir or tempfile.mkdtemp(prefix="studipay-bench-")
+    db_path = os.path.join(db_dir, "bench.db")
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    os.environ.setdefault("SCHEDULER_ENABLED", "0")
+    os.environ.setdefault("ADMISSION_ENABLED", "0")
+    for key, value in env.items():
+        os.environ[key] = str(value)
+
+    from app import create_app
+    return create_app(), db_path
+
+
+def seed_users(app, count, balance=0.0, prefix="B", bank_code="TG12345"):
+    """
+    Insert ``count`` synthetic users with a fixed starting balance.
+
+    Returns the list of generated matriculation numbers.
+    """
+    from app.extensions import db
+    from app.models import User
+
+    numbers = [f"{prefix}{i:07d}" for i in range(count)]
+    with app.app_context():
+        db.session.execute(
+            User.__table__.insert(),
+            [
+                {
+                    "matriculationNumber": number,
+                    "lastName": "Bench",
+                    "firstName": f"User{i}",
+                    "password": "secret",
+                    "accountNumber": f"AC{prefix}{i:09d}",
+                    "balance": balance,
+                    "bank_code": bank_code,
+                    "daily_transaction_count": 0,
+                    "high_risk_aborted_count": 0,
+                    "last_transaction_risk_value": 0,
+                }
+                for i, number in enumerate(numbers)
+            ]
+        )
+        db.session.commit()
+    return numbers
+
+
+def run_threads(worker, threads):
+    """
+    Run ``worker(thread_index)`` on ``threads`` threads and return the wall-clock time.
+    """
+    barrier = threading.Barrier(threads + 1)
+
+    def target(index):
+        barrier.wait()
+        worker(index)
+
+    pool = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def percentile(samples, pct):
+    """
+    Return the ``pct`` percentile (0-100) of a list of samples using nearest rank.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
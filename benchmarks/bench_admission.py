@@ -0,0 +1,133 @@
+"""
+Admission control benchmark.
+
+1. Overhead: times AdmissionController.admit() + release() in isolation, for one
+   client, for more distinct clients than the bucket tables hold (every call evicts
+   one) and with --threads threads contending for the lock. The cost of a whole
+   /api/verify_transaction request is measured as well, with admission on and off.
+2. Noisy neighbour: --threads threads of one client loop on /api/verify_transaction
+   while a second client sends one request every 10 ms. Reports the quiet client's
+   latency and how many of the noisy client's requests were served or rejected, with
+   admission on and off. Each mode runs in its own subprocess, because Config reads
+   ADMISSION_ENABLED when the app package is imported.
+
+Usage:
+    python -m benchmarks.bench_admission [--threads 8] [--seconds 5]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from benchmarks._common import create_bench_app, percentile, run_threads, seed_users
+
+
+def time_admissions(controller, clients, iterations, threads=1):
+    """
+    Return the mean wall-clock nanoseconds of one admit() + release() pair.
+    """
+    per_thread = iterations // threads
+
+    def worker(index):
+        for i in range(per_thread):
+            if controller.admit(clients[(index + i * threads) % len(clients)], "/api/verify_transaction") is None:
+                controller.release()
+
+    elapsed = run_threads(worker, threads)
+    return round(elapsed / (per_thread * threads) * 1e9)
+
+
+def run_overhead(iterations, threads):
+    from app.admission import AdmissionController
+
+    def controller():
+        # Rates high enough that no call is rejected, so every call takes the full path
+        return AdmissionController(1e9, 10 ** 9, 1e9, 10 ** 9, {}, 0, 100000)
+
+    return {
+        "one_client_ns": time_admissions(controller(), ["10.0.0.1"], iterations),
+        "evicting_clients_ns": time_admissions(controller(), [f"10.0.{i // 256}.{i % 256}" for i in range(200000)],
+                                               iterations),
+        f"{threads}_threads_ns": time_admissions(controller(), [f"10.0.0.{i}" for i in range(threads)],
+                                                 iterations, threads),
+    }
+
+
+def run_mode(enabled, threads, seconds):
+    app, _ = create_bench_app(
+        ADMISSION_ENABLED="1" if enabled else "0",
+        ADMISSION_CLIENT_HEADER="X-Client-Id",
+        ADMISSION_CLIENT_RATE=100,
+        ADMISSION_ROUTE_RATE=50
+    )
+    numbers = seed_users(app, 1000, balance=1000.0)
+
+    # Cost of a single request without contention
+    client = app.test_client()
+    samples = []
+    for i in range(2000):
+        started = time.perf_counter()
+        client.post("/api/verify_transaction", json={"matriculationNumber": numbers[i % len(numbers)], "amount": 1},
+                    headers={"X-Client-Id": f"terminal-{i}"})
+        samples.append(time.perf_counter() - started)
+    request_us = round(sum(samples) / len(samples) * 1e6, 1)
+
+    noisy = Counter()
+    quiet = []
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            payload = {"matriculationNumber": numbers[index], "amount": 1}
+            if index < threads:
+                response = client.post("/api/verify_transaction", json=payload, headers={"X-Client-Id": "noisy"})
+                noisy[response.status_code] += 1
+            else:
+                started = time.perf_counter()
+                client.post("/api/verify_transaction", json=payload, headers={"X-Client-Id": "quiet"})
+                quiet.append(time.perf_counter() - started)
+                time.sleep(0.01)
+
+    run_threads(worker, threads + 1)
+    return {
+        "request_us": request_us,
+        "quiet_p50_ms": round(percentile(quiet, 50) * 1000, 2),
+        "quiet_p99_ms": round(percentile(quiet, 99) * 1000, 2),
+        "quiet_requests": len(quiet),
+        "noisy_statuses": {str(status): count for status, count in sorted(noisy.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--mode", choices=["on", "off"], help="run a single mode in this process and print its result")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode == "on", args.threads, args.seconds)))
+        return
+
+    results = {}
+    for mode in ("off", "on"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_admission", "--mode", mode,
+             "--threads", str(args.threads), "--seconds", str(args.seconds)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(json.dumps({
+        "overhead": run_overhead(args.iterations, args.threads),
+        "noisy_neighbour": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Load test for the async serving mode.
+
+Seeds a database and starts two servers on it:
+
+- sync: the Flask app (run:app) on waitress with a fixed pool of --threads threads
+- async: app.asgi:app on uvicorn
+
+It first sends the same requests to both servers and checks that status codes and
+JSON bodies match; write requests go to two identically seeded accounts, one per
+server. Then, for each concurrency level, that many clients loop over a mix of
+verify_transaction (70%), add_balance (20%) and all_secrets (10%) for a fixed time.
+Reports throughput, errors and p50/p99 latency per mode and level; sync throughput
+stops growing once all pool threads are busy. With --group-commit both servers run
+with GROUP_COMMIT_ENABLED=1, so add_balance credits go through app.group_commit.
+
+Requires the async extras plus the load generator and the sync server:
+    pip install -r requirements-async.txt httpx waitress
+
+Usage:
+    python -m benchmarks.bench_async_mode [--levels 8,64,256] [--threads 8] [--seconds 10] [--group-commit]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks._common import create_bench_app, percentile, seed_users
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/all_secrets", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start: {' '.join(command)}")
+
+
+# User fields that differ between the two seeded accounts used by the parity check
+IDENTITY_FIELDS = {"matriculationNumber", "firstName", "accountNumber"}
+
+
+def normalize(body):
+    if isinstance(body, dict) and isinstance(body.get("user"), dict):
+        user = {key: value for key, value in body["user"].items() if key not in IDENTITY_FIELDS}
+        return {**body, "user": user}
+    return body
+
+
+async def check_parity(sync_url, async_url, numbers):
+    """
+    Send identical requests to both servers and return the list of mismatches.
+
+    "{user}" in a payload is replaced by a different, identically seeded account per
+    server, so writes made by one server do not change the other server's answers.
+    """
+    requests = [
+        ("POST", "/api/verify_transaction", {"matriculationNumber": "{user}", "amount": 1}),
+        ("POST", "/api/verify_transaction", {"matriculationNumber": "{user}", "amount": 10 ** 9}),
+        ("POST", "/api/verify_transaction", {"matriculationNumber": "missing", "amount": 1}),
+        ("POST", "/api/verify_transaction", {}),
+        ("POST", "/api/add_balance", {"matriculationNumber": "{user}", "amount": 5}),
+        ("POST", "/api/add_balance", {"matriculationNumber": "missing", "amount": 5}),
+        ("POST", "/api/deduct_balance", {"matriculationNumber": "{user}", "amount": 5}),
+        ("POST", "/api/deduct_balance", {"matriculationNumber": "{user}", "amount": 10 ** 9}),
+        ("POST", "/api/deduct_balance", {"matriculationNumber": "missing", "amount": 5}),
+        ("GET", "/api/all_secrets", None),
+    ]
+    mismatches = []
+    async with httpx.AsyncClient() as client:
+        for method, path, payload in requests:
+            responses = []
+            for base, number in ((sync_url, numbers[0]), (async_url, numbers[1])):
+                if payload and payload.get("matriculationNumber") == "{user}":
+                    body = {**payload, "matriculationNumber": number}
+                else:
+                    body = payload
+                responses.append(await client.request(method, base + path, json=body))
+            statuses = [response.status_code for response in responses]
+            bodies = [normalize(response.json()) for response in responses]
+            if statuses[0] != statuses[1] or bodies[0] != bodies[1]:
+                mismatches.append({"request": [method, path, payload], "status": statuses})
+        # Conditional polling must answer 304 in both modes
+        for base in (sync_url, async_url):
+            etag = (await client.get(base + "/api/all_secrets")).headers["etag"]
+            response = await client.get(base + "/api/all_secrets", headers={"If-None-Match": etag})
+            if response.status_code != 304:
+                mismatches.append({"request": ["GET", "/api/all_secrets", "If-None-Match"], "base": base})
+    return mismatches
+
+
+async def run_level(url, numbers, concurrency, seconds):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def client_loop(seed):
+            nonlocal errors
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                number = rng.choice(numbers)
+                roll = rng.random()
+                started = time.perf_counter()
+                try:
+                    if roll < 0.7:
+                        response = await client.post("/api/verify_transaction",
+                                                     json={"matriculationNumber": number, "amount": 1})
+                    elif roll < 0.9:
+                        response = await client.post("/api/add_balance",
+                                                     json={"matriculationNumber": number, "amount": 1})
+                    else:
+                        response = await client.get("/api/all_secrets")
+                    ok = response.status_code in (200, 400)
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(seed) for seed in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--levels", default="8,64,256")
+    parser.add_argument("--threads", type=int, default=8, help="waitress threads for the sync server")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--group-commit", action="store_true", help="run both servers with GROUP_COMMIT_ENABLED=1")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    app, db_path = create_bench_app()
+    numbers = seed_users(app, args.users, balance=1000.0)
+    env = {**os.environ, "DATABASE_URL": "sqlite:///" + db_path, "SCHEDULER_ENABLED": "0"}
+    if args.group_commit:
+        env["GROUP_COMMIT_ENABLED"] = "1"
+
+    sync_port, async_port = free_port(), free_port()
+    servers = [
+        start_server([sys.executable, "-m", "waitress", f"--threads={args.threads}",
+                      f"--listen=127.0.0.1:{sync_port}", "run:app"], sync_port, env),
+        start_server([sys.executable, "-m", "uvicorn", "app.asgi:app", "--host", "127.0.0.1",
+                      "--port", str(async_port), "--log-level", "warning", "--no-access-log"], async_port, env),
+    ]
+    urls = {"sync": f"http://127.0.0.1:{sync_port}", "async": f"http://127.0.0.1:{async_port}"}
+
+    try:
+        mismatches = asyncio.run(check_parity(urls["sync"], urls["async"], numbers))
+        results = {
+            mode: {str(level): asyncio.run(run_level(url, numbers, level, args.seconds)) for level in levels}
+            for mode, url in urls.items()
+        }
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({
+        "users": args.users,
+        "sync_threads": args.threads,
+        "seconds": args.seconds,
+        "group_commit": args.group_commit,
+        "parity_mismatches": mismatches,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Concurrency benchmark for /api/add_balance and /api/deduct_balance.
+
+Many threads hammer a single hot account with an equal number of credits and debits,
+so the final balance must equal the starting balance plus the net effect of all
+successful requests. The benchmark runs twice:
+
+- legacy: the previous read-modify-write implementation (SELECT the User, change
+  ``user.balance`` in Python, commit), registered on temporary routes
+- atomic: the current endpoints, built on a single conditional UPDATE
+
+For each run it reports throughput, failed requests and the balance drift, which is
+non-zero whenever updates were lost.
+
+Usage:
+    python -m benchmarks.bench_balance_concurrency [--threads 8] [--ops 200]
+"""
+
+import argparse
+import json
+
+from flask import jsonify, request
+
+from benchmarks._common import create_bench_app, run_threads, seed_users
+
+
+START_BALANCE = 1_000_000.0
+
+
+def register_legacy_routes(app):
+    """
+    Register the pre-atomic balance endpoints under /bench/legacy_* for comparison.
+    """
+    from app.extensions import db
+    from app.models import User
+
+    def legacy_add_balance():
+        data = request.get_json()
+        user = User.query.filter_by(matriculationNumber=data["matriculationNumber"]).first()
+        try:
+            user.balance += float(data["amount"])
+            db.session.commit()
+            return jsonify({"new_balance": user.balance, "user": user.as_dict()}), 200
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    def legacy_deduct_balance():
+        data = request.get_json()
+        amount = float(data["amount"])
+        user = User.query.filter_by(matriculationNumber=data["matriculationNumber"]).first()
+        if user.balance < amount:
+            return jsonify({"error": "Insufficient balance"}), 400
+        try:
+            user.balance -= amount
+            db.session.commit()
+            return jsonify({"new_balance": user.balance, "user": user.as_dict()}), 200
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    app.add_url_rule("/bench/legacy_add_balance", view_func=legacy_add_balance, methods=["POST"])
+    app.add_url_rule("/bench/legacy_deduct_balance", view_func=legacy_deduct_balance, methods=["POST"])
+
+
+def read_balance(app, matriculation_number):
+    from app.extensions import db
+    from app.models import User
+
+    with app.app_context():
+        return db.session.get(User, matriculation_number).balance
+
+
+def reset_balance(app, matriculation_number):
+    from app.extensions import db
+    from app.models import User
+
+    with app.app_context():
+        db.session.get(User, matriculation_number).balance = START_BALANCE
+        db.session.commit()
+
+
+def hammer(app, matriculation_number, add_path, deduct_path, threads, ops):
+    """
+    Send ``ops`` credit/debit pairs per thread to the given endpoints.
+    """
+    failures = [0] * threads
+    # Net effect of the successful requests per thread; the final balance must match it
+    net = [0.0] * threads
+
+    def worker(index):
+        client = app.test_client()
+        payload = {"matriculationNumber": matriculation_number, "amount": 1.0}
+        for _ in range(ops):
+            for path, sign in ((add_path, 1.0), (deduct_path, -1.0)):
+                response = client.post(path, json=payload)
+                if response.status_code == 200:
+                    net[index] += sign
+                else:
+                    failures[index] += 1
+
+    elapsed = run_threads(worker, threads)
+    requests_sent = threads * ops * 2
+    return {
+        "requests": requests_sent,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests_sent / elapsed, 1),
+        "failed_requests": sum(failures),
+        "expected_balance": START_BALANCE + sum(net),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="credit/debit pairs per thread")
+    args = parser.parse_args()
+
+    app, _ = create_bench_app()
+    register_legacy_routes(app)
+    hot_account = seed_users(app, 1, balance=START_BALANCE, prefix="HOT")[0]
+
+    results = {}
+    for name, add_path, deduct_path in (
+        ("legacy", "/bench/legacy_add_balance", "/bench/legacy_deduct_balance"),
+        ("atomic", "/api/add_balance", "/api/deduct_balance"),
+    ):
+        reset_balance(app, hot_account)
+        run = hammer(app, hot_account, add_path, deduct_path, args.threads, args.ops)
+        final_balance = read_balance(app, hot_account)
+        # Any drift from the expected balance means updates were lost
+        run["final_balance"] = final_balance
+        run["balance_drift"] = round(final_balance - run["expected_balance"], 2)
+        run["exact"] = run["balance_drift"] == 0
+        results[name] = run
+
+    print(json.dumps({"threads": args.threads, "ops_per_thread": args.ops, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
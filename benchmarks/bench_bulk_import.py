@@ -0,0 +1,119 @@
+"""
+Bulk user import benchmark.
+
+Registers --users users into a database that already holds --existing users, once
+with one /api/register request per user and once with a single /api/import_users
+upload, and reports users per second for both. Every run uses a fresh database.
+
+Two cases are measured:
+
+- cheap_hash: PASSWORD_HASH_METHOD is a single pbkdf2 iteration, so the comparison
+  shows the database path (duplicate checks, inserts and commits)
+- default: the configured PASSWORD_HASH_METHOD (scrypt), which dominates both paths;
+  the bulk path hashes a whole chunk on the password pool at once
+
+Each run happens in its own subprocess, because Config reads DATABASE_URL when the
+app package is imported.
+
+Usage:
+    python -m benchmarks.bench_bulk_import [--users 2000] [--existing 20000]
+"""
+
+import argparse
+import csv
+import io
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks._common import create_bench_app, seed_users
+
+FIELDS = ("matriculationNumber", "lastName", "firstName", "password", "accountNumber")
+
+
+def make_users(count, password):
+    return [
+        {
+            "matriculationNumber": f"I{i:07d}",
+            "lastName": "Import",
+            "firstName": f"User{i}",
+            "password": password,
+            "accountNumber": f"ACI{i:09d}",
+        }
+        for i in range(count)
+    ]
+
+
+def as_csv(users):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(users)
+    return output.getvalue().encode("utf-8")
+
+
+def run_register(client, users):
+    started = time.perf_counter()
+    for user in users:
+        response = client.post("/api/register", json=user)
+        assert response.status_code == 200, response.get_json()
+    return time.perf_counter() - started
+
+
+def run_import(client, users):
+    body = as_csv(users)
+    started = time.perf_counter()
+    response = client.post("/api/import_users", data=body, content_type="text/csv")
+    lines = response.get_data(as_text=True).splitlines()
+    elapsed = time.perf_counter() - started
+    summary = json.loads(lines[-1])["summary"]
+    assert summary["imported"] == len(users), lines[:5]
+    return elapsed
+
+
+def run_mode(mode, case, users, existing):
+    env = {"PASSWORD_HASH_METHOD": "pbkdf2:sha256:1"} if case == "cheap_hash" else {}
+    app, _ = create_bench_app(**env)
+    seed_users(app, existing)
+    run = run_register if mode == "register" else run_import
+    elapsed = run(app.test_client(), make_users(users, "secret"))
+    return {"seconds": round(elapsed, 3), "users_per_s": round(users / elapsed, 1)}
+
+
+def run_case(case, users, existing):
+    results = {}
+    for mode in ("register", "bulk_import"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_bulk_import", "--mode", mode, "--case", case,
+             "--users", str(users), "--existing", str(existing)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    results["speedup"] = round(results["bulk_import"]["users_per_s"] / results["register"]["users_per_s"], 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--existing", type=int, default=20000)
+    parser.add_argument("--default-users", type=int, default=200,
+                        help="users in the default case (hashing is slow)")
+    parser.add_argument("--mode", choices=["register", "bulk_import"],
+                        help="run a single mode in this process and print its result")
+    parser.add_argument("--case", choices=["cheap_hash", "default"], default="cheap_hash")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.case, args.users, args.existing)))
+        return
+
+    print(json.dumps({
+        "cheap_hash": run_case("cheap_hash", args.users, args.existing),
+        "default": run_case("default", args.default_users, args.existing),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
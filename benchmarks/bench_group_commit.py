@@ -0,0 +1,97 @@
+"""
+Group commit benchmark for /api/add_balance.
+
+Many threads post credits to a pool of accounts, first with one transaction per
+request and then with GROUP_COMMIT_ENABLED. For each mode it reports requests per
+second, the number of database commits, the mean credits per commit and p50/p99
+latency, and it checks that the total of all balances matches the credited amount.
+
+Usage:
+    python -m benchmarks.bench_group_commit [--threads 32] [--seconds 5] [--profile durable]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import event, func, select
+
+from benchmarks._common import create_bench_app, percentile, run_threads, seed_users
+
+
+def run_mode(app, numbers, threads, seconds):
+    from app.extensions import db
+    from app.models import User
+
+    latencies = [[] for _ in range(threads)]
+    failed = [0] * threads
+
+    def worker(index):
+        client = app.test_client()
+        rng = random.Random(index)
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.post("/api/add_balance", json={"matriculationNumber": rng.choice(numbers), "amount": 1})
+            if response.status_code == 200:
+                latencies[index].append(time.perf_counter() - started)
+            else:
+                failed[index] += 1
+
+    with app.app_context():
+        engine = db.engine
+        before = db.session.execute(select(func.sum(User.balance))).scalar_one()
+        db.session.commit()
+
+    commits = [0]
+
+    def count_commit(connection):
+        commits[0] += 1
+
+    event.listen(engine, "commit", count_commit)
+    elapsed = run_threads(worker, threads)
+    event.remove(engine, "commit", count_commit)
+
+    samples = [sample for worker_samples in latencies for sample in worker_samples]
+    with app.app_context():
+        after = db.session.execute(select(func.sum(User.balance))).scalar_one()
+    return {
+        "requests_per_second": round(len(samples) / elapsed, 1),
+        "failed": sum(failed),
+        "commits": commits[0],
+        "credits_per_commit": round(len(samples) / max(commits[0], 1), 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "balance_consistent": after - before == len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--profile", default="durable", help="storage profile (see app.storage)")
+    args = parser.parse_args()
+
+    app, _ = create_bench_app(STORAGE_PROFILE=args.profile)
+    numbers = seed_users(app, args.users)
+    from app.group_commit import shutdown_group_committer
+
+    results = {}
+    for mode, enabled in (("per_request", False), ("group_commit", True)):
+        app.config["GROUP_COMMIT_ENABLED"] = enabled
+        results[mode] = run_mode(app, numbers, args.threads, args.seconds)
+    shutdown_group_committer()
+
+    print(json.dumps({
+        "profile": args.profile,
+        "threads": args.threads,
+        "seconds": args.seconds,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Idempotency-Key benchmark for /api/add_balance.
+
+1. Concurrent duplicates: --processes worker processes with --threads threads each send
+   the same credit with the same Idempotency-Key at the same moment. The account must be
+   credited exactly once; every other request is answered with the stored response
+   (or 409 while the original is still in flight in another process).
+2. Retry storm: every credit is sent twice with its own key, as a gateway would retry
+   after a timeout. Reports throughput and the number of database commits with keys
+   versus the same load without keys (where each retry is a second credit).
+
+Usage:
+    python -m benchmarks.bench_idempotency [--processes 4] [--threads 8] [--requests 2000]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+
+from sqlalchemy import event, func, select
+
+from benchmarks._common import create_bench_app, percentile, run_threads, seed_users
+
+
+def duplicate_worker(db_path, threads, start_at, queue):
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    from app import create_app
+
+    app = create_app()
+    statuses = [None] * threads
+
+    def worker(index):
+        response = app.test_client().post(
+            "/api/add_balance",
+            json={"matriculationNumber": "D0000000", "amount": 5},
+            headers={"Idempotency-Key": "duplicate-key"}
+        )
+        replayed = response.headers.get("Idempotent-Replayed") == "true"
+        statuses[index] = f"{response.status_code}{' replayed' if replayed else ''}"
+
+    time.sleep(max(0.0, start_at - time.time()))
+    run_threads(worker, threads)
+    queue.put(statuses)
+
+
+def run_duplicates(app, db_path, processes, threads):
+    from app.extensions import db
+    from app.models import User
+
+    seed_users(app, 1, prefix="D")
+    queue = multiprocessing.Queue()
+    # Give every process time to start up, then fire all requests at once
+    start_at = time.time() + 5
+    workers = [
+        multiprocessing.Process(target=duplicate_worker, args=(db_path, threads, start_at, queue))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    statuses = Counter(status for _ in workers for status in queue.get())
+    for worker in workers:
+        worker.join()
+
+    with app.app_context():
+        balance = db.session.execute(
+            select(User.balance).where(User.matriculationNumber == "D0000000")
+        ).scalar_one()
+    return {"requests": processes * threads, "statuses": dict(statuses),
+            "final_balance": balance, "credited_once": balance == 5}
+
+
+def run_retry_storm(app, numbers, requests, threads, with_keys):
+    from app.extensions import db
+    from app.models import User
+
+    latencies = [[] for _ in range(threads)]
+
+    def worker(index):
+        client = app.test_client()
+        for i in range(index, requests, threads):
+            headers = {"Idempotency-Key": f"storm-{i}"} if with_keys else {}
+            payload = {"matriculationNumber": numbers[i % len(numbers)], "amount": 1}
+            # The original request and the gateway's retry
+            for _ in range(2):
+                started = time.perf_counter()
+                client.post("/api/add_balance", json=payload, headers=headers)
+                latencies[index].append(time.perf_counter() - started)
+
+    with app.app_context():
+        engine = db.engine
+        before = db.session.execute(select(func.sum(User.balance))).scalar_one()
+        db.session.commit()
+    commits = [0]
+
+    def count_commit(connection):
+        commits[0] += 1
+
+    event.listen(engine, "commit", count_commit)
+    elapsed = run_threads(worker, threads)
+    event.remove(engine, "commit", count_commit)
+
+    with app.app_context():
+        after = db.session.execute(select(func.sum(User.balance))).scalar_one()
+    samples = [sample for worker_samples in latencies for sample in worker_samples]
+    return {
+        "requests_per_second": round(len(samples) / elapsed, 1),
+        "commits": commits[0],
+        "credited": after - before,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    app, db_path = create_bench_app()
+    numbers = seed_users(app, 100)
+
+    print(json.dumps({
+        "concurrent_duplicates": run_duplicates(app, db_path, args.processes, args.threads),
+        "retry_storm": {
+            "without_keys": run_retry_storm(app, numbers, args.requests, args.threads, with_keys=False),
+            "with_keys": run_retry_storm(app, numbers, args.requests, args.threads, with_keys=True),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
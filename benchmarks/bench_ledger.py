@@ -0,0 +1,101 @@
+"""
+Ledger scaling benchmark.
+
+Grows the ledger in steps (spread over --users accounts, with timestamps one second
+apart) and runs the snapshot job after each step. At every size it measures the
+latency of:
+
+- /api/transactions, first page and a page deep in the account's history
+- /api/balance_at for a recent and for an old point in time
+
+All four should stay flat while the ledger grows by orders of magnitude.
+
+Usage:
+    python -m benchmarks.bench_ledger [--sizes 100000,1000000,3000000] [--users 1000]
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from benchmarks._common import create_bench_app, percentile, seed_users
+
+INSERT_CHUNK_SIZE = 50000
+
+
+def grow_ledger(app, numbers, start, count, origin):
+    from app.extensions import db
+    from app.models import LedgerEntry
+
+    with app.app_context():
+        for offset in range(0, count, INSERT_CHUNK_SIZE):
+            rows = []
+            for i in range(start + offset, start + min(count, offset + INSERT_CHUNK_SIZE)):
+                rows.append({
+                    "matriculationNumber": numbers[i % len(numbers)],
+                    "amount": 1.0 if i % 3 else -1.0,
+                    "kind": "credit" if i % 3 else "debit",
+                    "timestamp": origin + timedelta(seconds=i),
+                })
+            db.session.execute(LedgerEntry.__table__.insert(), rows)
+            db.session.commit()
+
+
+def measure(client, url, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return round(percentile(samples, 50) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100000,1000000,3000000")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    app, _ = create_bench_app()
+    numbers = seed_users(app, args.users, prefix="G")
+    from app.scheduler import snapshot_balances
+
+    client = app.test_client()
+    user = numbers[0]
+    origin = datetime(2020, 1, 1)
+    results = []
+    written = 0
+    for size in sizes:
+        started = time.perf_counter()
+        grow_ledger(app, numbers, written, size - written, origin)
+        snapshot_balances(app)
+        grow_seconds = time.perf_counter() - started
+        written = size
+
+        # A cursor roughly in the middle of the user's history
+        page = client.get(f"/api/transactions?matriculationNumber={user}&limit={size // args.users // 2}").get_json()
+        deep_cursor = page["next_cursor"]
+        newest = origin + timedelta(seconds=size)
+        results.append({
+            "ledger_rows": size,
+            "grow_and_snapshot_seconds": round(grow_seconds, 2),
+            "transactions_first_page_ms": measure(
+                client, f"/api/transactions?matriculationNumber={user}&limit=50", args.repeat),
+            "transactions_deep_page_ms": measure(
+                client, f"/api/transactions?matriculationNumber={user}&limit=50&cursor={deep_cursor}", args.repeat),
+            "balance_at_recent_ms": measure(
+                client, f"/api/balance_at?matriculationNumber={user}&at={newest.isoformat()}", args.repeat),
+            "balance_at_old_ms": measure(
+                client, f"/api/balance_at?matriculationNumber={user}&at={(origin + timedelta(days=1)).isoformat()}",
+                args.repeat),
+        })
+
+    print(json.dumps({"users": args.users, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Login storm benchmark.
+
+Runs a storm of /api/login requests while other threads keep calling /api/user, and
+reports login throughput plus the p50/p99 latency of the other endpoint. The run is
+repeated with hashing on the request thread (PASSWORD_HASH_WORKERS=0) and with hashing
+offloaded to the process pool.
+
+Usage:
+    python -m benchmarks.bench_login [--login-threads 16] [--reader-threads 4] [--seconds 5]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks._common import create_bench_app, percentile, run_threads, seed_users
+
+
+def run_storm(app, numbers, login_threads, reader_threads, seconds):
+    logins = [0] * login_threads
+    rejected = [0] * login_threads
+    reader_latencies = [[] for _ in range(reader_threads)]
+
+    def worker(index):
+        client = app.test_client()
+        deadline = time.perf_counter() + seconds
+        if index < login_threads:
+            number = numbers[index % len(numbers)]
+            while time.perf_counter() < deadline:
+                response = client.post("/api/login", json={"matriculationNumber": number, "password": "secret"})
+                if response.status_code == 200:
+                    logins[index] += 1
+                else:
+                    rejected[index] += 1
+        else:
+            samples = reader_latencies[index - login_threads]
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                client.get(f"/api/user?matriculationNumber={numbers[0]}")
+                samples.append(time.perf_counter() - started)
+
+    elapsed = run_threads(worker, login_threads + reader_threads)
+    latencies = [sample for samples in reader_latencies for sample in samples]
+    return {
+        "logins_per_second": round(sum(logins) / elapsed, 1),
+        "logins_rejected": sum(rejected),
+        "other_requests": len(latencies),
+        "other_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "other_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--login-threads", type=int, default=16)
+    parser.add_argument("--reader-threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=4, help="hashing processes for the pooled run")
+    args = parser.parse_args()
+
+    app, _ = create_bench_app()
+    from app.extensions import db
+    from app.models import User
+    from app.passwords import get_password_hasher, shutdown_password_hasher
+
+    numbers = seed_users(app, args.login_threads, prefix="L")
+    with app.app_context():
+        # One hash for every user keeps seeding fast; each login still derives the key
+        password_hash = get_password_hasher().hash("secret")
+        User.query.update({User.password: password_hash})
+        db.session.commit()
+
+    results = {}
+    for name, workers in (("inline", 0), ("process_pool", args.workers)):
+        shutdown_password_hasher()
+        app.config["PASSWORD_HASH_WORKERS"] = workers
+        with app.app_context():
+            get_password_hasher()
+        results[name] = run_storm(app, numbers, args.login_threads, args.reader_threads, args.seconds)
+    shutdown_password_hasher()
+
+    print(json.dumps({
+        "login_threads": args.login_threads,
+        "reader_threads": args.reader_threads,
+        "seconds": args.seconds,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
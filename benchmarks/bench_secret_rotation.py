@@ -0,0 +1,147 @@
+"""
+Secret rotation benchmark for many banks.
+
+Seeds a large number of banks and measures, for each rotation strategy, how long the
+rotation takes and how long concurrent writers are blocked by it. A writer thread keeps
+sending /api/add_balance requests during the rotation; its worst-case and p99 latency
+approximate the time writers spend waiting for the rotation's write locks.
+
+Strategies:
+- legacy: the previous ORM loop (DELETE + six ORM inserts per bank, one commit)
+- full: set-based DELETE/INSERT per chunk of banks, one commit per chunk
+- rolling: replace only the oldest slot per bank, one commit per chunk
+- derived: nothing is written; the measured work is what every process does when a
+  time window ends, i.e. computing the codes and rebuilding the /api/all_secrets
+  snapshot (see app.secret_derivation). "derived" starts with no memoized codes,
+  "derived_warm" rebuilds again with the codes of the first rebuild memoized.
+
+Usage:
+    python -m benchmarks.bench_secret_rotation [--banks 10000] [--chunk-size 500]
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from benchmarks._common import create_bench_app, percentile, seed_users
+
+
+def seed_banks(app, count):
+    """
+    Insert ``count`` synthetic banks with a full set of secrets each.
+    """
+    from app.extensions import db
+    from app.models import Bank, BankSecret, SECRETS_PER_BANK, generate_secret_code, get_current_timestamp
+
+    with app.app_context():
+        db.session.execute(
+            Bank.__table__.insert(),
+            [{"name": f"Bench Bank {i}", "bank_code": f"BB{i:08d}"} for i in range(count)]
+        )
+        db.session.execute(
+            BankSecret.__table__.insert(),
+            [
+                {"bank_code": f"BB{i:08d}", "secret": generate_secret_code(), "generated_at": get_current_timestamp()}
+                for i in range(count)
+                for _ in range(SECRETS_PER_BANK)
+            ]
+        )
+        db.session.commit()
+
+
+def legacy_rotation(app):
+    """
+    The previous implementation: per-bank DELETE plus six ORM inserts, one commit.
+    """
+    from app.extensions import db
+    from app.models import Bank, BankSecret, generate_secret_code, get_current_timestamp
+
+    with app.app_context():
+        for bank in Bank.query.all():
+            BankSecret.query.filter_by(bank_code=bank.bank_code).delete(synchronize_session='fetch')
+            for _ in range(6):
+                db.session.add(BankSecret(
+                    bank_code=bank.bank_code,
+                    secret=generate_secret_code(),
+                    generated_at=get_current_timestamp()
+                ))
+        db.session.commit()
+
+
+def measure(app, rotate, account):
+    """
+    Run ``rotate()`` while a writer thread issues balance updates; return timings.
+    """
+    latencies = []
+    failures = [0]
+    stop = threading.Event()
+
+    def writer():
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post("/api/add_balance", json={"matriculationNumber": account, "amount": 1})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures[0] += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    # Let the writer reach a steady state before the rotation starts
+    time.sleep(0.2)
+    started = time.perf_counter()
+    rows_written = rotate()
+    rotation_seconds = time.perf_counter() - started
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+
+    return {
+        "rotation_seconds": round(rotation_seconds, 3),
+        "rows_written": rows_written,
+        "writer_requests": len(latencies),
+        "writer_failures": failures[0],
+        "writer_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "writer_max_blocked_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--banks", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    app, _ = create_bench_app(SECRET_DERIVATION_KEY="bench-derivation-key")
+    from app.scheduler import regenerate_bank_secrets
+    from app.secrets_cache import refresh_secrets_snapshot
+
+    app.config["SECRET_ROTATION_CHUNK_SIZE"] = args.chunk_size
+    seed_banks(app, args.banks)
+    account = seed_users(app, 1, prefix="W")[0]
+
+    def configured_rotation(mode):
+        def rotate():
+            app.config["SECRET_ROTATION_MODE"] = mode
+            return regenerate_bank_secrets(app)
+        return rotate
+
+    def derived_window_change():
+        app.config["SECRET_ROTATION_MODE"] = "derived"
+        with app.app_context():
+            refresh_secrets_snapshot()
+        return 0
+
+    results = {
+        "legacy": measure(app, lambda: legacy_rotation(app), account),
+        "full": measure(app, configured_rotation("full"), account),
+        "rolling": measure(app, configured_rotation("rolling"), account),
+        "derived": measure(app, derived_window_change, account),
+        "derived_warm": measure(app, derived_window_change, account),
+    }
+    print(json.dumps({"banks": args.banks, "chunk_size": args.chunk_size, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
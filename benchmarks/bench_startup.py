@@ -0,0 +1,86 @@
+"""
+Cold start benchmark.
+
+Starts fresh interpreters that import the app package and call create_app(), and
+reports the median time of both steps per scenario:
+
+- first_boot: a new database every run (schema creation and seeding)
+- restart: a database that already records the current schema version
+- restart_scheduler: like restart, with the scheduler started during create_app()
+- restart_scheduler_deferred: like restart_scheduler, with SCHEDULER_START_DELAY=30
+
+Each run is a separate process, because Config reads the environment when the app
+package is imported and modules are only imported once per process.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    "first_boot": {},
+    "restart": {},
+    "restart_scheduler": {"SCHEDULER_ENABLED": "1"},
+    "restart_scheduler_deferred": {"SCHEDULER_ENABLED": "1", "SCHEDULER_START_DELAY": "30"},
+}
+
+
+def measure_startup():
+    """
+    Import the app package and create the application; return both durations in ms.
+    """
+    started = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    create_app()
+    created = time.perf_counter()
+    return {"import_ms": (imported - started) * 1000, "create_app_ms": (created - imported) * 1000}
+
+
+def run_scenario(name, runs, db_dir):
+    samples = []
+    for i in range(runs):
+        directory = tempfile.mkdtemp(prefix="studipay-startup-") if name == "first_boot" else db_dir
+        env = dict(os.environ, SCHEDULER_ENABLED="0", SCHEDULER_LEADER_ELECTION="none")
+        env.update(SCENARIOS[name], DATABASE_URL="sqlite:///" + os.path.join(directory, "bench.db"))
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        key: round(statistics.median(sample[key] for sample in samples), 1)
+        for key in ("import_ms", "create_app_ms")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_startup()))
+        return
+
+    db_dir = tempfile.mkdtemp(prefix="studipay-startup-")
+    results = {}
+    for name in SCENARIOS:
+        if name == "restart":
+            # Create the shared database once before measuring restarts
+            run_scenario(name, 1, db_dir)
+        results[name] = run_scenario(name, args.runs, db_dir)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Storage profile benchmark under mixed read/write load.
+
+For every profile in app.storage.STORAGE_PROFILES a fresh database is seeded and
+writer threads call /api/add_balance while reader threads call /api/user and
+/api/users?limit=50 for a fixed time. Each profile runs in its own subprocess,
+because Config reads STORAGE_PROFILE when the app package is imported.
+
+Reports throughput, failed requests (e.g. "database is locked") and p50/p99 latency
+for reads and writes.
+
+Usage:
+    python -m benchmarks.bench_storage_profiles [--writers 4] [--readers 4] [--seconds 5]
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks._common import create_bench_app, percentile, run_threads, seed_users
+
+
+def run_profile(profile, users, writers, readers, seconds):
+    app, _ = create_bench_app(STORAGE_PROFILE=profile)
+    numbers = seed_users(app, users, balance=100.0)
+    samples = [{"ok": [], "failed": 0} for _ in range(writers + readers)]
+
+    def worker(index):
+        client = app.test_client()
+        rng = random.Random(index)
+        result = samples[index]
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            number = rng.choice(numbers)
+            started = time.perf_counter()
+            if index < writers:
+                response = client.post("/api/add_balance", json={"matriculationNumber": number, "amount": 1})
+            elif rng.random() < 0.8:
+                response = client.get(f"/api/user?matriculationNumber={number}")
+            else:
+                response = client.get(f"/api/users?limit=50&cursor={number}")
+            if response.status_code == 200:
+                result["ok"].append(time.perf_counter() - started)
+            else:
+                result["failed"] += 1
+
+    elapsed = run_threads(worker, writers + readers)
+
+    def summarize(group):
+        latencies = [sample for result in group for sample in result["ok"]]
+        return {
+            "ops_per_second": round(len(latencies) / elapsed, 1),
+            "failed": sum(result["failed"] for result in group),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    return {"writes": summarize(samples[:writers]), "reads": summarize(samples[writers:])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--profile", help="run a single profile in this process and print its result")
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(run_profile(args.profile, args.users, args.writers, args.readers, args.seconds)))
+        return
+
+    from app.storage import STORAGE_PROFILES
+
+    results = {}
+    for profile in STORAGE_PROFILES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_storage_profiles", "--profile", profile,
+             "--users", str(args.users), "--writers", str(args.writers),
+             "--readers", str(args.readers), "--seconds", str(args.seconds)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print(json.dumps({
+        "users": args.users,
+        "writers": args.writers,
+        "readers": args.readers,
+        "seconds": args.seconds,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
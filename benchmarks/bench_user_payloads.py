@@ -0,0 +1,70 @@
+"""
+User payload benchmark.
+
+Compares full user payloads with ``?fields=`` projections and gzip compression:
+
+- GET /api/users for --users users (one list)
+- GET /api/user for single users
+- POST /api/add_balance
+
+Each variant reports the response size in bytes and the mean time per request (the
+view, the query and the serialization, through the Flask test client).
+
+Usage:
+    python -m benchmarks.bench_user_payloads [--users 5000] [--requests 2000]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks._common import create_bench_app, seed_users
+
+VARIANTS = {
+    "full": ("", {}),
+    "full_gzip": ("", {"Accept-Encoding": "gzip"}),
+    "balance": ("fields=balance", {}),
+    "balance_bank_code": ("fields=matriculationNumber,balance,bank_code", {}),
+}
+
+
+def measure(request, repetitions):
+    """
+    Return (bytes, mean ms) of ``repetitions`` calls of ``request(i)``.
+    """
+    size = len(request(0).data)
+    started = time.perf_counter()
+    for i in range(repetitions):
+        request(i)
+    return {"bytes": size, "ms": round((time.perf_counter() - started) / repetitions * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--list-requests", type=int, default=20)
+    args = parser.parse_args()
+
+    app, _ = create_bench_app()
+    numbers = seed_users(app, args.users, balance=1000.0)
+    client = app.test_client()
+
+    results = {}
+    for name, (query, headers) in VARIANTS.items():
+        separator = "&" + query if query else ""
+        results[name] = {
+            "users": measure(lambda i: client.get(f"/api/users?{query}", headers=headers), args.list_requests),
+            "user": measure(lambda i: client.get(
+                f"/api/user?matriculationNumber={numbers[i % len(numbers)]}{separator}", headers=headers
+            ), args.requests),
+            "add_balance": measure(lambda i: client.post(
+                f"/api/add_balance?{query}", json={"matriculationNumber": numbers[i % len(numbers)], "amount": 1},
+                headers=headers
+            ), args.requests),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark and equivalence check for /api/verify_transactions.
+
+Seeds users with randomized risk fields (balances, daily counters for today and earlier
+days, risk values, abort counts and last transaction dates), then:
+
+1. Checks that every result of the batched endpoint is identical to calling
+   /api/verify_transaction for the same item, including unknown users.
+2. Compares the time to verify the whole batch with one batched request versus one
+   request per transaction.
+
+Usage:
+    python -m benchmarks.bench_verify_transactions [--users 2000] [--transactions 5000]
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks._common import create_bench_app, seed_users
+
+
+def randomize_risk_fields(app, numbers, seed):
+    """
+    Give every user a random combination of the fields used by the risk rules.
+    """
+    from app.extensions import db
+    from app.models import User
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    with app.app_context():
+        for number in numbers:
+            user = db.session.get(User, number)
+            user.balance = rng.choice([0.0, 5.0, 50.0, 500.0])
+            user.daily_transaction_count = rng.randint(0, 8)
+            user.daily_transaction_day = rng.choice([None, now.date(), (now - timedelta(days=1)).date()])
+            user.last_transaction_date = rng.choice([None, now, now - timedelta(days=2)])
+            user.high_risk_aborted_count = rng.randint(0, 3)
+            user.last_transaction_risk_value = rng.choice([0, 50, 81, 99])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app, _ = create_bench_app(RISK_CACHE_SIZE=0)
+    numbers = seed_users(app, args.users, prefix="V")
+    randomize_risk_fields(app, numbers, args.seed)
+
+    rng = random.Random(args.seed)
+    transactions = [
+        {"matriculationNumber": rng.choice(numbers + ["UNKNOWN"]), "amount": rng.choice([1.0, 10.0, 100.0])}
+        for _ in range(args.transactions)
+    ]
+    client = app.test_client()
+
+    started = time.perf_counter()
+    batched = client.post("/api/verify_transactions", json={"transactions": transactions}).get_json()["results"]
+    batched_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    mismatches = 0
+    for item, result in zip(transactions, batched):
+        response = client.post("/api/verify_transaction", json=item)
+        body = response.get_json()
+        expected = (response.status_code == 200, body.get("message") or body.get("error"))
+        if (result["authorized"], result["message"]) != expected:
+            mismatches += 1
+    scalar_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "users": args.users,
+        "transactions": args.transactions,
+        "mismatches": mismatches,
+        "batched_seconds": round(batched_seconds, 3),
+        "per_request_seconds": round(scalar_seconds, 3),
+        "speedup": round(scalar_seconds / batched_seconds, 1),
+    }, indent=2))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Benchmark suite covering every API route.
+
+Seeds a synthetic database (--users users spread over the prepopulated banks) and
+drives all API routes with a weighted mix modelled on production traffic (mostly
+authorizations and secret polling, some balance updates and lookups, rare
+registrations, bulk imports, logins and administrative updates). The profiler
+administration endpoints under /api/admin are left out on purpose: they need
+PROFILER_TOKEN and switch profiling on for the whole process, which would distort
+every other route. The same mix runs in two modes:
+
+- inprocess: --threads threads call the app through the Flask test client, which
+  measures the application and database cost without any network or server overhead.
+- http: the app is served by a local server (werkzeug's threaded server by default,
+  or --server-command, e.g. "gunicorn -w 4 -b 127.0.0.1:{port} run:app") and --clients
+  concurrent keep-alive HTTP clients send the requests.
+
+For every mode and route the report lists requests, throughput, status codes, errors
+(5xx and connection failures) and p50/p95/p99 latency. The JSON report (stdout, or
+--output) also records the configuration, git revision and time of the run, so
+reports can be compared over time.
+
+Usage:
+    python -m benchmarks.suite [--users 100000] [--modes inprocess,http] [--seconds 20]
+    python -m benchmarks.suite --routes verify_transaction,users --output before.json
+"""
+
+import argparse
+import bisect
+import http.client
+import itertools
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from benchmarks._common import create_bench_app, percentile, run_threads, seed_users
+
+# Banks created by prepopulate_banks()
+BANK_CODES = ("TG12345", "SR67890", "KC54321", "VR98765", "TH11223")
+
+
+class Route:
+    """
+    One entry of the request mix: a name, a relative weight and a request factory.
+
+    ``build(rng, context)`` returns (method, path, body), where body is a JSON value,
+    NDJSON bytes (sent as application/x-ndjson) or None.
+    """
+
+    def __init__(self, name, weight, build):
+        self.name = name
+        self.weight = weight
+        self.build = build
+
+
+def any_user(rng, context):
+    return rng.choice(context["numbers"])
+
+
+def users_page(rng, context):
+    return "GET", f"/api/users?limit=50&cursor={any_user(rng, context)}", None
+
+
+def register(rng, context):
+    # Fits the 10-character matriculationNumber column
+    number = f"R{next(context['registrations']):09d}"
+    return "POST", "/api/register", {
+        "matriculationNumber": number, "lastName": "Bench", "firstName": "New",
+        "password": "secret", "accountNumber": f"AC{number}"
+    }
+
+
+def import_users(rng, context):
+    # Fresh users only, so every row is imported rather than rejected as a duplicate
+    rows = []
+    for _ in range(20):
+        number = f"I{next(context['imports']):09d}"
+        rows.append({"matriculationNumber": number, "lastName": "Bench", "firstName": "Import",
+                     "password": "secret", "accountNumber": f"AC{number}"})
+    return "POST", "/api/import_users", "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+
+
+def validate_secret(rng, context):
+    bank_code, code = rng.choice(context["secrets"])
+    return "POST", "/api/validate_secret", {"bank_code": bank_code, "code": code}
+
+
+def verify_transactions(rng, context):
+    transactions = [{"matriculationNumber": any_user(rng, context), "amount": rng.randint(1, 50)} for _ in range(20)]
+    return "POST", "/api/verify_transactions", {"transactions": transactions}
+
+
+def batch_balance(rng, context):
+    operations = [
+        {"matriculationNumber": any_user(rng, context), "amount": rng.randint(1, 20),
+         "type": rng.choice(("credit", "debit"))}
+        for _ in range(10)
+    ]
+    return "POST", "/api/batch_balance", {"operations": operations}
+
+
+def balance_at(rng, context):
+    at = (datetime.utcnow() - timedelta(minutes=rng.randint(0, 120))).isoformat()
+    return "GET", f"/api/balance_at?matriculationNumber={any_user(rng, context)}&at={at}", None
+
+
+# Weighted mix of all API routes
+ROUTES = [
+    Route("verify_transaction", 30, lambda rng, c: (
+        "POST", "/api/verify_transaction", {"matriculationNumber": any_user(rng, c), "amount": rng.randint(1, 50)})),
+    Route("all_secrets", 15, lambda rng, c: ("GET", "/api/all_secrets", None)),
+    Route("validate_secret", 8, validate_secret),
+    Route("user", 10, lambda rng, c: ("GET", f"/api/user?matriculationNumber={any_user(rng, c)}", None)),
+    Route("add_balance", 8, lambda rng, c: (
+        "POST", "/api/add_balance", {"matriculationNumber": any_user(rng, c), "amount": rng.randint(1, 20)})),
+    Route("deduct_balance", 5, lambda rng, c: (
+        "POST", "/api/deduct_balance", {"matriculationNumber": any_user(rng, c), "amount": rng.randint(1, 20)})),
+    Route("users", 4, users_page),
+    Route("transactions", 4, lambda rng, c: (
+        "GET", f"/api/transactions?matriculationNumber={any_user(rng, c)}&limit=20", None)),
+    Route("balance_at", 3, balance_at),
+    Route("verify_transactions", 2, verify_transactions),
+    Route("batch_balance", 2, batch_balance),
+    Route("update_risk_params", 2, lambda rng, c: (
+        "POST", "/api/update_risk_params", {"matriculationNumber": any_user(rng, c), "dailyTransactionCount": 0})),
+    Route("update_user", 2, lambda rng, c: (
+        "PUT", "/api/update_user", {"matriculationNumber": any_user(rng, c), "lastName": "Updated"})),
+    Route("update_secure_pin", 2, lambda rng, c: (
+        "POST", "/api/update_secure_pin", {"matriculationNumber": any_user(rng, c), "newSecurePin": "1234"})),
+    Route("register", 1, register),
+    Route("import_users", 1, import_users),
+    Route("login", 1, lambda rng, c: (
+        "POST", "/api/login", {"matriculationNumber": any_user(rng, c), "password": "secret"})),
+    Route("metrics", 1, lambda rng, c: ("GET", "/metrics", None)),
+]
+
+
+class InProcessClient:
+    """
+    Sends requests through the Flask test client.
+    """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body):
+        if isinstance(body, bytes):
+            response = self.client.open(path, method=method, data=body, content_type="application/x-ndjson")
+        else:
+            response = self.client.open(path, method=method, json=body)
+        # Streamed responses (import_users) only do their work while being read
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class HttpClient:
+    """
+    Sends requests over one keep-alive HTTP connection, reconnecting after failures.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = None
+
+    def request(self, method, path, body):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {}
+        payload = None
+        if isinstance(body, bytes):
+            payload = body
+            headers["Content-Type"] = "application/x-ndjson"
+        elif body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            if response.will_close:
+                self.connection.close()
+                self.connection = None
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            return None
+
+
+def run_mix(clients, routes, context, seconds, warmup):
+    """
+    Drive the request mix with one thread per client for ``seconds`` after ``warmup``.
+
+    Returns the per-route report plus a total over all routes.
+    """
+    cumulative = list(itertools.accumulate(route.weight for route in routes))
+    samples = [{route.name: ([], Counter()) for route in routes} for _ in clients]
+    started_at = time.perf_counter()
+    measure_from = started_at + warmup
+    deadline = measure_from + seconds
+
+    def worker(index):
+        client = clients[index]
+        rng = random.Random(index)
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                return
+            route = routes[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+            method, path, body = route.build(rng, context)
+            started = time.perf_counter()
+            status = client.request(method, path, body)
+            if started >= measure_from:
+                latencies, statuses = samples[index][route.name]
+                latencies.append(time.perf_counter() - started)
+                statuses[status if status is not None else "failed"] += 1
+
+    run_threads(worker, len(clients))
+
+    def summarize(latencies, statuses):
+        errors = sum(count for status, count in statuses.items() if status == "failed" or status >= 500)
+        return {
+            "requests": len(latencies),
+            "requests_per_second": round(len(latencies) / seconds, 1),
+            "errors": errors,
+            "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        }
+
+    report = {}
+    all_latencies, all_statuses = [], Counter()
+    for route in routes:
+        latencies = [sample for client_samples in samples for sample in client_samples[route.name][0]]
+        statuses = sum((client_samples[route.name][1] for client_samples in samples), Counter())
+        report[route.name] = summarize(latencies, statuses)
+        all_latencies += latencies
+        all_statuses += statuses
+    return {"total": summarize(all_latencies, all_statuses), "routes": report}
+
+
+def seed_database(app, users):
+    """
+    Seed ``users`` users spread evenly over the prepopulated banks.
+    """
+    numbers = []
+    per_bank = -(-users // len(BANK_CODES))
+    for index, bank_code in enumerate(BANK_CODES):
+        count = min(per_bank, users - len(numbers))
+        numbers += seed_users(app, count, balance=500.0, prefix=chr(ord("A") + index), bank_code=bank_code)
+    return numbers
+
+
+def load_secrets(client):
+    response = client.get("/api/all_secrets")
+    return [(bank["bank_code"], secret["code"]) for bank in response.get_json()["banks"] for secret in bank["secrets"]]
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port):
+    """
+    Serve the app on werkzeug's threaded server (runs in the server subprocess).
+    """
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    make_server("127.0.0.1", port, create_app(), threaded=True).serve_forever()
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}: {' '.join(command)}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/api/all_secrets")
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start: {' '.join(command)}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--modes", default="inprocess,http")
+    parser.add_argument("--routes", help="comma-separated route names to run (default: the full mix)")
+    parser.add_argument("--threads", type=int, default=8, help="threads in inprocess mode")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent HTTP clients in http mode")
+    parser.add_argument("--seconds", type=float, default=20, help="measured seconds per mode")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds before each mode")
+    parser.add_argument("--server-command", help='command serving the app on "{port}" in http mode')
+    parser.add_argument("--output", help="write the JSON report to this file as well")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    routes = ROUTES
+    if args.routes:
+        selected = set(args.routes.split(","))
+        unknown = selected - {route.name for route in ROUTES}
+        if unknown:
+            parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+        routes = [route for route in ROUTES if route.name in selected]
+    modes = args.modes.split(",")
+
+    app, db_path = create_bench_app()
+    seeding_started = time.perf_counter()
+    numbers = seed_database(app, args.users)
+    context = {
+        "numbers": numbers,
+        "secrets": load_secrets(app.test_client()),
+        "registrations": itertools.count(),
+        "imports": itertools.count(),
+    }
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "revision": git_revision(),
+        "config": {
+            "users": args.users, "threads": args.threads, "clients": args.clients,
+            "seconds": args.seconds, "warmup": args.warmup, "server_command": args.server_command,
+            "storage_profile": app.config["STORAGE_PROFILE"], "cpus": os.cpu_count(),
+            "mix": {route.name: route.weight for route in routes},
+        },
+        "seed_seconds": round(time.perf_counter() - seeding_started, 2),
+        "modes": {},
+    }
+
+    if "inprocess" in modes:
+        clients = [InProcessClient(app) for _ in range(args.threads)]
+        report["modes"]["inprocess"] = run_mix(clients, routes, context, args.seconds, args.warmup)
+
+    if "http" in modes:
+        port = free_port()
+        env = {**os.environ, "DATABASE_URL": "sqlite:///" + db_path, "SCHEDULER_ENABLED": "0"}
+        if args.server_command:
+            command = shlex.split(args.server_command.format(port=port))
+        else:
+            command = [sys.executable, "-m", "benchmarks.suite", "--serve", str(port)]
+        server = start_server(command, port, env)
+        try:
+            clients = [HttpClient("127.0.0.1", port) for _ in range(args.clients)]
+            report["modes"]["http"] = run_mix(clients, routes, context, args.seconds, args.warmup)
+        finally:
+            server.terminate()
+            server.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
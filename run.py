@@ -1,10 +1,6 @@
 from app import create_app
-from app.extensions import db
 
 app = create_app()
 
-with app.app_context():
-    db.create_all()  # Erstellt die Datenbanktabellen, falls sie noch nicht existieren
-
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True,use_reloader=False)
@@ -0,0 +1,111 @@
+"""
+Shared fixtures for the test suite.
+
+The tests run against a throw-away SQLite database. DATABASE_URL and the other settings
+below are exported before the app package is imported, because Config reads the
+environment at import time. The scheduler, admission control and the hashing process
+pool are disabled so they cannot interfere with the tests.
+
+Run from the repository root with ``python -m pytest``.
+"""
+
+import itertools
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="studipay-test-"), "test.db")
+os.environ.update({
+    "SCHEDULER_ENABLED": "0",
+    "ADMISSION_ENABLED": "0",
+    "METRICS_DIR": "",
+    "PROFILER_ENABLED": "0",
+    "PASSWORD_HASH_WORKERS": "0",
+    "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1",
+})
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import User  # noqa: E402
+
+# Distinct matriculation number prefixes, so tests sharing the database never collide
+_prefixes = (f"T{i:03d}" for i in itertools.count())
+
+
+@pytest.fixture(scope="session")
+def app():
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_users(app):
+    """
+    Return a function inserting ``count`` users and returning their matriculation numbers.
+    """
+    def make(count, balance=0.0, bank_code="TG12345"):
+        prefix = next(_prefixes)
+        numbers = [f"{prefix}{i:05d}" for i in range(count)]
+        with app.app_context():
+            db.session.execute(User.__table__.insert(), [
+                {
+                    "matriculationNumber": number,
+                    "lastName": "Test",
+                    "firstName": f"User{i}",
+                    "password": "secret",
+                    "accountNumber": f"AC{number}",
+                    "balance": balance,
+                    "bank_code": bank_code,
+                    "daily_transaction_count": 0,
+                    "high_risk_aborted_count": 0,
+                    "last_transaction_risk_value": 0,
+                }
+                for i, number in enumerate(numbers)
+            ])
+            db.session.commit()
+        return numbers
+    return make
+
+
+@pytest.fixture
+def balance_of(app):
+    """
+    Return a function reading a user's balance from the database.
+    """
+    def balance(number):
+        with app.app_context():
+            return db.session.get(User, number).balance
+    return balance
+
+
+@pytest.fixture
+def count_queries(app):
+    """
+    Return a context manager collecting the SQL statements executed on every engine
+    (primary and read engine) while it is active.
+    """
+    @contextmanager
+    def counting():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", record)
+    return counting
@@ -0,0 +1,61 @@
+"""
+Tests for admission control (app.admission).
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from flask import Flask
+
+from app import admission
+from app.admission import AdmissionController, init_admission
+
+
+def test_disabled_by_default():
+    env = {key: value for key, value in os.environ.items() if key != "ADMISSION_ENABLED"}
+    output = subprocess.run(
+        [sys.executable, "-c", "from app.config import Config; print(Config.ADMISSION_ENABLED)"],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "False"
+
+
+@pytest.fixture
+def limited_app(monkeypatch):
+    """
+    Return a test client of an app admitting one request per client and route.
+    """
+    monkeypatch.setattr(admission, "_controller", AdmissionController(0, 1, 1e-6, 1, {}, 0, 100))
+    app = Flask(__name__)
+    app.config.update(ADMISSION_ENABLED=True, ADMISSION_CLIENT_HEADER="X-Client-Id")
+    init_admission(app)
+
+    @app.route("/items/<name>")
+    def item(name):
+        return {"name": name}
+
+    @app.route("/other")
+    def other():
+        return {}
+
+    return app.test_client()
+
+
+def test_routes_are_keyed_by_url_rule(limited_app):
+    headers = {"X-Client-Id": "terminal-1"}
+    assert limited_app.get("/items/a", headers=headers).status_code == 200
+    # Another value of the path parameter does not get a fresh bucket
+    response = limited_app.get("/items/b", headers=headers)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"]
+    # Other routes and other clients have their own buckets
+    assert limited_app.get("/other", headers=headers).status_code == 200
+    assert limited_app.get("/items/b", headers={"X-Client-Id": "terminal-2"}).status_code == 200
+
+
+def test_unmatched_paths_share_one_bucket(limited_app):
+    headers = {"X-Client-Id": "terminal-1"}
+    assert limited_app.get("/missing/1", headers=headers).status_code == 404
+    assert limited_app.get("/missing/2", headers=headers).status_code == 429
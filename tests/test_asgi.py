@@ -0,0 +1,75 @@
+"""
+Tests for the async serving mode (app.asgi); skipped unless the async extras are installed.
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("asgiref")
+pytest.importorskip("aiosqlite")
+httpx = pytest.importorskip("httpx")
+
+from app.group_commit import get_group_committer, shutdown_group_committer  # noqa: E402
+
+
+@pytest.fixture
+def asgi_post(app, monkeypatch):
+    """
+    Return a function posting JSON to an AsyncAPI built for the given group-commit setting.
+    """
+    # Importing app.asgi builds its module-level app; AsyncAPI is reused for the test app
+    from app.asgi import AsyncAPI
+
+    def post(path, payload, group_commit=False):
+        monkeypatch.setitem(app.config, "GROUP_COMMIT_ENABLED", group_commit)
+        api = AsyncAPI(app)
+
+        async def send():
+            transport = httpx.ASGITransport(app=api)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(path, json=payload)
+        return asyncio.run(send())
+
+    yield post
+    shutdown_group_committer()
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_add_balance(app, make_users, balance_of, asgi_post, group_commit):
+    number = make_users(1, balance=10.0)[0]
+    response = asgi_post("/api/add_balance?fields=balance",
+                         {"matriculationNumber": number, "amount": 5}, group_commit=group_commit)
+    assert response.status_code == 200
+    assert response.json()["new_balance"] == 15.0
+    assert response.json()["user"] == {"balance": 15.0}
+    assert balance_of(number) == 15.0
+    if group_commit:
+        # The credit was committed by the group committer, not by the async session
+        with app.app_context():
+            assert get_group_committer().batches == 1
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_add_balance_unknown_user(asgi_post, group_commit):
+    response = asgi_post("/api/add_balance", {"matriculationNumber": "UNKNOWN", "amount": 5}, group_commit=group_commit)
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("path", ["/api/add_balance", "/api/deduct_balance", "/api/verify_transaction"])
+def test_non_numeric_amount(make_users, asgi_post, path):
+    number = make_users(1)[0]
+    response = asgi_post(path, {"matriculationNumber": number, "amount": "abc"})
+    assert response.status_code == 400
+    assert response.json() == {"error": "amount must be a number"}
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+@pytest.mark.parametrize("path", ["/api/add_balance", "/api/deduct_balance"])
+def test_non_positive_amount(make_users, balance_of, asgi_post, path, group_commit):
+    number = make_users(1, balance=10.0)[0]
+    for amount in (-100, 0):
+        response = asgi_post(path, {"matriculationNumber": number, "amount": amount}, group_commit=group_commit)
+        assert response.status_code == 400
+        assert response.json() == {"error": "amount must be greater than zero"}
+    assert balance_of(number) == 10.0
@@ -0,0 +1,14 @@
+"""
+Tests for /api/add_balance and /api/deduct_balance input validation.
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/api/add_balance", "/api/deduct_balance"])
+@pytest.mark.parametrize("amount", [-100, 0, "-5", "abc", None, "inf"])
+def test_invalid_amounts_are_rejected(client, make_users, balance_of, path, amount):
+    number = make_users(1, balance=10.0)[0]
+    response = client.post(path, json={"matriculationNumber": number, "amount": amount})
+    assert response.status_code == 400
+    assert balance_of(number) == 10.0
@@ -0,0 +1,25 @@
+"""
+Tests for /api/batch_balance (app.balance.apply_balance_batch).
+"""
+
+
+def test_malformed_numbers_do_not_abort_the_batch(client, make_users, balance_of):
+    number = make_users(1, balance=10.0)[0]
+    operations = [
+        {"matriculationNumber": number, "amount": 5, "type": "credit"},
+        {"matriculationNumber": 12345, "amount": 5, "type": "credit"},
+        {"matriculationNumber": ["a", "b"], "amount": 5, "type": "credit"},
+        {"matriculationNumber": {"a": 1}, "amount": 5, "type": "debit"},
+        {"matriculationNumber": "", "amount": 5, "type": "credit"},
+        {"matriculationNumber": number, "amount": 3, "type": "debit"},
+    ]
+
+    response = client.post("/api/batch_balance", json={"operations": operations})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [result["status"] for result in data["results"]] == [
+        "success", "invalid", "invalid", "invalid", "invalid", "success"
+    ]
+    assert data["summary"] == {"success": 2, "invalid": 4}
+    assert balance_of(number) == 12.0
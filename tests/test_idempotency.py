@@ -0,0 +1,151 @@
+"""
+Tests for Idempotency-Key handling on /api/add_balance (app.idempotency), with and
+without group commit (app.group_commit).
+"""
+
+import itertools
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app.idempotency as idempotency
+from app.group_commit import CREDIT_PENDING_ERROR, shutdown_group_committer
+from app.idempotency import IdempotencyStore
+
+THREADS = 8
+
+
+@pytest.fixture
+def group_commit(app, monkeypatch):
+    """
+    Return a function switching group commit on or off with the given settings.
+    """
+    def configure(enabled, **settings):
+        shutdown_group_committer()
+        monkeypatch.setitem(app.config, "GROUP_COMMIT_ENABLED", enabled)
+        for name, value in settings.items():
+            monkeypatch.setitem(app.config, name, value)
+
+    yield configure
+    shutdown_group_committer()
+
+
+def post_concurrently(client, number, key, count=THREADS):
+    barrier = threading.Barrier(count)
+
+    def post():
+        barrier.wait()
+        return client.post("/api/add_balance", json={"matriculationNumber": number, "amount": 5},
+                           headers={"Idempotency-Key": key})
+
+    with ThreadPoolExecutor(count) as pool:
+        return list(pool.map(lambda _: post(), range(count)))
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_concurrent_duplicates_credit_once(client, make_users, balance_of, group_commit, enabled):
+    group_commit(enabled)
+    number = make_users(1, balance=10.0)[0]
+
+    responses = post_concurrently(client, number, str(uuid.uuid4()))
+
+    assert [response.status_code for response in responses] == [200] * THREADS
+    assert {response.get_json()["new_balance"] for response in responses} == {15.0}
+    assert sum("Idempotent-Replayed" in response.headers for response in responses) == THREADS - 1
+    assert balance_of(number) == 15.0
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_duplicates_across_processes_credit_once(client, make_users, balance_of, group_commit, monkeypatch, enabled):
+    # Every request gets its own store, like requests served by different worker processes
+    stores = itertools.cycle([IdempotencyStore(0, 60, 30) for _ in range(THREADS)])
+    lock = threading.Lock()
+
+    def next_store():
+        with lock:
+            return next(stores)
+
+    monkeypatch.setattr(idempotency, "get_idempotency_store", next_store)
+    group_commit(enabled)
+    number = make_users(1, balance=10.0)[0]
+
+    key = str(uuid.uuid4())
+    responses = post_concurrently(client, number, key)
+
+    # Duplicates that find the key while the original is still in flight are told to retry
+    assert {response.status_code for response in responses} <= {200, 409}
+    assert {response.get_json()["new_balance"] for response in responses if response.status_code == 200} == {15.0}
+    assert balance_of(number) == 15.0
+
+    retry = client.post("/api/add_balance", json={"matriculationNumber": number, "amount": 5},
+                        headers={"Idempotency-Key": key})
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert balance_of(number) == 15.0
+
+
+def test_group_commit_timeout_answers_409_and_replays_outcome(client, make_users, balance_of, group_commit):
+    # The committer waits longer for a batch than the request waits for its commit
+    group_commit(True, GROUP_COMMIT_TIMEOUT=0.01, GROUP_COMMIT_INTERVAL_MS=300)
+    number = make_users(1, balance=10.0)[0]
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    payload = {"matriculationNumber": number, "amount": 5}
+
+    response = client.post("/api/add_balance", json=payload, headers=headers)
+    assert response.status_code == 409
+    assert response.get_json()["error"] == CREDIT_PENDING_ERROR
+    assert response.headers["Retry-After"] == "1"
+
+    # The retry waits for the queued credit and receives its response
+    retry = client.post("/api/add_balance", json=payload, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.get_json()["new_balance"] == 15.0
+    assert balance_of(number) == 15.0
+
+    # Another process finds the key recorded with the credit
+    with client.application.app_context():
+        stored = IdempotencyStore(0, 60, 30)._load(("bank.add_balance", headers["Idempotency-Key"]))
+    assert stored.status_code == 200
+
+
+def test_group_commit_failed_credit_records_no_key(client, make_users, balance_of, group_commit):
+    group_commit(True)
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    response = client.post("/api/add_balance", json={"matriculationNumber": "UNKNOWN", "amount": 5},
+                           headers=headers)
+    assert response.status_code == 404
+
+    # Nothing was committed, so the same key can be used again
+    number = make_users(1, balance=10.0)[0]
+    response = client.post("/api/add_balance", json={"matriculationNumber": number, "amount": 5},
+                           headers=headers)
+    assert response.status_code == 200
+    assert balance_of(number) == 15.0
+
+
+def test_key_reused_with_different_query_string(client, make_users, balance_of):
+    number = make_users(1, balance=10.0)[0]
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    payload = {"matriculationNumber": number, "amount": 5}
+
+    assert client.post("/api/add_balance", json=payload, headers=headers).status_code == 200
+    response = client.post("/api/add_balance?fields=balance", json=payload, headers=headers)
+    assert response.status_code == 422
+    assert balance_of(number) == 15.0
+
+
+def test_key_reused_on_another_endpoint_is_not_replayed(client, make_users, balance_of):
+    number = make_users(1, balance=10.0)[0]
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    payload = {"matriculationNumber": number, "amount": 5}
+
+    assert client.post("/api/add_balance", json=payload, headers=headers).status_code == 200
+    # Keys are scoped per endpoint: the deduction runs instead of replaying the credit
+    response = client.post("/api/deduct_balance", json=payload, headers=headers)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert response.get_json()["new_balance"] == 10.0
@@ -0,0 +1,115 @@
+"""
+Tests keeping the ledger (app.ledger) in line with User.balance.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert, select
+
+from app.balance import set_balance
+from app.extensions import db
+from app.ledger import balance_at, take_balance_snapshots
+from app.models import BalanceSnapshot, LedgerEntry
+
+
+def ledger_sum(app, number):
+    with app.app_context():
+        return db.session.execute(
+            select(func.coalesce(func.sum(LedgerEntry.amount), 0.0)).where(LedgerEntry.matriculationNumber == number)
+        ).scalar_one()
+
+
+def test_update_user_records_adjustment(app, client, make_users, balance_of):
+    number = make_users(1)[0]
+    client.post("/api/add_balance", json={"matriculationNumber": number, "amount": 30})
+    response = client.put("/api/update_user?fields=balance", json={"matriculationNumber": number, "balance": 12.5})
+    assert response.status_code == 200
+    assert response.get_json()["user"] == {"balance": 12.5}
+    assert balance_of(number) == 12.5
+    assert ledger_sum(app, number) == 12.5
+
+    response = client.put("/api/update_user", json={"matriculationNumber": number, "balance": "abc"})
+    assert response.status_code == 400
+    assert balance_of(number) == 12.5
+
+
+def test_set_balance_retries_after_a_concurrent_change(app, make_users):
+    number = make_users(1, balance=10.0)[0]
+    with app.app_context():
+        engine = db.engine
+        injected = []
+
+        def credit_first(conn, cursor, statement, parameters, context, executemany):
+            # Sneak a credit in right before the first conditional UPDATE
+            if statement.startswith("UPDATE users") and not injected:
+                injected.append(True)
+                conn.connection.cursor().execute(
+                    "UPDATE users SET balance = balance + 5 WHERE matriculationNumber = ?", (number,)
+                )
+
+        event.listen(engine, "before_cursor_execute", credit_first)
+        try:
+            assert set_balance(number, 100.0) == 100.0
+            db.session.commit()
+        finally:
+            event.remove(engine, "before_cursor_execute", credit_first)
+
+        amounts = db.session.execute(
+            select(LedgerEntry.amount).where(LedgerEntry.matriculationNumber == number)
+        ).scalars().all()
+    # The adjustment replaced 15 (10 plus the concurrent credit), not the 10 read first
+    assert amounts == [85.0]
+
+
+def test_concurrent_credits_and_updates_keep_the_ledger_in_line(app, make_users, balance_of):
+    number = make_users(1)[0]
+
+    def credit(index):
+        client = app.test_client()
+        for _ in range(20):
+            client.post("/api/add_balance", json={"matriculationNumber": number, "amount": 1})
+
+    def update(index):
+        client = app.test_client()
+        for value in range(10):
+            client.put("/api/update_user", json={"matriculationNumber": number, "balance": value * 100})
+
+    threads = [threading.Thread(target=credit, args=(i,)) for i in range(3)]
+    threads.append(threading.Thread(target=update, args=(0,)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert ledger_sum(app, number) == balance_of(number)
+
+
+def test_snapshots_wait_for_late_commits(app, make_users):
+    number = make_users(1)[0]
+    now = datetime.utcnow()
+    with app.app_context():
+        base = db.session.execute(select(func.coalesce(func.max(LedgerEntry.id), 0))).scalar_one() + 100
+
+        def commit_entry(entry_id, amount, age):
+            db.session.execute(insert(LedgerEntry.__table__).values(
+                id=entry_id, matriculationNumber=number, amount=amount, kind="credit",
+                timestamp=now - timedelta(seconds=age)
+            ))
+            db.session.commit()
+
+        # The entry with the higher ID becomes visible first
+        commit_entry(base + 2, 5.0, age=30)
+        take_balance_snapshots(grace_seconds=60)
+        db.session.commit()
+        # A transaction that inserted earlier commits late, with a lower ID
+        commit_entry(base + 1, 7.0, age=31)
+        take_balance_snapshots(grace_seconds=10)
+        db.session.commit()
+
+        snapshot = db.session.execute(
+            select(BalanceSnapshot.balance, BalanceSnapshot.ledger_entry_id)
+            .where(BalanceSnapshot.matriculationNumber == number)
+        ).one()
+        assert tuple(snapshot) == (12.0, base + 2)
+        assert balance_at(number, datetime.utcnow()) == 12.0
@@ -0,0 +1,35 @@
+"""
+Tests for request and database metrics (app.metrics).
+"""
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from app import metrics
+from app.extensions import db
+from app.metrics import init_metrics
+
+
+def test_failed_statement_releases_its_start_time(app):
+    with app.app_context(), db.engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("SELECT * FROM no_such_table")
+        assert conn.info["query_started"] == []
+
+
+def test_request_ending_with_exception_is_discarded(app):
+    failing = Flask(__name__)
+    failing.config.update(TESTING=True, METRICS_ENABLED=True, METRICS_DIR="",
+                          METRICS_FLUSH_INTERVAL=app.config["METRICS_FLUSH_INTERVAL"])
+    init_metrics(failing)
+
+    @failing.route("/fail")
+    def fail():
+        raise RuntimeError("boom")
+
+    # TESTING propagates the exception, so after_request is skipped and teardown discards
+    with pytest.raises(RuntimeError):
+        failing.test_client().get("/fail")
+    assert metrics._request_sql.get() is None
@@ -0,0 +1,78 @@
+"""
+Tests for the password hashing pool (see app.passwords) and the endpoints using it.
+"""
+
+import logging
+
+import pytest
+from sqlalchemy import update
+
+from app.extensions import db
+from app.models import User
+from app.passwords import PasswordHasher, PasswordHashTimeout
+from app.routes import auth_routes, user_routes
+
+
+def test_slow_jobs_raise_timeout():
+    hasher = PasswordHasher(workers=1, max_pending=4, timeout=0.001, method="scrypt")
+    try:
+        with pytest.raises(PasswordHashTimeout):
+            hasher.hash("secret")
+        with pytest.raises(PasswordHashTimeout):
+            hasher.hash_many(["secret"] * 2)
+    finally:
+        hasher.shutdown()
+
+
+class TimingOutHasher:
+    def verify(self, stored, password):
+        raise PasswordHashTimeout()
+
+    def hash(self, password):
+        raise PasswordHashTimeout()
+
+
+@pytest.mark.parametrize("path, module", [
+    ("/api/login", auth_routes),
+    ("/api/register", user_routes),
+])
+def test_hash_timeout_is_a_503(client, make_users, monkeypatch, path, module):
+    number = make_users(1)[0]
+    monkeypatch.setattr(module, "get_password_hasher", TimingOutHasher)
+    response = client.post(path, json={
+        "matriculationNumber": number + "X" if path == "/api/register" else number,
+        "password": "secret", "lastName": "Test", "firstName": "Test", "accountNumber": "ACTIMEOUT",
+    })
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_update_user_does_not_log_passwords(client, make_users, caplog):
+    number = make_users(1)[0]
+    with caplog.at_level(logging.INFO):
+        response = client.put("/api/update_user", json={"matriculationNumber": number, "password": "n3w-secret"})
+    assert response.status_code == 200
+    assert "n3w-secret" not in caplog.text
+    assert "pbkdf2:" not in caplog.text
+
+
+@pytest.mark.parametrize("payload", [
+    {"password": 12345},
+    {"password": ["secret"]},
+    {"password": {"a": 1}},
+    {"matriculationNumber": 12345, "password": "secret"},
+])
+def test_login_rejects_non_string_credentials(client, make_users, payload):
+    number = make_users(1)[0]
+    response = client.post("/api/login", json={"matriculationNumber": number, **payload})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("stored", ["pbkdf2:sha256:x$salt$hash", "scrypt:a:b:c$salt$hash", "pbkdf2:nosuch:1$s$h"])
+def test_login_with_malformed_stored_hash_fails(app, client, make_users, stored):
+    number = make_users(1)[0]
+    with app.app_context():
+        db.session.execute(update(User).where(User.matriculationNumber == number).values(password=stored))
+        db.session.commit()
+    response = client.post("/api/login", json={"matriculationNumber": number, "password": stored})
+    assert response.status_code == 401
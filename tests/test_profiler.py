@@ -0,0 +1,67 @@
+"""
+Tests for the request profiler (app.profiler).
+"""
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from app import profiler
+from app.extensions import db
+
+
+def test_one_capture_per_process():
+    first = profiler.start_capture("header", 0.0)
+    try:
+        assert first is not None
+        # A concurrent request is served without profiling instead of failing
+        assert profiler.start_capture("header", 0.0) is None
+    finally:
+        first.stop()
+    second = profiler.start_capture("header", 0.0)
+    assert second is not None
+    second.stop()
+
+
+def test_other_active_profiler_skips_the_capture(monkeypatch):
+    class ActiveProfiler:
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiler.cProfile, "Profile", ActiveProfiler)
+    assert profiler.start_capture("slow", 100.0) is None
+    monkeypatch.undo()
+    # The slot was released again
+    capture = profiler.start_capture("slow", 100.0)
+    assert capture is not None
+    capture.stop()
+
+
+@pytest.fixture
+def sql_listeners():
+    listeners = [
+        ("before_cursor_execute", profiler._before_cursor_execute),
+        ("after_cursor_execute", profiler._after_cursor_execute),
+        ("handle_error", profiler._handle_error),
+    ]
+    for name, listener in listeners:
+        event.listen(Engine, name, listener)
+    yield
+    for name, listener in listeners:
+        event.remove(Engine, name, listener)
+
+
+def test_failed_statement_releases_its_start_time(app, sql_listeners):
+    capture = profiler.start_capture("header", 0.0)
+    token = profiler._capture.set(capture)
+    try:
+        with app.app_context(), db.engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM no_such_table")
+            conn.exec_driver_sql("SELECT 1")
+            assert conn.info["profiler_started"] == []
+    finally:
+        profiler._capture.reset(token)
+        capture.stop()
+    assert [statement["statement"] for statement in capture.statements] == ["SELECT 1"]
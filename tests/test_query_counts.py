@@ -0,0 +1,86 @@
+"""
+Query-count regression tests: serializing users and banks must take a constant number
+of statements, no matter how many rows are returned (see app.serializers).
+"""
+
+import pytest
+
+from app import secrets_cache
+from app.extensions import db
+from app.models import Bank, BankSecret, SECRETS_PER_BANK, generate_secret_code, get_current_timestamp
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("", 3),                       # users, their banks, the banks' secrets
+    ("?fields=balance", 1),        # plain rows, no banks
+    ("?limit=50", 3),
+    ("?limit=50&fields=bank", 3),
+])
+def test_users_list_query_count(client, make_users, count_queries, query, expected):
+    counts = []
+    for size in (5, 60):
+        make_users(size)
+        with count_queries() as statements:
+            response = client.get(f"/api/users{query}")
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts == [expected, expected]
+
+
+def test_users_ndjson_query_count(client, make_users, count_queries):
+    counts = []
+    for size in (5, 60):
+        make_users(size)
+        with count_queries() as statements:
+            response = client.get("/api/users?format=ndjson")
+            response.get_data()
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts == [3, 3]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("", 2),                  # the user joined with its bank, the bank's secrets
+    ("&fields=balance", 1),
+])
+def test_user_query_count(client, make_users, count_queries, query, expected):
+    number = make_users(1)[0]
+    with count_queries() as statements:
+        response = client.get(f"/api/user?matriculationNumber={number}{query}")
+    assert response.status_code == 200
+    assert len(statements) == expected
+
+
+def test_all_secrets_query_count(app, client, count_queries, monkeypatch):
+    def rebuild_count():
+        # Drop the cached snapshot so the next request rebuilds it
+        monkeypatch.setattr(secrets_cache, "_snapshot", None)
+        with count_queries() as statements:
+            response = client.get("/api/all_secrets")
+        assert response.status_code == 200
+        return len(statements), len(response.get_json()["banks"])
+
+    before, banks = rebuild_count()
+    with app.app_context():
+        db.session.add(Bank(name="Query Count Bank", bank_code="QC00001"))
+        db.session.add_all(
+            BankSecret(bank_code="QC00001", secret=generate_secret_code(), generated_at=get_current_timestamp())
+            for _ in range(SECRETS_PER_BANK)
+        )
+        db.session.commit()
+    try:
+        after, more_banks = rebuild_count()
+    finally:
+        with app.app_context():
+            BankSecret.query.filter_by(bank_code="QC00001").delete()
+            Bank.query.filter_by(bank_code="QC00001").delete()
+            db.session.commit()
+
+    # The rotation version, the banks and their secrets
+    assert more_banks == banks + 1
+    assert before == after == 3
+
+    # Served from the snapshot until it is rechecked
+    with count_queries() as statements:
+        assert client.get("/api/all_secrets").status_code == 200
+    assert statements == []
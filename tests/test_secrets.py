@@ -0,0 +1,90 @@
+"""
+Tests for /api/validate_secret across secret rotations (see app.secrets_cache).
+"""
+
+import pytest
+
+from app import create_app, secret_derivation, secrets_cache
+from app.config import Config
+from app.models import SECRETS_PER_BANK
+from app.scheduler import regenerate_bank_secrets
+
+
+def current_code(client, bank_code="TG12345"):
+    banks = client.get("/api/all_secrets").get_json()["banks"]
+    return next(bank for bank in banks if bank["bank_code"] == bank_code)["secrets"][0]["code"]
+
+
+def validate(client, code, bank_code="TG12345"):
+    response = client.post("/api/validate_secret", json={"bank_code": bank_code, "code": code})
+    assert response.status_code == 200
+    return response.get_json()["status"]
+
+
+@pytest.mark.parametrize("mode", ["full", "rolling"])
+def test_rotated_codes_stay_expired(app, client, monkeypatch, mode):
+    monkeypatch.setitem(app.config, "SECRET_ROTATION_MODE", mode)
+    code = current_code(client)
+    assert validate(client, code) == "valid"
+
+    # Enough rotations to push the code out of the table, then some more
+    for _ in range(8):
+        assert regenerate_bank_secrets(app) is not None
+    assert validate(client, code) == "expired"
+    assert validate(client, code, bank_code="SR67890") == "invalid"
+    assert validate(client, "NOCODE") == "invalid"
+
+
+def test_retired_codes_are_forgotten_after_the_validity(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "SECRET_ROTATION_MODE", "full")
+    code = current_code(client)
+    regenerate_bank_secrets(app)
+    assert validate(client, code) == "expired"
+
+    monkeypatch.setitem(app.config, "SECRET_VALIDITY_SECONDS", 0)
+    regenerate_bank_secrets(app)
+    assert validate(client, code) == "invalid"
+
+
+def test_derived_mode_requires_a_derivation_key(monkeypatch):
+    monkeypatch.setattr(Config, "SECRET_ROTATION_MODE", "derived")
+    monkeypatch.setattr(Config, "SECRET_DERIVATION_KEY", "")
+    with pytest.raises(ValueError, match="SECRET_DERIVATION_KEY"):
+        create_app()
+
+
+def test_derived_codes(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "SECRET_ROTATION_MODE", "derived")
+    monkeypatch.setitem(app.config, "SECRET_DERIVATION_KEY", "test-derivation-key")
+    try:
+        with app.app_context():
+            secrets_cache.refresh_secrets_snapshot()
+        banks = client.get("/api/all_secrets").get_json()["banks"]
+        codes = next(bank for bank in banks if bank["bank_code"] == "TG12345")["secrets"]
+        assert len(codes) == SECRETS_PER_BANK
+        assert validate(client, codes[-1]["code"]) == "valid"
+        assert validate(client, "NOCODE") == "invalid"
+    finally:
+        # Leave a snapshot of the stored secrets for the other tests
+        monkeypatch.undo()
+        with app.app_context():
+            secrets_cache.refresh_secrets_snapshot()
+
+
+def test_derived_code_cache_keeps_recent_windows(monkeypatch):
+    monkeypatch.setattr(secret_derivation, "_window_codes", {})
+    codes = [secret_derivation.derive_code("key", "TG12345", window) for window in range(100)]
+    assert sorted(secret_derivation._window_codes) == list(range(100 - secret_derivation.CACHED_WINDOWS, 100))
+    # Evicted windows are computed again with the same result
+    assert secret_derivation.derive_code("key", "TG12345", 0) == codes[0]
+
+
+@pytest.mark.parametrize("payload", [
+    {"bank_code": ["TG12345"], "code": "ABC123"},
+    {"bank_code": "TG12345", "code": {"a": 1}},
+    {"bank_code": 12345, "code": 42},
+    ["TG12345", "ABC123"],
+])
+def test_validate_secret_rejects_non_string_values(client, payload):
+    response = client.post("/api/validate_secret", json=payload)
+    assert response.status_code == 400
@@ -0,0 +1,126 @@
+"""
+Tests for /api/import_users (app.user_import).
+"""
+
+import http.client
+import io
+import itertools
+import json
+import threading
+
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+from werkzeug.test import EnvironBuilder
+
+_numbers = (f"IMP{i:05d}" for i in itertools.count())
+
+
+def import_users(client, rows, **params):
+    body = "".join(json.dumps(row) + "\n" for row in rows)
+    response = client.post("/api/import_users", data=body, content_type="application/x-ndjson",
+                           query_string=params)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def user_row(**fields):
+    number = next(_numbers)
+    return {"matriculationNumber": number, "lastName": "Import", "firstName": "User",
+            "password": "secret", "accountNumber": f"AC{number}", **fields}
+
+
+def login(client, row, password):
+    return client.post("/api/login", json={"matriculationNumber": row["matriculationNumber"], "password": password})
+
+
+def test_rows_with_non_string_values_are_rejected(client):
+    rows = [
+        user_row(),
+        user_row(bank_code=["TG12345"]),
+        user_row(bank_code={"code": "TG12345"}),
+        user_row(lastName={"a": 1}),
+        user_row(password=["secret"]),
+        user_row(bank_code="TG12345"),
+    ]
+
+    lines = import_users(client, rows)
+
+    assert [(line["line"], line["error"]) for line in lines[:-1]] == [
+        (2, "bank_code must be a string"),
+        (3, "bank_code must be a string"),
+        (4, "lastName must be a string"),
+        (5, "password must be a string"),
+    ]
+    assert lines[-1] == {"summary": {"imported": 2, "rejected": 4}}
+
+
+def test_hash_like_passwords_are_hashed_without_opt_in(client):
+    row = user_row(password="pbkdf2:not-a-hash")
+
+    assert import_users(client, [row])[-1] == {"summary": {"imported": 1, "rejected": 0}}
+    assert login(client, row, "pbkdf2:not-a-hash").status_code == 200
+
+
+def test_prehashed_import(client):
+    hashed = user_row(password=generate_password_hash("migrated", "pbkdf2:sha256:1"))
+    plain = user_row(password="plain-secret")
+    malformed = user_row(password="pbkdf2:sha256:x$salt$hash")
+
+    lines = import_users(client, [hashed, plain, malformed], prehashed="1")
+
+    assert lines[0] == {"line": 3, "matriculationNumber": malformed["matriculationNumber"],
+                        "error": "password is not a valid password hash"}
+    assert lines[-1] == {"summary": {"imported": 2, "rejected": 1}}
+    assert login(client, hashed, "migrated").status_code == 200
+    assert login(client, plain, "plain-secret").status_code == 200
+
+
+def test_large_upload_through_a_server(app, monkeypatch):
+    # Several chunks, spooled to a temporary file
+    monkeypatch.setitem(app.config, "IMPORT_CHUNK_SIZE", 100)
+    monkeypatch.setitem(app.config, "IMPORT_SPOOL_MAX_MEMORY", 4096)
+    rows = [user_row() for _ in range(450)]
+    body = "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=30)
+        connection.request("POST", "/api/import_users", body=body,
+                           headers={"Content-Type": "application/x-ndjson"})
+        response = connection.getresponse()
+        lines = response.read().decode("utf-8").splitlines()
+        connection.close()
+    finally:
+        server.shutdown()
+        thread.join()
+
+    assert response.status == 200
+    assert json.loads(lines[-1]) == {"summary": {"imported": 450, "rejected": 0}}
+
+
+def test_upload_is_read_before_the_response_starts(app):
+    rows = [user_row() for _ in range(250)]
+    body = "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+    started = []
+
+    class HalfDuplexInput(io.BytesIO):
+        # Like servers that cannot read the request body once the response has started
+        def read(self, *args):
+            assert not started, "request body read after the response started"
+            return super().read(*args)
+
+        def readinto(self, buffer):
+            assert not started, "request body read after the response started"
+            return super().readinto(buffer)
+
+        readline = read1 = read
+
+    environ = EnvironBuilder(path="/api/import_users", method="POST", data=body,
+                             content_type="application/x-ndjson").get_environ()
+    environ["wsgi.input"] = HalfDuplexInput(body)
+    output = b"".join(app(environ, lambda status, headers: started.append(status)))
+
+    assert started == ["200 OK"]
+    assert json.loads(output.decode("utf-8").splitlines()[-1]) == {"summary": {"imported": 250, "rejected": 0}}
@@ -0,0 +1,81 @@
+"""
+Equivalence tests for /api/verify_transactions: the vectorized rules must give the same
+verdict and message as /api/verify_transaction for every item.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import User
+
+
+def randomize_risk_fields(app, numbers, rng):
+    """
+    Give every user a random combination of the fields read by the risk rules.
+    """
+    now = datetime.utcnow()
+    with app.app_context():
+        for number in numbers:
+            user = db.session.get(User, number)
+            user.balance = rng.choice([0.0, 5.0, 50.0, 500.0])
+            user.daily_transaction_count = rng.choice([None, 0, 4, 5, 8])
+            user.daily_transaction_day = rng.choice([None, now.date(), (now - timedelta(days=1)).date()])
+            user.last_transaction_date = rng.choice([None, now, now - timedelta(days=2)])
+            user.high_risk_aborted_count = rng.randint(0, 3)
+            user.last_transaction_risk_value = rng.choice([0, 50, 80, 81, 99])
+        db.session.commit()
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_batch_matches_single_requests(app, client, make_users, seed):
+    rng = random.Random(seed)
+    numbers = make_users(150)
+    randomize_risk_fields(app, numbers, rng)
+    transactions = []
+    for _ in range(600):
+        number = rng.choice(numbers + ["UNKNOWN"])
+        amount = rng.choice([0.0, 1.0, 5.0, 10.0, 50.0, 100.0, 500.0, 501.0])
+        # Both accepted item formats
+        transactions.append(
+            {"matriculationNumber": number, "amount": amount} if rng.random() < 0.5 else [number, str(amount)]
+        )
+
+    response = client.post("/api/verify_transactions", json={"transactions": transactions})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert len(results) == len(transactions)
+
+    verdicts = set()
+    for item, result in zip(transactions, results):
+        number, amount = (item["matriculationNumber"], item["amount"]) if isinstance(item, dict) else item
+        single = client.post("/api/verify_transaction", json={"matriculationNumber": number, "amount": amount})
+        body = single.get_json()
+        expected = (single.status_code == 200, body.get("message") or body.get("error"))
+        assert (result["authorized"], result["message"]) == expected, item
+        assert result["matriculationNumber"] == number
+        verdicts.add(expected)
+    # The random fields must reach most of the rules for the comparison to mean anything
+    assert len(verdicts) >= 6
+
+    summary = response.get_json()["summary"]
+    assert summary["authorized"] == sum(result["authorized"] for result in results)
+
+
+def test_batch_size_limit(app, client, make_users, monkeypatch):
+    number = make_users(1)[0]
+    monkeypatch.setitem(app.config, "VERIFY_TRANSACTIONS_MAX_ITEMS", 3)
+    monkeypatch.setitem(app.config, "BATCH_BALANCE_MAX_OPERATIONS", 1)
+
+    response = client.post("/api/verify_transactions", json={"transactions": [[number, 1]] * 3})
+    assert response.status_code == 200
+    response = client.post("/api/verify_transactions", json={"transactions": [[number, 1]] * 4})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("item", [[], ["X"], {"matriculationNumber": "X"}, ["X", "abc"], [None, 1]])
+def test_malformed_items(client, item):
+    response = client.post("/api/verify_transactions", json={"transactions": [item]})
+    assert response.status_code == 400